@@ -0,0 +1,86 @@
+"""
+Measure the per-object cost of collecting object descriptors.
+
+Collection runs over every object of the interpreter plus a synthetic heap of
+instances, slotted objects, named tuples and dicts.
+
+Usage: PYTHONPATH=. python benchmarks/bench_collector.py [--objects N] [--repeat N]
+"""
+import argparse
+import gc
+import time
+from typing import NamedTuple
+
+from pyloot.collector import get_object_descriptors
+
+
+class Point(NamedTuple):
+    x: int
+    y: int
+
+
+class Node:
+    def __init__(self, value, parent=None):
+        self.value = value
+        self.parent = parent
+        self.children = []
+
+    def add(self, value):
+        child = Node(value, self)
+        self.children.append(child)
+        return child
+
+    @property
+    def depth(self):
+        return 0 if self.parent is None else self.parent.depth + 1
+
+
+class Slotted:
+    __slots__ = ("a", "b")
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+
+def make_heap(count: int):
+    heap = []
+    root = Node(0)
+    for i in range(count // 4):
+        heap.append(root.add(i))
+        heap.append(Point(i, -i))
+        heap.append(Slotted([i], {"i": i}))
+        heap.append({"key": i, "values": [i, i + 1]})
+    return root, heap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    heap = make_heap(args.objects)
+    gc.collect()
+
+    best = None
+    count = 0
+    for _ in range(args.repeat):
+        st = time.perf_counter()
+        descriptors = get_object_descriptors()
+        dur = time.perf_counter() - st
+        count = len(descriptors)
+        del descriptors
+        best = dur if best is None else min(best, dur)
+
+    assert best is not None
+    print(
+        "objects={} best={:.3f}s per_object={:.2f}us".format(
+            count, best, best / count * 1e6
+        )
+    )
+    del heap
+
+
+if __name__ == "__main__":
+    main()
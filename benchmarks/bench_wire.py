@@ -0,0 +1,113 @@
+"""
+Compare the size and CPU time of uploads encoded as gzipped NDJSON against the
+binary format of ::mod::`pyloot.wire`, compressed the same way.
+
+Descriptors are built by the collector from instances of a few classes with
+references in between them, like a heap of small application objects.
+
+Usage: PYTHONPATH=. python benchmarks/bench_wire.py [--objects N]
+"""
+import argparse
+import json
+import random
+import time
+
+from pyloot import collector
+from pyloot import HTTPRemoteBackend
+from pyloot import wire
+from pyloot.server import _iter_chunks
+from pyloot.server import _iter_lines
+from pyloot.types import ObjectDescriptor
+
+
+class Order:
+    def __init__(self, i):
+        self.number = i
+        self.customer = "customer-{}".format(i % 500)
+        self.total = i * 1.5
+        self.lines = []
+
+
+class OrderLine:
+    def __init__(self, order, i):
+        self.order = order
+        self.sku = "SKU{:06d}".format(i)
+        self.quantity = i % 7
+
+
+def make_descriptors(objects: int):
+    heap = []
+    for i in range(objects // 4):
+        order = Order(i)
+        order.lines.extend(OrderLine(order, i * 3 + j) for j in range(3))
+        heap.append(order)
+        heap.extend(order.lines)
+    data = [collector.get_data(obj) for obj in heap]
+    ids = [descr.id for descr in data]
+    return [
+        descr._replace(
+            child_ids=sorted(random.sample(ids, 3)), parent_ids=[random.choice(ids)]
+        )
+        for descr in data
+    ]
+
+
+def encode_json(data):
+    for descr in data:
+        yield json.dumps(descr._asdict()).encode("utf-8") + b"\n"
+
+
+def decode_json(stream):
+    return [ObjectDescriptor(**json.loads(line)) for line in _iter_lines(stream)]
+
+
+def decode_wire(stream):
+    return list(wire.decode_stream(_iter_chunks(stream)))
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self._data = b"".join(chunks)
+        self._pos = 0
+
+    def read(self, size):
+        chunk = self._data[self._pos : self._pos + size]
+        self._pos += size
+        return chunk
+
+
+def measure(name, encode, decode, data):
+    st = time.perf_counter()
+    raw = sum(len(chunk) for chunk in encode(data))
+    raw_dur = time.perf_counter() - st
+
+    st = time.perf_counter()
+    chunks = list(HTTPRemoteBackend.compress_stream(encode(data)))
+    encode_dur = time.perf_counter() - st
+    size = sum(map(len, chunks))
+
+    st = time.perf_counter()
+    decoded = decode(_Stream(chunks))
+    decode_dur = time.perf_counter() - st
+    assert len(decoded) == len(data)
+    print(
+        "{:>6}: raw={:.2f}MiB gzip={:.2f}MiB encode={:.3f}s encode+gzip={:.3f}s "
+        "gunzip+decode={:.3f}s".format(
+            name, raw / 2**20, size / 2**20, raw_dur, encode_dur, decode_dur
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=200000)
+    args = parser.parse_args()
+
+    data = make_descriptors(args.objects)
+    print("{} descriptors".format(len(data)))
+    measure("ndjson", encode_json, decode_json, data)
+    measure("wire", wire.encode_stream, decode_wire, data)
+
+
+if __name__ == "__main__":
+    main()
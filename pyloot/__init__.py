@@ -1,19 +1,40 @@
 import logging
 import threading
 import time
+from typing import Dict
+from typing import List
 from typing import Optional
 from typing import Set
+from typing import Tuple
 
+from pyloot.backends.aggregate import AggregateBackend
 from pyloot.backends.base import BaseBackend
+from pyloot.backends.file import FileBackend
 from pyloot.backends.http import HTTPRemoteBackend
 from pyloot.backends.memory import InMemoryBackend
+from pyloot.backends.sqlite import SQLiteBackend
+from pyloot.collector import DEFAULT_BUDGET
+from pyloot.collector import DescriptorBudget
+from pyloot.collector import DescriptorCache
 from pyloot.collector import get_object_descriptors
+from pyloot.collector import get_object_graph
+from pyloot.collector import get_type_counts
+from pyloot.collector import ObjectFilter
+from pyloot.collector import SamplingPolicy
+from pyloot.collector import TimeSlicer
+from pyloot.fork import collect_in_child
+from pyloot.fork import is_fork_supported
+from pyloot.graph import ReferenceGraph
 from pyloot.server import PyLootServer
+from pyloot.types import CollectionStats
+from pyloot.types import ObjectDescriptor
 from pyloot.utils import start_thread
 
 
 logger = logging.getLogger(__name__)
 
+TypeCounts = Dict[Tuple[str, str], int]
+
 
 class PyLoot:
     def __init__(
@@ -23,7 +44,42 @@ class PyLoot:
         backend: Optional[BaseBackend] = None,
         interval: int = 30,
         server: Optional[PyLootServer] = None,
+        incremental: bool = False,
+        lazy: bool = False,
+        history_interval: Optional[int] = None,
+        sampling: Optional[SamplingPolicy] = None,
+        slice_budget: Optional[float] = None,
+        fork: bool = False,
+        fork_timeout: float = 300,
+        fork_memory_limit: Optional[int] = None,
+        object_filter: Optional[ObjectFilter] = None,
+        budget: DescriptorBudget = DEFAULT_BUDGET,
     ):
+        """
+        :param host: host of a remote pyloot server
+        :param port: port of a remote pyloot server
+        :param backend: backend used to store collected data
+        :param interval: seconds between collections in the background thread
+        :param server: ::class::`PyLootServer` whose backend should be used
+        :param incremental: reuse descriptors of objects seen on the previous
+            collection, only refreshing their referents
+        :param lazy: only record type, id and referents when collecting. attrs and
+            repr are computed when an object is fetched by id
+        :param history_interval: when set, sample object counts every
+            `history_interval` seconds in between full collections
+        :param sampling: only describe a bounded sample of objects per group.
+            History counts stay exact
+        :param slice_budget: when set, collect in slices holding the GIL for at most
+            `slice_budget` seconds, letting other threads run in between slices
+        :param fork: describe objects in a child process created with `fork()`.
+            The child stores the result directly when using a remote backend.
+            Only supported on Linux
+        :param fork_timeout: seconds after which the child process is killed
+        :param fork_memory_limit: bytes the child process can allocate
+        :param object_filter: decides which objects are collected based on the
+            module they are defined in
+        :param budget: bounds the size of attrs and repr of each descriptor
+        """
         if server:
             if backend:
                 logger.warning("ignoring backend since server is present")
@@ -37,10 +93,38 @@ class PyLoot:
         else:
             self._backend = InMemoryBackend()
 
+        if lazy and isinstance(self._backend, HTTPRemoteBackend):
+            logger.warning(
+                "lazy collection requires an in-process backend. "
+                "attrs and repr will not be available"
+            )
+
+        if fork and not is_fork_supported():
+            logger.warning("fork is not supported on this platform. Ignoring fork")
+            fork = False
+        if fork and (incremental or lazy):
+            logger.warning(
+                "incremental and lazy collection have no effect when forking "
+                "since their state is lost with the child process"
+            )
+
         self._running = False
         self._thread_ended = threading.Event()
         self._server: Optional[PyLootServer] = server
         self._interval = interval
+        self._history_interval = history_interval
+        self._lazy = lazy
+        self._sampling = sampling
+        self._slice_budget = slice_budget
+        self._stats: Optional[CollectionStats] = None
+        self._object_filter = object_filter
+        self._budget = budget
+        self._fork = fork
+        self._fork_timeout = fork_timeout
+        self._fork_memory_limit = fork_memory_limit
+        self._cache: Optional[DescriptorCache] = (
+            DescriptorCache() if incremental else None
+        )
 
     def start(self):
         """
@@ -73,12 +157,21 @@ class PyLoot:
             self._thread_ended.wait()
 
     def _run(self):
+        tick = self._history_interval or self._interval
+        last_collection: Optional[float] = None
         while self._running:
             try:
-                self.collect_objects()
+                if (
+                    last_collection is None
+                    or time.monotonic() - last_collection >= self._interval
+                ):
+                    last_collection = time.monotonic()
+                    self.collect_objects()
+                else:
+                    self.collect_counts()
             except Exception:  # pylint: disable=broad-except
                 logger.exception("Error collecting objects")
-            time.sleep(self._interval)
+            time.sleep(tick)
 
         self._thread_ended.set()
 
@@ -88,16 +181,113 @@ class PyLoot:
         """
         logger.debug("Collecting objects")
         st = time.monotonic()
+        if self._fork:
+            data, type_counts, graph = self._collect_in_child()
+        else:
+            data, type_counts, graph = self._collect()
+        dur = time.monotonic() - st
+        stats = self._stats
+        assert stats is not None
+        logger.debug(
+            "Collecting objects took %s secs. max pause=%s total pause=%s slices=%s",
+            dur,
+            stats.max_pause,
+            stats.total_pause,
+            stats.slices,
+        )
+        if data is None:
+            return
+        if graph is not None:
+            self._backend.store(data, type_counts=type_counts, graph=graph)
+        else:
+            self._backend.store(data, type_counts=type_counts)
+
+    def _collect(
+        self,
+    ) -> Tuple[List[ObjectDescriptor], Optional[TypeCounts], Optional[ReferenceGraph]]:
         ignored = self._backend.get_ids()
         ignore_set: Set[int] = set(ignored)
         del ignored
         ignore_set.add(id(self))
         ignore_set.add(id(ignore_set))
+        if self._cache is not None:
+            ignore_set.update(self._cache.get_ids())
         logger.debug("There are %s ids to ignore", len(ignore_set))
-        data = get_object_descriptors(ignore_set)
+        type_counts: Optional[TypeCounts] = None
+        if self._sampling is not None:
+            type_counts = {}
+        slicer = TimeSlicer(self._slice_budget)
+        kwargs = dict(
+            cache=self._cache,
+            lazy=self._lazy,
+            sampling=self._sampling,
+            type_counts=type_counts,
+            slicer=slicer,
+            object_filter=self._object_filter,
+            budget=self._budget,
+        )
+        graph = None
+        # the graph is handed over as is instead of expanded into parent_ids
+        if self._backend.accepts_graph:
+            data, graph = get_object_graph(ignore_set, **kwargs)
+        else:
+            data = get_object_descriptors(ignore_set, **kwargs)
+        self._stats = slicer.get_stats()
+        return data, type_counts, graph
+
+    def _collect_in_child(
+        self,
+    ) -> Tuple[
+        Optional[List[ObjectDescriptor]],
+        Optional[TypeCounts],
+        Optional[ReferenceGraph],
+    ]:
+        backend = self._backend
+        # the child uploads on behalf of this process
+        source = (
+            backend.get_source() if isinstance(backend, HTTPRemoteBackend) else None
+        )
+
+        def collect():
+            data, type_counts, graph = self._collect()
+            if isinstance(backend, HTTPRemoteBackend):
+                backend.source = source
+                # the child exits once collect returns, no background upload
+                backend.send(data, type_counts=type_counts)
+                # so that the next child uploads a delta to this snapshot
+                return None, None, None, backend.get_delta_base()
+            return data, type_counts, graph, None
+
+        result, self._stats = collect_in_child(
+            collect, timeout=self._fork_timeout, memory_limit=self._fork_memory_limit
+        )
+        data, type_counts, graph, delta_base = result
+        if isinstance(backend, HTTPRemoteBackend):
+            backend.set_delta_base(delta_base)
+        return data, type_counts, graph
+
+    def collect_counts(self):
+        """
+        Collect the number of objects per type still in `gc.get_objects` after a call
+        to `gc.collect` and store them as a history sample.
+        """
+        logger.debug("Collecting object counts")
+        st = time.monotonic()
+        ignore_set: Set[int] = set(self._backend.get_ids())
+        ignore_set.add(id(self))
+        ignore_set.add(id(ignore_set))
+        type_counts = get_type_counts(ignore_set, object_filter=self._object_filter)
         dur = time.monotonic() - st
-        logger.debug("Collecting objects took %s secs.", dur)
-        self._backend.store(data)
+        logger.debug("Collecting object counts took %s secs.", dur)
+        self._backend.store_counts(type_counts)
+
+    def get_stats(self) -> Optional[CollectionStats]:
+        """
+        Return statistics about the last call to collect_objects().
+
+        :return: ::class::`CollectionStats` or `None` if no collection happened yet
+        """
+        return self._stats
 
     def get_wsgi(self) -> PyLootServer:
         """
@@ -0,0 +1,296 @@
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyloot.backends.base import BaseBackend
+from pyloot.backends.base import DataVersion
+from pyloot.backends.memory import InMemoryBackend
+from pyloot.history import DEFAULT_TIERS
+from pyloot.history import TieredHistory
+from pyloot.types import GroupDiff
+from pyloot.types import LootDict
+from pyloot.types import ObjectDescriptor
+from pyloot.types import ObjectTypeHistory
+from pyloot.types import RetainedSize
+from pyloot.types import SnapshotInfo
+from pyloot.types import SourceInfo
+
+
+logger = logging.getLogger(__name__)
+
+# source of uploads which are not tagged with a host and pid
+DEFAULT_SOURCE = "default"
+AGGREGATES = ("sum", "max")
+
+
+class _Source:
+    __slots__ = ("backend", "last_seen", "counts")
+
+    def __init__(self, backend: BaseBackend):
+        self.backend = backend
+        self.last_seen = 0.0
+        self.counts: Dict[Tuple[str, str], int] = LootDict()
+
+
+class AggregateBackend(BaseBackend):
+    """
+    Keeps one backend per source process so that uploads of one worker do not
+    replace the objects of another.
+
+    History is aggregated across sources from the last counts of each source: the
+    sum and the max per type. Sources which did not upload for `ttl` seconds are
+    dropped. Object queries are answered by the source which uploaded last, use
+    `get_source` to query a specific source.
+    """
+
+    def __init__(
+        self,
+        factory: Optional[Callable[[str], BaseBackend]] = None,
+        ttl: float = 300,
+        max_history: int = 300,
+        history_tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS,
+    ):
+        """
+        :param factory: creates the backend of a source given its name. Defaults
+            to an ::class::`InMemoryBackend`
+        :param ttl: seconds after which a source which did not upload is dropped
+        :param max_history: number of raw aggregated history samples kept per type
+        :param history_tiers: `(resolution in seconds, number of samples)` of each
+            aggregated history rollup
+        """
+        self._factory = factory or (
+            lambda source: InMemoryBackend(max_history, history_tiers)
+        )
+        self._ttl = ttl
+        self._sources: Dict[str, _Source] = LootDict()
+        self._histories: Dict[str, TieredHistory] = LootDict(
+            (aggregate, TieredHistory(max_history, history_tiers))
+            for aggregate in AGGREGATES
+        )
+        self._lock = threading.Lock()
+        self._version = DataVersion()
+
+    def _expire(self, now: float, sample: bool = True):
+        """
+        Drop the sources which did not upload for `ttl` seconds
+
+        :param now: current unix time
+        :param sample: append an aggregated sample without the dropped sources
+        """
+        expired = [
+            source
+            for source, entry in self._sources.items()
+            if now - entry.last_seen > self._ttl
+        ]
+        for source in expired:
+            logger.info("Dropping source %s", source)
+            del self._sources[source]
+        if expired:
+            if sample:
+                self._append_aggregates(now)
+            self._version.bump()
+
+    def _append_aggregates(self, now: float):
+        totals: Dict[Tuple[str, str], int] = Counter()
+        maxs: Dict[Tuple[str, str], int] = {}
+        for other in self._sources.values():
+            for key, count in other.counts.items():
+                totals[key] += count
+                if count > maxs.get(key, -1):
+                    maxs[key] = count
+        self._histories["sum"].append(totals, now)
+        self._histories["max"].append(maxs, now)
+
+    def _get_or_create(self, source: str) -> _Source:
+        entry = self._sources.get(source)
+        if entry is None:
+            logger.info("New source %s", source)
+            entry = self._sources[source] = _Source(self._factory(source))
+        return entry
+
+    def _update(self, entry: _Source, type_counts: Dict[Tuple[str, str], int]):
+        now = time.time()
+        entry.last_seen = now
+        entry.counts = LootDict(type_counts)
+        self._expire(now, sample=False)
+        self._append_aggregates(now)
+        self._version.bump()
+
+    def store(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+        source: str = DEFAULT_SOURCE,
+    ):
+        """
+        :param source: name of the process which collected the objects
+        """
+        with self._lock:
+            entry = self._get_or_create(source)
+        entry.backend.store(object_data, type_counts=type_counts)
+        if type_counts is None:
+            type_counts = Counter(
+                (descr.type_module, descr.type_name) for descr in object_data
+            )
+        with self._lock:
+            self._update(entry, type_counts)
+
+    def store_delta(
+        self,
+        object_data: List[ObjectDescriptor],
+        removed_ids: List[int],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+        source: str = DEFAULT_SOURCE,
+    ) -> Dict[Tuple[str, str], int]:
+        """
+        :param source: name of the process which collected the objects
+        """
+        with self._lock:
+            entry = self._get_or_create(source)
+        type_counts = entry.backend.store_delta(
+            object_data, removed_ids, type_counts=type_counts
+        )
+        with self._lock:
+            self._update(entry, type_counts)
+        return type_counts
+
+    def store_counts(
+        self, type_counts: Dict[Tuple[str, str], int], source: str = DEFAULT_SOURCE
+    ):
+        """
+        :param source: name of the process which collected the counts
+        """
+        with self._lock:
+            entry = self._get_or_create(source)
+        entry.backend.store_counts(type_counts)
+        with self._lock:
+            self._update(entry, type_counts)
+
+    def get_source(self, source: str) -> Optional[BaseBackend]:
+        """
+        :param source: name of a source
+        :return: the backend of the source or `None` if it is unknown or expired
+        """
+        with self._lock:
+            self._expire(time.time())
+            entry = self._sources.get(source)
+        return None if entry is None else entry.backend
+
+    def get_version(self) -> Optional[str]:
+        with self._lock:
+            # sources dropped since the last upload change the data too
+            self._expire(time.time())
+            return str(self._version)
+
+    def fetch_sources(self) -> List[SourceInfo]:
+        """
+        Get the sources which uploaded in the last `ttl` seconds
+
+        :return: list of ::class::`SourceInfo` by decreasing last upload time
+        """
+        with self._lock:
+            self._expire(time.time())
+            items = [
+                SourceInfo(
+                    source=source,
+                    last_seen=entry.last_seen,
+                    count=sum(entry.counts.values()),
+                )
+                for source, entry in self._sources.items()
+            ]
+        items.sort(key=lambda item: item.last_seen, reverse=True)
+        return items
+
+    def _latest(self) -> Optional[BaseBackend]:
+        sources = self.fetch_sources()
+        if not sources:
+            return None
+        return self.get_source(sources[0].source)
+
+    def fetch(self, limit: Optional[int] = None) -> List[ObjectDescriptor]:
+        backend = self._latest()
+        return [] if backend is None else backend.fetch(limit=limit)
+
+    def fetch_by_id(self, _id: int) -> Optional[ObjectDescriptor]:
+        backend = self._latest()
+        return None if backend is None else backend.fetch_by_id(_id)
+
+    def fetch_children_of(self, _id: int) -> List[ObjectDescriptor]:
+        backend = self._latest()
+        return [] if backend is None else backend.fetch_children_of(_id)
+
+    def fetch_parents_of(self, _id: int) -> List[ObjectDescriptor]:
+        backend = self._latest()
+        return [] if backend is None else backend.fetch_parents_of(_id)
+
+    def fetch_by_group(
+        self, group: str, limit: Optional[int] = None, offset: int = 0
+    ) -> List[ObjectDescriptor]:
+        backend = self._latest()
+        if backend is None:
+            return []
+        return backend.fetch_by_group(group, limit=limit, offset=offset)
+
+    def fetch_retained(self, _id: int) -> Optional[RetainedSize]:
+        backend = self._latest()
+        return None if backend is None else backend.fetch_retained(_id)
+
+    def fetch_top_retainers(self, top: int = 100) -> List[RetainedSize]:
+        backend = self._latest()
+        return [] if backend is None else backend.fetch_top_retainers(top=top)
+
+    def fetch_paths_to_root(
+        self, _id: int, count: int = 1, max_depth: int = 32
+    ) -> List[List[ObjectDescriptor]]:
+        backend = self._latest()
+        if backend is None:
+            return []
+        return backend.fetch_paths_to_root(_id, count=count, max_depth=max_depth)
+
+    def fetch_snapshots(self) -> List[SnapshotInfo]:
+        backend = self._latest()
+        return [] if backend is None else backend.fetch_snapshots()
+
+    def fetch_diff(
+        self, start: int = -2, end: int = -1, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        backend = self._latest()
+        if backend is None:
+            return None
+        return backend.fetch_diff(start=start, end=end, max_ids=max_ids)
+
+    def fetch_history(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+        aggregate: str = "sum",
+    ) -> List[ObjectTypeHistory]:
+        """
+        :param aggregate: `sum` or `max` of the counts of all sources
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError("Unknown aggregate {}".format(aggregate))
+        history = self._histories[aggregate]
+        with self._lock:
+            self._expire(time.time())
+            return history.query(top=top, start=start, end=end, resolution=resolution)
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self._lock)
+        yield from self._version.get_ids()
+        for history in self._histories.values():
+            yield from history.get_ids()
+        for entry in self._sources.values():
+            yield from entry.backend.get_ids()
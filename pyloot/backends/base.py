@@ -1,20 +1,114 @@
+import logging
+import uuid
 from abc import ABC
 from abc import abstractmethod
+from collections import Counter
+from itertools import count
+from typing import Dict
 from typing import Iterable
 from typing import List
 from typing import Optional
+from typing import Tuple
 
+from pyloot.types import GroupDiff
 from pyloot.types import ObjectDescriptor
 from pyloot.types import ObjectTypeHistory
+from pyloot.types import RetainedSize
+from pyloot.types import SnapshotInfo
+
+logger = logging.getLogger(__name__)
+
+
+class DataVersion:
+    """
+    Token of the data held by a backend, changed on every write. Tokens of two
+    instances never match, even across restarts
+    """
+
+    __slots__ = ("_prefix", "_counter", "_value")
+
+    def __init__(self):
+        self._prefix = uuid.uuid4().hex[:12]
+        self._counter = count()
+        self._value = next(self._counter)
+
+    def bump(self):
+        self._value = next(self._counter)
+
+    def __str__(self) -> str:
+        return "{}-{}".format(self._prefix, self._value)
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self)
+        yield id(self._counter)
 
 
 class BaseBackend(ABC):
+    # when set, the server rejects uploads
+    read_only: bool = False
+    # when set, `store` takes the ::class::`ReferenceGraph` built by the collector
+    # as `graph` and the `parent_ids` of descriptors are left empty
+    accepts_graph: bool = False
+
+    def get_version(self) -> Optional[str]:
+        """
+        Get a token which changes whenever stored data changes. The server sends it
+        as the ETag of its responses
+
+        :return: the token or `None` when changes are not tracked
+        """
+        return None
+
     @abstractmethod
-    def store(self, object_data: List[ObjectDescriptor]):
+    def store(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    ):
         """
         Store object data in the backend
         :param object_data: list of ::class::`ObjectDescriptor`
-        """
+        :param type_counts: exact number of objects per `(type_module, type_name)`
+            when `object_data` is only a sample. Counted from `object_data` otherwise
+        """
+
+    def store_delta(
+        self,
+        object_data: List[ObjectDescriptor],
+        removed_ids: List[int],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    ) -> Dict[Tuple[str, str], int]:
+        """
+        Store the next snapshot as the objects added or changed since the last
+        stored one and the ids of the objects removed. By default the delta is
+        merged with `fetch` and stored whole
+        :param object_data: list of ::class::`ObjectDescriptor` added or changed
+        :param removed_ids: ids of the objects removed
+        :param type_counts: exact number of objects per `(type_module, type_name)`
+            in the whole snapshot. Counted from the merged objects otherwise
+        :return: number of objects per `(type_module, type_name)` of the snapshot
+        """
+        dropped = set(removed_ids)
+        dropped.update(descr.id for descr in object_data)
+        merged = [descr for descr in self.fetch(None) if descr.id not in dropped]
+        del dropped
+        merged.extend(object_data)
+        self.store(merged, type_counts=type_counts)
+        if type_counts is None:
+            type_counts = Counter(
+                (descr.type_module, descr.type_name) for descr in merged
+            )
+        return type_counts
+
+    def store_counts(self, type_counts: Dict[Tuple[str, str], int]):
+        """
+        Store a history sample without any object data. Backends which do not
+        support it only record history when objects are stored
+        :param type_counts: number of objects per `(type_module, type_name)`
+        """
+        logger.debug(
+            "%s does not store counts. Dropping sample", self.__class__.__name__
+        )
 
     @abstractmethod
     def fetch(self, limit: Optional[int]) -> List[ObjectDescriptor]:
@@ -54,25 +148,97 @@ class BaseBackend(ABC):
 
     @abstractmethod
     def fetch_by_group(
-        self, group: str, limit: Optional[int]
+        self, group: str, limit: Optional[int], offset: int = 0
     ) -> List[ObjectDescriptor]:
         """
-        Get object descriptors by its type name
+        Get object descriptors by its type name, oldest first
 
         :param group: descriptor group
         :param limit: limits number of results returned
+        :param offset: number of results to skip
         :return: list of ::class::`ObjectDescriptor`
         """
 
+    def fetch_retained(self, _id: int) -> Optional[RetainedSize]:
+        """
+        Get the memory kept alive by an object, based on the dominator tree of the
+        last stored snapshot
+
+        :param _id: id of object as returned by `id()`
+        :return: ::class::`RetainedSize` if found otherwise `None`. Always `None`
+            unless implemented by the backend
+        """
+        return None
+
+    def fetch_top_retainers(self, top: int = 100) -> List[RetainedSize]:
+        """
+        Get the objects keeping the most memory alive
+
+        :param top: number of objects to return
+        :return: list of ::class::`RetainedSize` by decreasing retained size.
+            Empty unless implemented by the backend
+        """
+        return []
+
+    def fetch_paths_to_root(
+        self, _id: int, count: int = 1, max_depth: int = 32
+    ) -> List[List[ObjectDescriptor]]:
+        """
+        Get the shortest chains of references keeping an object alive, starting
+        from a module, a frame or an object without parents
+
+        :param _id: id of object as returned by `id()`
+        :param count: maximum number of chains to return
+        :param max_depth: maximum number of references in a chain
+        :return: list of chains of ::class::`ObjectDescriptor` ending with the object.
+            Empty unless implemented by the backend
+        """
+        return []
+
     @abstractmethod
-    def fetch_history(self, top: int = 100) -> List[ObjectTypeHistory]:
+    def fetch_history(
+        self,
+        top: int = 100,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
         """
         Get object history grouped by object_type
 
         :param top: limit history to the `top` number of entries based on cur count
+        :param start: only include samples taken at or after this unix time
+        :param end: only include samples taken at or before this unix time
+        :param resolution: seconds in between samples. 0 for raw samples. Defaults
+            to the finest resolution covering `start`
         :return: list of ::class`ObjectTypeHistory`
         """
 
+    def fetch_snapshots(self) -> List[SnapshotInfo]:
+        """
+        Get the snapshots which can be compared, oldest first
+
+        :return: list of ::class::`SnapshotInfo`. Empty unless implemented by the
+            backend
+        """
+        return []
+
+    def fetch_diff(
+        self, start: int = -2, end: int = -1, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        """
+        Compare two snapshots: objects which appeared, objects which were freed and
+        the change of count and size of each group
+
+        :param start: number of the first snapshot. Negative numbers count from
+            the last snapshot
+        :param end: number of the last snapshot
+        :param max_ids: maximum number of new and freed ids returned per group
+        :return: list of ::class::`GroupDiff` by decreasing count delta, `None` if
+            a snapshot is not kept. Always `None` unless implemented by the backend
+        """
+        return None
+
     @abstractmethod
     def get_ids(self) -> Iterable[int]:
         """
@@ -0,0 +1,305 @@
+import logging
+import os
+import time
+from array import array
+from itertools import islice
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyloot.backends.base import BaseBackend
+from pyloot.backends.base import DataVersion
+from pyloot.diff import SnapshotIndex
+from pyloot.diff import SnapshotLog
+from pyloot.graph import DominatorTree
+from pyloot.graph import find_roots
+from pyloot.graph import paths_to_root
+from pyloot.graph import ReferenceGraph
+from pyloot.history import DEFAULT_TIERS
+from pyloot.history import TieredHistory
+from pyloot.snapshot import Snapshot
+from pyloot.snapshot import write_snapshot
+from pyloot.types import GroupDiff
+from pyloot.types import LootDict
+from pyloot.types import ObjectDescriptor
+from pyloot.types import ObjectTypeHistory
+from pyloot.types import RetainedSize
+from pyloot.types import SnapshotInfo
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileBackend(BaseBackend):
+    """
+    Writes each snapshot to a binary snapshot file and serves queries from the
+    memory mapped file. History is kept in memory.
+    """
+
+    accepts_graph = True
+
+    def __init__(
+        self,
+        path: str,
+        read_only: bool = False,
+        max_history: int = 300,
+        history_tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS,
+        max_snapshots: int = 5,
+    ):
+        """
+        :param path: path of the snapshot file. Loaded when it exists
+        :param read_only: serve an existing snapshot file without storing new ones
+        :param max_history: number of raw history samples kept per type
+        :param history_tiers: `(resolution in seconds, number of samples)` of each
+            history rollup
+        :param max_snapshots: number of snapshots which can be compared. Only the
+            last snapshot is kept in the file, earlier ones are indexed in memory
+        """
+        self._path = path
+        self.read_only = read_only
+        self._snapshot: Optional[Snapshot] = None
+        self._dominators: Optional[DominatorTree] = None
+        self._roots: Optional[List[int]] = None
+        # group -> node indices ordered by seen
+        self._groups: Optional[Dict[str, "array[int]"]] = None
+        self._history = TieredHistory(max_history, history_tiers)
+        self._snapshots = SnapshotLog(max_snapshots)
+        self._index: Optional[SnapshotIndex] = None
+        self._version = DataVersion()
+        if os.path.exists(path):
+            self._open()
+        elif read_only:
+            raise FileNotFoundError(path)
+
+    def _open(self):
+        self._dominators = None
+        self._roots = None
+        self._groups = None
+        if self._snapshot is not None:
+            self._detach_index()
+            self._snapshot.close()
+        self._snapshot = Snapshot(self._path)
+        # ids, types and sizes are read in place until the file is replaced
+        index = self._snapshot.get_index()
+        self._index = self._snapshots.add(
+            index.timestamp,
+            index.ids,
+            index.types,
+            index.sizes,
+            index.type_keys,
+            LootDict(index.type_counts),
+        )
+        self._history.append(index.type_counts, index.timestamp)
+
+    def _detach_index(self):
+        # copy the index of the mapped file when it is still kept for diffs
+        index = self._index
+        self._index = None
+        if index is not None and self._snapshots.get(index.number) is index:
+            index.ids = array("q", index.ids)
+            index.types = array("q", index.types)
+            index.sizes = array("q", index.sizes)
+
+    def close(self):
+        if self._snapshot is not None:
+            self._detach_index()
+            self._snapshot.close()
+            self._snapshot = None
+
+    def store(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+        graph: Optional[ReferenceGraph] = None,
+    ):
+        """
+        :param graph: references of `object_data`. Built from their `child_ids`
+            when not given
+        """
+        if self.read_only:
+            raise PermissionError("{} is read-only".format(self._path))
+
+        cur_time = time.time()
+        snapshot = self._snapshot
+
+        def with_seen(descr: ObjectDescriptor) -> ObjectDescriptor:
+            # an id reused by an object of another type is a new object
+            idx = None if snapshot is None else snapshot.graph.index_of(descr.id)
+            if idx is not None and snapshot.type_key_of(idx) == (  # type: ignore
+                descr.type_module,
+                descr.type_name,
+            ):
+                return descr._replace(seen=snapshot.seen_of(idx))  # type: ignore
+            return descr._replace(seen=cur_time)
+
+        write_snapshot(
+            self._path,
+            map(with_seen, object_data),
+            type_counts,
+            timestamp=cur_time,
+            graph=graph,
+        )
+        self._open()
+        self._version.bump()
+
+    def store_counts(self, type_counts: Dict[Tuple[str, str], int]):
+        if self.read_only:
+            raise PermissionError("{} is read-only".format(self._path))
+        self._history.append(type_counts)
+        self._version.bump()
+
+    def get_version(self) -> Optional[str]:
+        return str(self._version)
+
+    def _fetch_nodes(self, indices: Iterable[int]) -> List[ObjectDescriptor]:
+        if self._snapshot is None:
+            return []
+        return [self._snapshot.descriptor(idx) for idx in indices]
+
+    def _index_of(self, _id: int) -> Optional[int]:
+        if self._snapshot is None:
+            return None
+        return self._snapshot.graph.index_of(_id)
+
+    def fetch(self, limit: Optional[int] = None) -> List[ObjectDescriptor]:
+        if self._snapshot is None:
+            return []
+        stop = None if limit is None or limit <= 0 else limit
+        return self._fetch_nodes(islice(range(len(self._snapshot)), stop))
+
+    def fetch_by_id(self, _id: int) -> Optional[ObjectDescriptor]:
+        idx = self._index_of(_id)
+        if idx is None:
+            return None
+        return self._fetch_nodes([idx])[0]
+
+    def fetch_children_of(self, _id: int) -> List[ObjectDescriptor]:
+        idx = self._index_of(_id)
+        if idx is None:
+            logger.warning("Unable to find item with id %s", _id)
+            return []
+        assert self._snapshot is not None
+        return self._fetch_nodes(self._snapshot.graph.child_indices(idx))
+
+    def fetch_parents_of(self, _id: int) -> List[ObjectDescriptor]:
+        idx = self._index_of(_id)
+        if idx is None:
+            logger.warning("Unable to find item with id %s", _id)
+            return []
+        assert self._snapshot is not None
+        return self._fetch_nodes(self._snapshot.graph.parent_indices(idx))
+
+    def _get_groups(self) -> Dict[str, "array[int]"]:
+        # computed on first use and kept until the next snapshot is stored
+        if self._groups is None:
+            snapshot = self._snapshot
+            assert snapshot is not None
+            groups: Dict[str, "array[int]"] = LootDict()
+            for idx in sorted(range(len(snapshot)), key=snapshot.seen_of):
+                group = snapshot.group_of(idx)
+                if group not in groups:
+                    groups[group] = array("q")
+                groups[group].append(idx)
+            self._groups = groups
+        return self._groups
+
+    def fetch_by_group(
+        self, group: str, limit: Optional[int] = None, offset: int = 0
+    ) -> List[ObjectDescriptor]:
+        if self._snapshot is None:
+            return []
+        indices = self._get_groups().get(group)
+        if not indices:
+            return []
+        stop = None if limit is None or limit <= 0 else offset + limit
+        return self._fetch_nodes(islice(indices, offset, stop))
+
+    def _get_dominators(self) -> DominatorTree:
+        # computed on first use and kept until the next snapshot is stored
+        snapshot = self._snapshot
+        assert snapshot is not None
+        if self._dominators is None:
+            self._dominators = DominatorTree(snapshot.graph, snapshot.get_sizes())
+        return self._dominators
+
+    def _get_retained(self, dominators: DominatorTree, idx: int) -> RetainedSize:
+        snapshot = self._snapshot
+        assert snapshot is not None
+        ids = snapshot.graph.ids
+        type_module, type_name = snapshot.type_key_of(idx)
+        dominator = dominators.dominator_of(idx)
+        return RetainedSize(
+            id=ids[idx],
+            type_name=type_name,
+            type_module=type_module,
+            size=snapshot.size_of(idx),
+            retained_size=dominators.retained_size(idx),
+            dominator_id=None if dominator is None else ids[dominator],
+        )
+
+    def fetch_retained(self, _id: int) -> Optional[RetainedSize]:
+        idx = self._index_of(_id)
+        if idx is None:
+            return None
+        return self._get_retained(self._get_dominators(), idx)
+
+    def fetch_top_retainers(self, top: int = 100) -> List[RetainedSize]:
+        if self._snapshot is None:
+            return []
+        dominators = self._get_dominators()
+        return [self._get_retained(dominators, idx) for idx in dominators.top(top)]
+
+    def fetch_paths_to_root(
+        self, _id: int, count: int = 1, max_depth: int = 32
+    ) -> List[List[ObjectDescriptor]]:
+        idx = self._index_of(_id)
+        if idx is None:
+            logger.warning("Unable to find item with id %s", _id)
+            return []
+
+        snapshot = self._snapshot
+        assert snapshot is not None
+        if self._roots is None:
+            self._roots = find_roots(snapshot.graph, snapshot.group_of)
+        paths = paths_to_root(
+            snapshot.graph,
+            idx,
+            self._roots,
+            snapshot.group_of,
+            count=count,
+            max_depth=max_depth,
+        )
+        return [self._fetch_nodes(path) for path in paths]
+
+    def fetch_history(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
+        return self._history.query(top=top, start=start, end=end, resolution=resolution)
+
+    def fetch_snapshots(self) -> List[SnapshotInfo]:
+        return self._snapshots.list()
+
+    def fetch_diff(
+        self, start: int = -2, end: int = -1, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        return self._snapshots.diff(start, end, max_ids=max_ids)
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self)
+        yield id(self.__dict__)
+        if self._snapshot is not None:
+            yield from self._snapshot.get_ids()
+        if self._dominators is not None:
+            yield from self._dominators.get_ids()
+        if self._groups is not None:
+            yield from map(id, self._groups.values())
+        yield from self._history.get_ids()
+        yield from self._snapshots.get_ids()
+        yield from self._version.get_ids()
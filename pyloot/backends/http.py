@@ -3,22 +3,253 @@ import http.client
 import io
 import json
 import logging
+import os
+import socket
+import threading
 import urllib.error
+import urllib.parse
 import urllib.request
+import zlib
+from collections import Counter
+from collections import OrderedDict
+from itertools import count
+from itertools import islice
+from typing import Any
+from typing import Callable
 from typing import cast
 from typing import Dict
 from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import TypeVar
 from typing import Union
 
+from pyloot import wire
 from pyloot.backends.base import BaseBackend
+from pyloot.sender import BackgroundSender
+from pyloot.sender import FatalSendError
+from pyloot.types import GroupDiff
+from pyloot.types import LootDict
 from pyloot.types import ObjectDescriptor
 from pyloot.types import ObjectTypeHistory
+from pyloot.types import RetainedSize
+from pyloot.types import SenderMetrics
+from pyloot.types import SnapshotInfo
+from pyloot.types import SourceInfo
 
 
 logger = logging.getLogger(__name__)
 
+# names the process an upload comes from so that the server stores it separately
+SOURCE_HEADER = "X-PyLoot-Source"
+# one JSON document per line. A line with `type_counts` holds the exact counts of a
+# sampled snapshot, a line with `removed_ids` the objects removed since the
+# snapshot a delta applies to, every other line is an object descriptor
+NDJSON = "application/x-ndjson"
+CHUNK_SIZE = 64 * 1024
+# `snapshot:index:count` of an upload split in batches. The server stores the
+# snapshot once every batch was received
+BATCH_HEADER = "X-PyLoot-Batch"
+# snapshot a delta upload applies to. 0 for a full upload which later deltas may
+# apply to. The server answers with the same header once it applied an upload and
+# with 409 Conflict when it does not hold the snapshot
+DELTA_HEADER = "X-PyLoot-Delta"
+# binary format preferred, JSON from servers which do not support it
+_ACCEPT_OBJECTS = "{}, application/json;q=0.5".format(wire.MEDIA_TYPE)
+# url and Accept header of a GET request
+_CacheKey = Tuple[str, Optional[str]]
+T = TypeVar("T")
+
+# statuses worth retrying, other client errors would fail the same way
+_RETRY_STATUSES = (408, 429)
+
+
+class _UnsupportedFormat(FatalSendError):
+    pass
+
+
+class _ResyncRequired(FatalSendError):
+    pass
+
+
+def _fingerprint(descr: ObjectDescriptor) -> int:
+    return hash(
+        (
+            descr.type_module,
+            descr.type_name,
+            descr.obj_name,
+            descr.repr,
+            tuple(descr.attrs.items()),
+            tuple(descr.child_ids),
+            tuple(descr.parent_ids),
+            descr.size,
+            descr.lazy,
+            descr.stale,
+        )
+    )
+
+
+def _encode_counts(type_counts: Dict[Tuple[str, str], int]) -> List[Dict]:
+    return [
+        dict(type_module=type_module, type_name=type_name, count=count)
+        for (type_module, type_name), count in type_counts.items()
+    ]
+
+
+class _Upload:
+    """
+    Send job of a snapshot. Batches already accepted by the server are not sent
+    again when the job is retried.
+
+    Unless delta uploads are disabled, only the objects added or changed since the
+    last snapshot the server applied are sent, with the ids of removed objects.
+    """
+
+    def __init__(
+        self,
+        backend: "HTTPRemoteBackend",
+        snapshot: int,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]],
+    ):
+        self.backend = backend
+        self.snapshot = snapshot
+        self.object_data = object_data
+        self.type_counts = type_counts
+        self.next_batch = 0
+        # what is sent, computed on the first call
+        self.items: Optional[List[ObjectDescriptor]] = None
+        self.removed_ids: List[int] = []
+        self.base: Optional[int] = None
+        self.fingerprints: Optional[Dict[int, int]] = None
+
+    def _prepare(self):
+        backend = self.backend
+        if not backend.delta:
+            self.items = self.object_data
+            return
+        fingerprints = self.fingerprints = LootDict()
+        for descr in self.object_data:
+            fingerprints[descr.id] = _fingerprint(descr)
+        if backend._acked is None:
+            self.base = 0
+            self.items = self.object_data
+            return
+        self.base, acked = backend._acked
+        self.items = [
+            descr
+            for descr in self.object_data
+            if acked.get(descr.id) != fingerprints[descr.id]
+        ]
+        self.removed_ids = [_id for _id in acked if _id not in fingerprints]
+        # so that the server does not count the objects it did not receive
+        if self.type_counts is None:
+            self.type_counts = Counter(
+                (descr.type_module, descr.type_name) for descr in self.object_data
+            )
+
+    def _resync(self):
+        logger.warning("Server is missing snapshot %s. Sending all objects", self.base)
+        self.backend._acked = None
+        self.snapshot = next(self.backend._snapshots)
+        self.next_batch = 0
+        self.removed_ids = []
+        self._prepare()
+
+    def _encode(self, start: int, stop: int) -> Iterator[bytes]:
+        first = start == 0
+        if self.backend.binary:
+            return wire.encode_stream(
+                islice(self.items, start, stop),
+                self.type_counts if first else None,
+                self.removed_ids if first else None,
+            )
+        return self._encode_json(start, stop)
+
+    def _encode_json(self, start: int, stop: int) -> Iterator[bytes]:
+        if start == 0 and self.type_counts is not None:
+            counts = _encode_counts(self.type_counts)
+            yield json.dumps(dict(type_counts=counts)).encode("utf-8") + b"\n"
+        if start == 0 and self.removed_ids:
+            yield json.dumps(dict(removed_ids=self.removed_ids)).encode("utf-8") + b"\n"
+        for item in islice(self.items, start, stop):
+            try:
+                line = json.dumps(item._asdict())
+            except (TypeError, ValueError):
+                logger.exception("Unable to dump %s", item)
+                continue
+            yield line.encode("utf-8") + b"\n"
+
+    def _applied(self, response: http.client.HTTPResponse):
+        backend = self.backend
+        if self.base is None:
+            return
+        if response.getheader(DELTA_HEADER) != str(self.snapshot):
+            logger.warning("Server does not support delta uploads")
+            backend.delta = False
+            backend._acked = None
+            return
+        backend._acked = (self.snapshot, cast(Dict[int, int], self.fingerprints))
+
+    def __call__(self) -> int:
+        if self.items is None:
+            self._prepare()
+        items = cast(List[ObjectDescriptor], self.items)
+        batch_size = self.backend.batch_size
+        sent = 0
+        while True:
+            batches = max(1, -(-len(items) // batch_size))
+            if self.next_batch >= batches:
+                break
+            start = self.next_batch * batch_size
+            headers = {
+                "Content-Type": wire.MEDIA_TYPE if self.backend.binary else NDJSON,
+                BATCH_HEADER: "{}:{}:{}".format(
+                    self.snapshot, self.next_batch, batches
+                ),
+            }
+            if self.base is not None:
+                headers[DELTA_HEADER] = str(self.base)
+            try:
+                size, response = self.backend._post(
+                    "/api/objects",
+                    HTTPRemoteBackend.compress_stream(
+                        self._encode(start, start + batch_size)
+                    ),
+                    headers,
+                )
+            except _UnsupportedFormat:
+                if not self.backend.binary:
+                    raise
+                logger.warning("Server does not support the binary format. Using JSON")
+                self.backend.binary = False
+                continue
+            except _ResyncRequired:
+                if not self.base:
+                    raise
+                self._resync()
+                items = cast(List[ObjectDescriptor], self.items)
+                continue
+            if self.backend.binary:
+                self.backend._binary_accepted = True
+            sent += size
+            self.next_batch += 1
+            if self.next_batch == batches:
+                self._applied(response)
+        return sent
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self.object_data)
+        if self.type_counts is not None:
+            yield id(self.type_counts)
+        if self.items is not None:
+            yield id(self.items)
+        yield id(self.removed_ids)
+        if self.fingerprints is not None:
+            yield id(self.fingerprints)
+
 
 class HTTPRemoteBackend(BaseBackend):
     def __init__(
@@ -26,18 +257,79 @@ class HTTPRemoteBackend(BaseBackend):
         host: Optional[str] = None,
         port: Optional[int] = None,
         prefix: Optional[str] = None,
+        source: Optional[str] = None,
+        timeout: float = 5,
+        background: bool = True,
+        max_queue: int = 2,
+        batch_size: int = 50000,
+        max_retries: int = 5,
+        binary: bool = True,
+        delta: bool = True,
+        cache_size: int = 256,
     ):
+        """
+        :param host: host of the pyloot server
+        :param port: port of the pyloot server
+        :param prefix: path the pyloot server is mounted at
+        :param source: name of this process on the server. Defaults to
+            `hostname:pid` at the time of the upload
+        :param timeout: seconds to wait for the server on each request
+        :param background: upload from a background thread instead of blocking
+            `store` and `store_counts`
+        :param max_queue: number of uploads waiting in the background before the
+            oldest one is dropped
+        :param batch_size: maximum number of objects sent per request
+        :param max_retries: number of times a failed upload is retried
+        :param binary: upload objects in the format of ::mod::`pyloot.wire`.
+            Falls back to JSON when the server does not support it, or fails with
+            400 or 500 before accepting any binary upload
+        :param delta: upload only the objects which changed since the last snapshot
+            the server applied. Disabled when the server does not support it
+        :param cache_size: number of responses kept to be revalidated with
+            `If-None-Match`. A response the server reports unchanged is not
+            downloaded nor decoded again. 0 disables the cache
+        """
         self._host = host or "localhost"
         self._port = port or 8000
         self._prefix = prefix or "/"
+        self.source = source
+        self._timeout = timeout
+        self.batch_size = batch_size
+        self.binary = binary
+        # whether the server accepted a binary upload. Until then a 400 or 500 is
+        # taken as a server which cannot decode the format
+        self._binary_accepted = False
+        self.delta = delta
+        # snapshot last applied by the server and fingerprints of its objects
+        self._acked: Optional[Tuple[int, Dict[int, int]]] = None
+        self._sender: Optional[BackgroundSender] = None
+        if background:
+            self._sender = BackgroundSender(
+                max_queue=max_queue, max_retries=max_retries
+            )
+        self._snapshots = count(1)
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._conn_lock = threading.Lock()
+        self._conn_pid: Optional[int] = None
+        self._cache_size = cache_size
+        # (url, accept) -> (ETag, decoded response), least recently used first
+        self._cache: "OrderedDict[_CacheKey, Tuple[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def get_source(self) -> str:
+        if self.source:
+            return self.source
+        return "{}:{}".format(socket.gethostname(), os.getpid())
+
+    def _make_path(self, endpoint: Optional[str] = None) -> str:
+        endpoint = endpoint or "/"
+        return "{prefix}/{endpoint}".format(
+            prefix=self._prefix.rstrip("/"), endpoint=endpoint.lstrip("/")
+        )
 
     def _make_url(self, endpoint: Optional[str] = None) -> str:
-        endpoint = endpoint or "/"
-        return "http://{host}:{port}{prefix}/{endpoint}".format(
-            host=self._host,
-            port=self._port,
-            prefix=self._prefix.rstrip("/"),
-            endpoint=endpoint.lstrip("/"),
+        return "http://{host}:{port}{path}".format(
+            host=self._host, port=self._port, path=self._make_path(endpoint)
         )
 
     @staticmethod
@@ -47,6 +339,27 @@ class HTTPRemoteBackend(BaseBackend):
             f.write(entity.encode("utf-8"))
         return out.getvalue()
 
+    @staticmethod
+    def compress_stream(
+        lines: Iterable[bytes], chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """
+        Gzip lines incrementally
+
+        :param lines: encoded lines
+        :param chunk_size: minimum size of the compressed chunks, except the last one
+        :return: iterator of gzip compressed chunks
+        """
+        compressor = zlib.compressobj(wbits=31)
+        chunk = bytearray()
+        for line in lines:
+            chunk += compressor.compress(line)
+            if len(chunk) >= chunk_size:
+                yield bytes(chunk)
+                chunk.clear()
+        chunk += compressor.flush()
+        yield bytes(chunk)
+
     @staticmethod
     def decompress(entity: bytes) -> str:
         buf = io.BytesIO(entity)
@@ -72,10 +385,14 @@ class HTTPRemoteBackend(BaseBackend):
         endpoint: Optional[str] = None,
         method: Optional[str] = None,
         json_data: Optional[Union[Dict, List]] = None,
+        accept: Optional[str] = None,
     ) -> urllib.request.Request:
         headers = {
             "Accept-Encoding": "gzip",
+            SOURCE_HEADER: self.get_source(),
         }
+        if accept:
+            headers["Accept"] = accept
 
         url = self._make_url(endpoint)
         data = None
@@ -91,40 +408,254 @@ class HTTPRemoteBackend(BaseBackend):
         method = method or "GET"
         return urllib.request.Request(url, data=data, method=method, headers=headers)
 
-    def _request_json(self, request: urllib.request.Request) -> Union[Dict, List]:
-        response: http.client.HTTPResponse = urllib.request.urlopen(request, timeout=5)
+    def _request_cached(
+        self,
+        request: urllib.request.Request,
+        decode: Callable[[http.client.HTTPResponse], T],
+    ) -> T:
+        """
+        Send a GET request, revalidating the cached response if there is one
+
+        :param decode: decodes a response with a body
+        :return: the decoded response
+        """
+        key = (request.full_url, request.get_header("Accept"))
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is not None:
+            request.add_header("If-None-Match", entry[0])
+        try:
+            response: http.client.HTTPResponse = urllib.request.urlopen(
+                request, timeout=self._timeout
+            )
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or entry is None:
+                raise
+            e.close()
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+            return entry[1]
+
+        value = decode(response)
+        etag = response.getheader("ETag")
+        if etag and self._cache_size > 0:
+            with self._cache_lock:
+                if entry is not None and entry[0] != etag:
+                    # every response of the previous version is outdated
+                    for other in [
+                        k for k, v in self._cache.items() if v[0] == entry[0]
+                    ]:
+                        del self._cache[other]
+                self._cache[key] = (etag, value)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return value
+
+    def _decode_json(self, response: http.client.HTTPResponse) -> Union[Dict, List]:
         data = self._read_response(response)
         if response.getheader("Content-Type") == "application/json":
             return json.loads(data)
 
         return dict(content=data)
 
-    def store(self, object_data: List[ObjectDescriptor]):
-        data = [dict(item._asdict()) for item in object_data]
-        for item in data:
+    def _request_json(self, request: urllib.request.Request) -> Union[Dict, List]:
+        if request.get_method() != "GET":
+            response: http.client.HTTPResponse = urllib.request.urlopen(
+                request, timeout=self._timeout
+            )
+            return self._decode_json(response)
+        return self._request_cached(request, self._decode_json)
+
+    def _get_connection(self) -> http.client.HTTPConnection:
+        # a forked child must not share the connection of its parent
+        if self._conn_pid != os.getpid():
+            self._conn_pid = os.getpid()
+            self._conn_lock = threading.Lock()
+            self._conn = None
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(
+                self._host, self._port, timeout=self._timeout
+            )
+        return self._conn
+
+    def _post(
+        self, endpoint: str, chunks: Iterable[bytes], headers: Dict[str, str]
+    ) -> Tuple[int, http.client.HTTPResponse]:
+        """
+        Send gzip compressed chunks on the persistent connection
+
+        :return: number of compressed bytes sent and the response
+        """
+        sent = 0
+
+        def counted() -> Iterator[bytes]:
+            nonlocal sent
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+
+        headers = dict(
+            headers,
+            **{
+                "Accept-Encoding": "gzip",
+                "Content-Encoding": "gzip",
+                SOURCE_HEADER: self.get_source(),
+            },
+        )
+        conn = self._get_connection()
+        with self._conn_lock:
             try:
-                json.dumps(item)
-            except:
-                logger.exception("Unable to dump %s", item)
-        request = self._make_request("/api/objects", json_data=data)
+                # an iterable body without a Content-Length is sent chunked
+                conn.request(
+                    "POST", self._make_path(endpoint), body=counted(), headers=headers
+                )
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                raise
+        if response.status >= 400:
+            error = "{} returned {} {}".format(
+                endpoint, response.status, response.reason
+            )
+            if response.status == 415 or (
+                response.status in (400, 500)
+                and headers.get("Content-Type") == wire.MEDIA_TYPE
+                and not self._binary_accepted
+            ):
+                raise _UnsupportedFormat(error)
+            if response.status >= 500 or response.status in _RETRY_STATUSES:
+                raise ConnectionError(error)
+            if response.status == 409:
+                raise _ResyncRequired(error)
+            raise FatalSendError(error)
+        return sent, response
+
+    def _submit(self, job: Callable[[], int], what: str):
+        if self._sender is not None:
+            self._sender.put(job)
+            return
         try:
-            self._request_json(request)
-        except:
-            logger.exception("Error storing data")
+            job()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error storing %s", what)
+
+    def send(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    ) -> int:
+        """
+        Upload a snapshot from the calling thread without retrying
+
+        :return: number of compressed bytes sent
+        """
+        return _Upload(self, next(self._snapshots), object_data, type_counts)()
+
+    def get_delta_base(self) -> Optional[Tuple[int, Dict[int, int]]]:
+        """
+        Get the snapshot last applied by the server and the fingerprints of its
+        objects, e.g. to hand them over from a forked child with `set_delta_base`
+
+        :return: `(snapshot, fingerprints)` or `None` if the next upload is full
+        """
+        return self._acked
+
+    def set_delta_base(self, base: Optional[Tuple[int, Dict[int, int]]]):
+        """
+        Upload the next snapshot as a delta to a snapshot sent by another copy of
+        this backend
+
+        :param base: result of `get_delta_base` of the other copy
+        """
+        if base is None:
+            return
+        snapshot, fingerprints = base
+        self._acked = (snapshot, LootDict(fingerprints))
+        # later snapshots are numbered after the one of the other copy
+        self._snapshots = count(snapshot + 1)
+
+    def _request_objects(
+        self, request: urllib.request.Request
+    ) -> List[ObjectDescriptor]:
+        # copied since callers may change the list
+        return list(self._request_cached(request, self._decode_objects))
+
+    @staticmethod
+    def _decode_objects(response: http.client.HTTPResponse) -> List[ObjectDescriptor]:
+        data = response.read()
+        if response.info().get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        if response.getheader("Content-Type") == wire.MEDIA_TYPE:
+            return wire.decode(data)[0]
+        return [ObjectDescriptor(**item) for item in json.loads(data)]
+
+    def store(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    ):
+        upload = _Upload(self, next(self._snapshots), object_data, type_counts)
+        self._submit(upload, "data")
+
+    def store_counts(self, type_counts: Dict[Tuple[str, str], int]):
+        body = self.compress(json.dumps(_encode_counts(type_counts)))
+        headers = {"Content-Type": "application/json"}
+        self._submit(lambda: self._post("/api/history", [body], headers)[0], "history")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for uploads queued in the background
+
+        :param timeout: maximum seconds to wait. Forever when `None`
+        :return: `False` if uploads are still queued after `timeout`
+        """
+        if self._sender is None:
+            return True
+        return self._sender.flush(timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Send queued uploads then stop the background thread and close the connection
+
+        :param timeout: maximum seconds to wait for queued uploads
+        """
+        if self._sender is not None:
+            self._sender.close(timeout)
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        with self._cache_lock:
+            self._cache.clear()
+
+    def get_metrics(self) -> Optional[SenderMetrics]:
+        """
+        Get queue depth, bytes sent and latency of background uploads
+
+        :return: ::class::`SenderMetrics` or `None` when uploading in the foreground
+        """
+        if self._sender is None:
+            return None
+        return self._sender.get_metrics()
 
     def fetch(self, limit: Optional[int] = None) -> List[ObjectDescriptor]:
         if limit is not None:
-            request = self._make_request("/api/objects?limit={}".format(limit))
+            request = self._make_request(
+                "/api/objects?limit={}".format(limit), accept=_ACCEPT_OBJECTS
+            )
         else:
-            request = self._make_request("/api/objects")
+            request = self._make_request("/api/objects", accept=_ACCEPT_OBJECTS)
 
         try:
-            data = cast(List, self._request_json(request))
+            items = self._request_objects(request)
         except:
             logger.exception("Error fetching data")
             raise
 
-        return [ObjectDescriptor(**item) for item in data]
+        return items
 
     def fetch_by_id(self, _id: int) -> Optional[ObjectDescriptor]:
         request = self._make_request("/api/objects/{}".format(_id))
@@ -145,9 +676,11 @@ class HTTPRemoteBackend(BaseBackend):
         return ObjectDescriptor(**data)
 
     def fetch_children_of(self, _id: int) -> List[ObjectDescriptor]:
-        request = self._make_request("/api/objects/{}/children".format(_id))
+        request = self._make_request(
+            "/api/objects/{}/children".format(_id), accept=_ACCEPT_OBJECTS
+        )
         try:
-            data = cast(Dict, self._request_json(request))
+            items = self._request_objects(request)
         except urllib.error.HTTPError as e:
             if e.code == 404:
                 logger.warning("Unable to find object with id %s", _id)
@@ -159,12 +692,14 @@ class HTTPRemoteBackend(BaseBackend):
             logger.exception("Error fetching data")
             raise
 
-        return [ObjectDescriptor(**item) for item in data]
+        return items
 
     def fetch_parents_of(self, _id: int) -> List[ObjectDescriptor]:
-        request = self._make_request("/api/objects/{}/parents".format(_id))
+        request = self._make_request(
+            "/api/objects/{}/parents".format(_id), accept=_ACCEPT_OBJECTS
+        )
         try:
-            data = cast(Dict, self._request_json(request))
+            items = self._request_objects(request)
         except urllib.error.HTTPError as e:
             if e.code == 404:
                 logger.warning("Unable to find object with id %s", _id)
@@ -176,28 +711,92 @@ class HTTPRemoteBackend(BaseBackend):
             logger.exception("Error fetching data")
             raise
 
-        return [ObjectDescriptor(**item) for item in data]
+        return items
 
     def fetch_by_group(
-        self, group: str, limit: Optional[int] = None
+        self, group: str, limit: Optional[int] = None, offset: int = 0
     ) -> List[ObjectDescriptor]:
+        params: Dict[str, Union[str, int]] = dict(group=group)
         if limit is not None:
-            request = self._make_request(
-                "/api/objects?group={}&limit={}".format(group, limit)
+            params["limit"] = limit
+        if offset:
+            params["offset"] = offset
+        request = self._make_request(
+            "/api/objects?{}".format(urllib.parse.urlencode(params)),
+            accept=_ACCEPT_OBJECTS,
+        )
+        try:
+            items = self._request_objects(request)
+        except:
+            logger.exception("Error fetching data")
+            raise
+
+        return items
+
+    def fetch_paths_to_root(
+        self, _id: int, count: int = 1, max_depth: int = 32
+    ) -> List[List[ObjectDescriptor]]:
+        request = self._make_request(
+            "/api/objects/{}/path-to-root?count={}&max_depth={}".format(
+                _id, count, max_depth
             )
-        else:
-            request = self._make_request("/api/objects?group={}".format(group))
+        )
         try:
             data = cast(List, self._request_json(request))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                logger.warning("Unable to find object with id %s", _id)
+                return []
+            else:
+                logger.exception("Error fetching data")
+                raise
         except:
             logger.exception("Error fetching data")
             raise
 
-        return [ObjectDescriptor(**item) for item in data]
+        return [[ObjectDescriptor(**item) for item in path] for path in data]
+
+    def fetch_retained(self, _id: int) -> Optional[RetainedSize]:
+        request = self._make_request("/api/objects/{}/retained".format(_id))
+
+        try:
+            data = cast(Dict, self._request_json(request))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                logger.warning("Unable to find object with id %s", _id)
+                return None
+            else:
+                logger.exception("Error fetching data")
+                raise
+        except:
+            logger.exception("Error fetching data")
+            raise
+
+        return RetainedSize(**data)
+
+    def fetch_top_retainers(self, top: int = 100) -> List[RetainedSize]:
+        request = self._make_request("/api/retainers?top={}".format(top))
+        try:
+            data = cast(List, self._request_json(request))
+        except:
+            logger.exception("Error fetching data")
+            raise
 
-    def fetch_history(self, top: Optional[int] = None) -> List[ObjectTypeHistory]:
-        if top is not None:
-            request = self._make_request("/api/history?top={}".format(top))
+        return [RetainedSize(**item) for item in data]
+
+    def fetch_history(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
+        params = dict(top=top, start=start, end=end, resolution=resolution)
+        query = urllib.parse.urlencode(
+            {name: value for name, value in params.items() if value is not None}
+        )
+        if query:
+            request = self._make_request("/api/history?{}".format(query))
         else:
             request = self._make_request("/api/history")
         try:
@@ -208,5 +807,58 @@ class HTTPRemoteBackend(BaseBackend):
 
         return [ObjectTypeHistory(**item) for item in data]
 
+    def fetch_snapshots(self) -> List[SnapshotInfo]:
+        request = self._make_request("/api/snapshots")
+        try:
+            data = cast(List, self._request_json(request))
+        except:
+            logger.exception("Error fetching data")
+            raise
+
+        return [SnapshotInfo(**item) for item in data]
+
+    def fetch_diff(
+        self, start: int = -2, end: int = -1, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        query = urllib.parse.urlencode({"from": start, "to": end, "max_ids": max_ids})
+        request = self._make_request("/api/diff?{}".format(query))
+        try:
+            data = cast(List, self._request_json(request))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                logger.warning("Unable to find snapshots %s and %s", start, end)
+                return None
+            else:
+                logger.exception("Error fetching data")
+                raise
+        except:
+            logger.exception("Error fetching data")
+            raise
+
+        return [GroupDiff(**item) for item in data]
+
+    def fetch_sources(self) -> List[SourceInfo]:
+        request = self._make_request("/api/sources")
+        try:
+            data = cast(List, self._request_json(request))
+        except:
+            logger.exception("Error fetching data")
+            raise
+
+        return [SourceInfo(**item) for item in data]
+
     def get_ids(self) -> Iterable[int]:
         yield id(self)
+        yield id(self.__dict__)
+        if self._acked is not None:
+            yield id(self._acked)
+            yield id(self._acked[1])
+        yield id(self._cache)
+        yield id(self._cache_lock)
+        with self._cache_lock:
+            entries = list(self._cache.values())
+        for entry in entries:
+            yield id(entry)
+            yield id(entry[1])
+        if self._sender is not None:
+            yield from self._sender.get_ids()
@@ -1,137 +1,585 @@
+import json
 import logging
+import sys
 import time
+import zlib
+from array import array
 from collections import defaultdict
+from itertools import islice
+from typing import Any
 from typing import Dict
 from typing import Iterable
 from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Tuple
 
 from pyloot.backends.base import BaseBackend
+from pyloot.backends.base import DataVersion
+from pyloot.collector import materialize
+from pyloot.diff import SnapshotIndex
+from pyloot.diff import SnapshotLog
+from pyloot.graph import DominatorTree
+from pyloot.graph import find_roots
+from pyloot.graph import paths_to_root
+from pyloot.graph import ReferenceGraph
+from pyloot.graph import splice
+from pyloot.history import DEFAULT_TIERS
+from pyloot.history import TieredHistory
+from pyloot.types import GroupDiff
+from pyloot.types import LootDict
+from pyloot.types import LootList
 from pyloot.types import ObjectDescriptor
 from pyloot.types import ObjectTypeHistory
+from pyloot.types import RetainedSize
+from pyloot.types import SnapshotInfo
 
 
 logger = logging.getLogger(__name__)
 
+# Shared by all fetched descriptors without attrs
+_NO_ATTRS: Dict[str, str] = LootDict()
+# Number of ids fetched by id which are never evicted
+_RECENT_SIZE = 256
+
+
+class _Record:
+    """
+    Compact stored form of an ::class::`ObjectDescriptor`.
+    Strings are interned per backend and attrs and repr are kept in a zlib
+    compressed blob, which is `None` if they are not available.
+    References live in the ::class::`ReferenceGraph`.
+    """
+
+    __slots__ = (
+        "id",
+        "type_name",
+        "type_module",
+        "group",
+        "obj_name",
+        "seen",
+        "size",
+        "lazy",
+        "stale",
+        "blob",
+    )
+
+    def __init__(self, **kwargs: Any):
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+def _pack(text: str, attrs: Dict[str, str]) -> Optional[bytes]:
+    if not text and not attrs:
+        return None
+    return zlib.compress(json.dumps([text, attrs]).encode("utf-8"), 1)
+
+
+def _unpack(blob: Optional[bytes]) -> Tuple[str, Dict[str, str]]:
+    if blob is None:
+        return "", _NO_ATTRS
+    text, attrs = json.loads(zlib.decompress(blob).decode("utf-8"))
+    return text, LootDict(attrs)
+
 
 class InMemoryBackend(BaseBackend):
-    def __init__(self, max_history: int = 300):
-        self._data: Dict[int, ObjectDescriptor] = {}
-        self._history: Dict[Tuple[str, str], List[int]] = defaultdict(list)
-        self._sample_size: int = 0
-        self._max_history: int = max_history
+    accepts_graph = True
 
-    def store(self, object_data: List[ObjectDescriptor]):
+    def __init__(
+        self,
+        max_history: int = 300,
+        history_tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS,
+        max_memory: Optional[int] = None,
+        max_snapshots: int = 5,
+    ):
+        """
+        :param max_history: number of raw history samples kept per type
+        :param history_tiers: `(resolution in seconds, number of samples)` of each
+            history rollup
+        :param max_memory: approximate number of bytes used by the backend,
+            including its indexes, snapshots and history. When exceeded, attrs and
+            repr of the largest objects which were not recently fetched are dropped.
+            Counts and references are always kept
+        :param max_snapshots: number of snapshots which can be compared
+        """
+        # containers of stored data are pyloot types so that the collector skips
+        # them by type. See `get_ids`
+        self._data: Dict[int, _Record] = LootDict()
+        self._strings: Dict[str, str] = LootDict()
+        self._strings_size = 0
+        self._recent: Dict[int, None] = LootDict()
+        self._blob_size = 0
+        self._max_memory = max_memory
+        self._snapshots = SnapshotLog(max_snapshots)
+        self._graph: ReferenceGraph = ReferenceGraph.empty()
+        self._dominators: Optional[DominatorTree] = None
+        self._roots: Optional[List[int]] = None
+        self._history: TieredHistory = TieredHistory(max_history, history_tiers)
+        # group -> ids ordered by seen. dicts are used as ordered sets
+        self._groups: Dict[str, Dict[int, None]] = LootDict()
+        # (type_module, type_name) -> number of records
+        self._record_counts: Dict[Tuple[str, str], int] = LootDict()
+        self._version = DataVersion()
+
+    def store(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+        graph: Optional[ReferenceGraph] = None,
+    ):
+        """
+        :param graph: references of `object_data`. Built from their `child_ids`
+            when not given
+        """
         cur_time = time.time()
-        type_counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        sampled = type_counts is not None
+        if type_counts is None:
+            type_counts = defaultdict(int)
         to_delete = set(self._data.keys())
-        for i, descr in enumerate(object_data):
-            if descr.id in self._data:
-                object_data[i] = descr._replace(seen=self._data[descr.id].seen)
-                to_delete.remove(descr.id)
-            else:
-                object_data[i] = descr._replace(seen=cur_time)
+        seen: Dict[int, float] = {}
+        for descr in object_data:
+            old = self._data.get(descr.id)
+            # an id reused by an object of another type is a new object
+            if (
+                old is not None
+                and old.type_name == descr.type_name
+                and old.type_module == descr.type_module
+            ):
+                seen[descr.id] = old.seen
+                to_delete.discard(descr.id)
+            del old
 
-            type_counts[(descr.type_module, descr.type_name)] += 1
+            if not sampled:
+                type_counts[(descr.type_module, descr.type_name)] += 1
 
             del descr
 
-        for descr_tuple, count in type_counts.items():
-            if descr_tuple not in self._history:
-                self._history[descr_tuple] = [0] * self._sample_size
-            self._history[descr_tuple].append(count)
+        self.store_counts(type_counts)
 
-            if len(self._history[descr_tuple]) > self._max_history:
-                self._history[descr_tuple].pop(0)
+        for _id in to_delete:
+            self._drop(_id)
 
-        del type_counts
+        del to_delete
 
-        if self._sample_size < self._max_history:
-            self._sample_size += 1
+        if graph is None:
+            graph = ReferenceGraph.from_descriptors(object_data)
+        self._graph = graph
+        del graph
+        self._dominators = None
+        self._roots = None
 
-        for _id in to_delete:
-            del self._data[_id]
+        for descr in object_data:
+            old = self._data.get(descr.id)
+            if old is not None:
+                self._discard_blob(old)
+            record = self._to_record(descr, seen.get(descr.id, cur_time))
+            if old is None:
+                self._index(record)
+            self._data[descr.id] = record
+            del old
+            del record
 
-        del to_delete
+        del object_data
+        del seen
+
+        self._add_snapshot(cur_time, type_counts)
+        del type_counts
+
+        self._enforce_memory_limit()
+        self._version.bump()
+
+    def store_delta(
+        self,
+        object_data: List[ObjectDescriptor],
+        removed_ids: List[int],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    ) -> Dict[Tuple[str, str], int]:
+        """
+        Patch the stored records, the ::class::`ReferenceGraph` and the snapshot
+        index. Records of unchanged objects are neither decoded nor copied
+        """
+        cur_time = time.time()
+        for _id in removed_ids:
+            if _id in self._data:
+                self._drop(_id)
 
         for descr in object_data:
-            self._data[descr.id] = descr
+            old = self._data.get(descr.id)
+            seen = cur_time
+            if old is not None:
+                # an id reused by an object of another type is a new object
+                if (
+                    old.type_name == descr.type_name
+                    and old.type_module == descr.type_module
+                ):
+                    seen = old.seen
+                    self._discard_blob(old)
+                else:
+                    self._drop(descr.id)
+                    old = None
+            record = self._to_record(descr, seen)
+            if old is None:
+                self._index(record)
+            self._data[descr.id] = record
+            del old
+            del record
 
+        added = sorted({descr.id for descr in object_data})
+        dropped = set(removed_ids)
+        dropped.update(added)
+        previous = self._graph
+        self._graph = previous.patch(object_data, removed_ids)
+        self._dominators = None
+        self._roots = None
         del object_data
 
+        if type_counts is None:
+            type_counts = dict(self._record_counts)
+        self.store_counts(type_counts)
+        last = self._snapshots.get(-1)
+        if last is not None and last.ids is previous.ids:
+            self._patch_snapshot(
+                cur_time, type_counts, last, splice(last.ids, dropped, added)
+            )
+        else:
+            self._add_snapshot(cur_time, type_counts)
+        del previous
+        del last
+
+        self._enforce_memory_limit()
+        self._version.bump()
+        return type_counts
+
+    def _drop(self, _id: int):
+        record = self._data.pop(_id)
+        self._discard_blob(record)
+        self._recent.pop(_id, None)
+        ids = self._groups[record.group]
+        del ids[_id]
+        if not ids:
+            del self._groups[record.group]
+        key = (record.type_module, record.type_name)
+        self._record_counts[key] -= 1
+        if not self._record_counts[key]:
+            del self._record_counts[key]
+
+    def _index(self, record: _Record):
+        self._groups.setdefault(record.group, LootDict())[record.id] = None
+        key = (record.type_module, record.type_name)
+        self._record_counts[key] = self._record_counts.get(key, 0) + 1
+
+    def _add_snapshot(self, timestamp: float, type_counts: Dict[Tuple[str, str], int]):
+        type_index: Dict[Tuple[str, str], int] = {}
+        types = array("q")
+        sizes = array("q")
+        for _id in self._graph.ids:
+            record = self._data[_id]
+            key = (record.type_module, record.type_name)
+            types.append(type_index.setdefault(key, len(type_index)))
+            sizes.append(record.size)
+        self._snapshots.add(
+            timestamp,
+            self._graph.ids,
+            types,
+            sizes,
+            LootList(type_index),
+            LootDict(type_counts),
+        )
+
+    def _patch_snapshot(
+        self,
+        timestamp: float,
+        type_counts: Dict[Tuple[str, str], int],
+        last: SnapshotIndex,
+        pieces: List[Tuple[int, int, Optional[int]]],
+    ):
+        """
+        Add the index of a snapshot by copying the rows of `last` which are kept
+        and appending the added records
+
+        :param pieces: layout of the patched ids as returned by ::func::`splice`
+        """
+        type_keys = LootList(last.type_keys)
+        type_index = {key: idx for idx, key in enumerate(type_keys)}
+        types = array("q")
+        sizes = array("q")
+        for start, stop, _id in pieces:
+            if _id is None:
+                types.extend(last.types[start:stop])
+                sizes.extend(last.sizes[start:stop])
+                continue
+            record = self._data[_id]
+            key = (record.type_module, record.type_name)
+            idx = type_index.get(key)
+            if idx is None:
+                idx = type_index[key] = len(type_keys)
+                type_keys.append(key)
+            types.append(idx)
+            sizes.append(record.size)
+        self._snapshots.add(
+            timestamp,
+            self._graph.ids,
+            types,
+            sizes,
+            type_keys,
+            LootDict(type_counts),
+        )
+
+    def store_counts(self, type_counts: Dict[Tuple[str, str], int]):
+        self._history.append(type_counts)
+        self._version.bump()
+
+    def get_version(self) -> Optional[str]:
+        return str(self._version)
+
+    def _intern(self, text: str) -> str:
+        interned = self._strings.get(text)
+        if interned is None:
+            interned = self._strings[text] = text
+            self._strings_size += sys.getsizeof(text)
+        return interned
+
+    def _to_record(self, descr: ObjectDescriptor, seen: float) -> _Record:
+        blob = _pack(descr.repr, descr.attrs)
+        if blob is not None:
+            self._blob_size += len(blob)
+        return _Record(
+            id=descr.id,
+            type_name=self._intern(descr.type_name),
+            type_module=self._intern(descr.type_module),
+            group=self._intern(descr.group),
+            obj_name=self._intern(descr.obj_name),
+            seen=seen,
+            size=descr.size,
+            lazy=descr.lazy,
+            stale=descr.stale,
+            blob=blob,
+        )
+
+    def _discard_blob(self, record: _Record):
+        if record.blob is not None:
+            self._blob_size -= len(record.blob)
+            record.blob = None
+
+    def _to_descriptor(self, record: _Record) -> ObjectDescriptor:
+        text, attrs = _unpack(record.blob)
+        return ObjectDescriptor(
+            repr=text,
+            type_name=record.type_name,
+            type_module=record.type_module,
+            obj_name=record.obj_name,
+            id=record.id,
+            attrs=attrs,
+            parent_ids=self._graph.parents_of(record.id),
+            child_ids=self._graph.children_of(record.id),
+            seen=record.seen,
+            lazy=record.lazy,
+            stale=record.stale,
+            size=record.size,
+        )
+
+    def get_memory_usage(self) -> int:
+        """
+        Approximate number of bytes used by the backend: records and their attrs and
+        repr blobs, references, indexes, interned strings, snapshots and history.
+        """
+        graph = self._graph
+        arrays = (
+            graph.ids,
+            graph.child_offsets,
+            graph.child_edges,
+            graph.parent_offsets,
+            graph.parent_edges,
+        )
+        record_size = sys.getsizeof(self._data) + len(self._data) * (
+            _Record.__basicsize__ + 24  # the seen float
+        )
+        index_size = (
+            sys.getsizeof(self._groups)
+            + sum(sys.getsizeof(ids) for ids in self._groups.values())
+            + sys.getsizeof(self._recent)
+            + sys.getsizeof(self._record_counts)
+        )
+        return (
+            record_size
+            + sum(len(values) * values.itemsize for values in arrays)  # type: ignore
+            + self._blob_size
+            + index_size
+            + sys.getsizeof(self._strings)
+            + self._strings_size
+            + self._snapshots.get_memory_usage(shared=arrays)
+            + self._history.get_memory_usage()
+        )
+
+    def _enforce_memory_limit(self):
+        if self._max_memory is None:
+            return
+        excess = self.get_memory_usage() - self._max_memory
+        if excess <= 0:
+            return
+
+        # evict down to 90% of the limit so that the next store does not evict again
+        excess += self._max_memory // 10
+        candidates = sorted(
+            (
+                record
+                for record in self._data.values()
+                if record.blob is not None and record.id not in self._recent
+            ),
+            key=lambda record: len(record.blob),
+            reverse=True,
+        )
+        evicted = 0
+        for record in candidates:
+            if excess <= 0:
+                break
+            excess -= len(record.blob)
+            self._discard_blob(record)
+            record.lazy = True
+            evicted += 1
+        logger.debug("Dropped attrs and repr of %s objects", evicted)
+        if excess > 0:
+            logger.warning(
+                "Unable to store objects within %s bytes. Only counts and references "
+                "are kept",
+                self._max_memory,
+            )
+
+    def _fetch_nodes(self, indices: Iterable[int]) -> List[ObjectDescriptor]:
+        ids = self._graph.ids
+        records = [self._data.get(ids[idx]) for idx in indices]
+        return [self._to_descriptor(record) for record in records if record]
+
     def fetch(self, limit: Optional[int] = None) -> List[ObjectDescriptor]:
         results = list(self._data.values())
-        if limit is None or limit <= 0:
-            return results
-        return results[:limit]
+        if limit is not None and limit > 0:
+            results = results[:limit]
+        return [self._to_descriptor(record) for record in results]
 
     def fetch_by_id(self, _id: int) -> Optional[ObjectDescriptor]:
-        return self._data.get(_id)
+        record = self._data.get(_id)
+        if record is None:
+            return None
+
+        self._recent.pop(_id, None)
+        self._recent[_id] = None
+        if len(self._recent) > _RECENT_SIZE:
+            del self._recent[next(iter(self._recent))]
+
+        descr = self._to_descriptor(record)
+        if record.lazy and not record.stale:
+            descr = materialize(descr)
+            if not descr.lazy or descr.stale:
+                self._discard_blob(record)
+                self._data[_id] = self._to_record(descr, record.seen)
+                self._enforce_memory_limit()
+        return descr
 
     def fetch_children_of(self, _id: int) -> List[ObjectDescriptor]:
-        item = self.fetch_by_id(_id)
-        if not item:
+        idx = self._graph.index_of(_id)
+        if idx is None or _id not in self._data:
             logger.warning("Unable to find item with id %s", _id)
             return []
 
-        items = [self._data.get(idx) for idx in item.child_ids]
-        return [item for item in items if item]
+        return self._fetch_nodes(self._graph.child_indices(idx))
 
     def fetch_parents_of(self, _id: int) -> List[ObjectDescriptor]:
-        item = self.fetch_by_id(_id)
-        if not item:
+        idx = self._graph.index_of(_id)
+        if idx is None or _id not in self._data:
             logger.warning("Unable to find item with id %s", _id)
             return []
 
-        items = [self._data.get(idx) for idx in item.parent_ids]
-        return [item for item in items if item]
+        return self._fetch_nodes(self._graph.parent_indices(idx))
 
     def fetch_by_group(
-        self, group: str, limit: Optional[int] = None
+        self, group: str, limit: Optional[int] = None, offset: int = 0
     ) -> List[ObjectDescriptor]:
-        items = [item for item in self._data.values() if item.group == group]
-        sorted_items = sorted(items, key=lambda item: item.seen or item.id)
-        if limit is None or limit <= 0:
-            return sorted_items
-        return sorted_items[:limit]
-
-    def fetch_history(self, top: Optional[int] = None) -> List[ObjectTypeHistory]:
-        history = [
-            self._calculate_history(descr_tuple[0], descr_tuple[1], counts)
-            for descr_tuple, counts in self._history.items()
+        ids = self._groups.get(group)
+        if not ids:
+            return []
+        stop = None if limit is None or limit <= 0 else offset + limit
+        return [
+            self._to_descriptor(self._data[_id]) for _id in islice(ids, offset, stop)
         ]
-        sorted_history = sorted(history, reverse=True, key=lambda h: h.counts[-1])
-        if top is None or top <= 0:
-            return sorted_history
-        return sorted_history[:top]
+
+    def _get_dominators(self) -> DominatorTree:
+        # computed on first use and kept until the next snapshot is stored
+        if self._dominators is None:
+            sizes = [self._data[_id].size for _id in self._graph.ids]
+            self._dominators = DominatorTree(self._graph, sizes)
+        return self._dominators
+
+    def _get_retained(self, dominators: DominatorTree, idx: int) -> RetainedSize:
+        ids = self._graph.ids
+        descr = self._data[ids[idx]]
+        dominator = dominators.dominator_of(idx)
+        return RetainedSize(
+            id=descr.id,
+            type_name=descr.type_name,
+            type_module=descr.type_module,
+            size=descr.size,
+            retained_size=dominators.retained_size(idx),
+            dominator_id=None if dominator is None else ids[dominator],
+        )
+
+    def fetch_retained(self, _id: int) -> Optional[RetainedSize]:
+        idx = self._graph.index_of(_id)
+        if idx is None:
+            return None
+        return self._get_retained(self._get_dominators(), idx)
+
+    def fetch_top_retainers(self, top: int = 100) -> List[RetainedSize]:
+        dominators = self._get_dominators()
+        return [self._get_retained(dominators, idx) for idx in dominators.top(top)]
+
+    def _group_of(self, idx: int) -> str:
+        return self._data[self._graph.ids[idx]].group
+
+    def fetch_paths_to_root(
+        self, _id: int, count: int = 1, max_depth: int = 32
+    ) -> List[List[ObjectDescriptor]]:
+        idx = self._graph.index_of(_id)
+        if idx is None or _id not in self._data:
+            logger.warning("Unable to find item with id %s", _id)
+            return []
+
+        # computed on first use and kept until the next snapshot is stored
+        if self._roots is None:
+            self._roots = find_roots(self._graph, self._group_of)
+        paths = paths_to_root(
+            self._graph,
+            idx,
+            self._roots,
+            self._group_of,
+            count=count,
+            max_depth=max_depth,
+        )
+        return [self._fetch_nodes(path) for path in paths]
+
+    def fetch_history(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
+        return self._history.query(top=top, start=start, end=end, resolution=resolution)
+
+    def fetch_snapshots(self) -> List[SnapshotInfo]:
+        return self._snapshots.list()
+
+    def fetch_diff(
+        self, start: int = -2, end: int = -1, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        return self._snapshots.diff(start, end, max_ids=max_ids)
 
     def get_ids(self) -> Iterable[int]:
         yield id(self)
-        yield id(self._data)
-        yield id(self._history)
         yield id(self.__dict__)
-
-        for descr_tuple, counts in self._history.items():
-            yield id(descr_tuple)
-            yield id(counts)
-
-        for descr in self._data.values():
-            yield id(descr)
-            yield id(descr.parent_ids)
-            yield id(descr.child_ids)
-            yield id(descr.attrs)
-
-    @classmethod
-    def _calculate_history(
-        cls, type_module: str, type_name: str, counts: List[int]
-    ) -> ObjectTypeHistory:
-        _min = min(counts)
-        _max = max(counts)
-        return ObjectTypeHistory(
-            type_name=type_name,
-            type_module=type_module,
-            counts=counts,
-            min=_min,
-            max=_max,
-        )
+        yield from self._graph.get_ids()
+        if self._dominators is not None:
+            yield from self._dominators.get_ids()
+        yield from self._history.get_ids()
+        yield from self._snapshots.get_ids()
+        yield from self._version.get_ids()
+        # descriptors, their attrs, the group index and roots are excluded by type
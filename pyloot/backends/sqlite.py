@@ -0,0 +1,747 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import accumulate
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyloot.backends.base import BaseBackend
+from pyloot.backends.base import DataVersion
+from pyloot.collector import materialize
+from pyloot.diff import make_diff
+from pyloot.graph import DominatorTree
+from pyloot.graph import find_roots
+from pyloot.graph import paths_to_root
+from pyloot.graph import ReferenceGraph
+from pyloot.history import DEFAULT_TIERS
+from pyloot.types import GroupDiff
+from pyloot.types import LootDict
+from pyloot.types import LootList
+from pyloot.types import ObjectDescriptor
+from pyloot.types import ObjectTypeHistory
+from pyloot.types import RetainedSize
+from pyloot.types import SnapshotInfo
+
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    id INTEGER PRIMARY KEY,
+    snapshot INTEGER NOT NULL,
+    type_name TEXT NOT NULL,
+    type_module TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    obj_name TEXT NOT NULL,
+    repr TEXT NOT NULL,
+    attrs TEXT NOT NULL,
+    seen REAL NOT NULL,
+    lazy INTEGER NOT NULL,
+    stale INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_group ON objects (group_name, seen, id);
+CREATE INDEX IF NOT EXISTS objects_seen ON objects (seen, id);
+CREATE TABLE IF NOT EXISTS edges (
+    parent INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    child INTEGER NOT NULL,
+    PRIMARY KEY (parent, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_child ON edges (child, parent);
+CREATE TABLE IF NOT EXISTS samples (
+    timestamp REAL PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS history (
+    timestamp REAL NOT NULL,
+    type_module TEXT NOT NULL,
+    type_name TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+CREATE INDEX IF NOT EXISTS history_type ON history (type_module, type_name, timestamp);
+CREATE TABLE IF NOT EXISTS snapshots (
+    number INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    count INTEGER NOT NULL,
+    described INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_objects (
+    snapshot INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    type_module TEXT NOT NULL,
+    type_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (snapshot, id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshot_counts (
+    snapshot INTEGER NOT NULL,
+    type_module TEXT NOT NULL,
+    type_name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (snapshot, type_module, type_name)
+) WITHOUT ROWID;
+"""
+
+# objects of the `end` snapshot which are not in the `start` snapshot
+_NEWER_OBJECTS = """
+SELECT b.type_module, b.type_name, b.id FROM snapshot_objects AS b
+WHERE b.snapshot = :end AND NOT EXISTS (
+    SELECT 1 FROM snapshot_objects AS a
+    WHERE a.snapshot = :start
+        AND a.id = b.id
+        AND a.type_module = b.type_module
+        AND a.type_name = b.type_name
+)
+ORDER BY b.type_module, b.type_name, b.id
+"""
+
+_COLUMNS = "id, type_name, type_module, obj_name, repr, attrs, seen, lazy, stale, size"
+
+# an id reused by an object of another type is a new object. The sub-query runs
+# before the row is replaced; UPSERT (`ON CONFLICT DO UPDATE`) requires sqlite 3.24
+_REPLACE_OBJECT = """
+INSERT OR REPLACE INTO objects (
+    id, snapshot, type_name, type_module, group_name, obj_name, repr, attrs, seen,
+    lazy, stale, size
+)
+VALUES (
+    ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8,
+    COALESCE(
+        (
+            SELECT seen FROM objects
+            WHERE id = ?1 AND type_name = ?3 AND type_module = ?4
+        ),
+        ?9
+    ),
+    ?10, ?11, ?12
+)
+"""
+
+# SQLITE_MAX_VARIABLE_NUMBER is 999 before sqlite 3.32
+_MAX_VARIABLES = 500
+
+
+class SQLiteBackend(BaseBackend):
+    """
+    Stores snapshots and history in a SQLite database so that they survive restarts
+    and do not need to fit in memory.
+
+    Each thread uses its own connection. The database is in WAL mode so reads are
+    not blocked while a snapshot is stored. Retained sizes and paths to root load
+    the reference graph of the last snapshot in memory on first use.
+    """
+
+    accepts_graph = True
+
+    def __init__(
+        self,
+        path: str,
+        max_snapshots: int = 5,
+        max_history: int = 300,
+        history_tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS,
+    ):
+        """
+        :param path: path of the database file. Created if missing
+        :param max_snapshots: number of snapshots which can be compared
+        :param max_history: number of raw history samples kept
+        :param history_tiers: `(resolution in seconds, number of samples)` of each
+            history rollup. Older samples are thinned to one per bucket of the
+            tier covering them and dropped past the last tier
+        """
+        self._path = path
+        self._max_snapshots = max_snapshots
+        self._max_history = max_history
+        self._history_tiers = sorted(history_tiers)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = LootList()
+        self._lock = threading.Lock()
+        self._graph: Optional[ReferenceGraph] = None
+        self._groups: Optional[List[str]] = None
+        self._sizes: Optional[Sequence[int]] = None
+        self._dominators: Optional[DominatorTree] = None
+        self._roots: Optional[List[int]] = None
+        self._version = DataVersion()
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """
+        Close the connections of all threads
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _reset_cache(self):
+        self._graph = None
+        self._groups = None
+        self._sizes = None
+        self._dominators = None
+        self._roots = None
+
+    def store(
+        self,
+        object_data: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+        graph: Optional[ReferenceGraph] = None,
+    ):
+        """
+        :param graph: not used, references are stored from `child_ids`
+        """
+        cur_time = time.time()
+        if type_counts is None:
+            type_counts = Counter(
+                (descr.type_module, descr.type_name) for descr in object_data
+            )
+
+        conn = self._connect()
+        with self._lock, conn:
+            (snapshot,) = conn.execute(
+                "SELECT COALESCE(MAX(number), 0) + 1 FROM snapshots"
+            ).fetchone()
+            conn.executemany(
+                _REPLACE_OBJECT,
+                (
+                    (
+                        descr.id,
+                        snapshot,
+                        descr.type_name,
+                        descr.type_module,
+                        descr.group,
+                        descr.obj_name,
+                        descr.repr,
+                        json.dumps(descr.attrs),
+                        cur_time,
+                        descr.lazy,
+                        descr.stale,
+                        descr.size,
+                    )
+                    for descr in object_data
+                ),
+            )
+            conn.execute("DELETE FROM objects WHERE snapshot != ?", (snapshot,))
+            conn.execute("DELETE FROM edges")
+            # when an id is repeated, the references of the first descriptor win
+            conn.executemany(
+                "INSERT OR IGNORE INTO edges (parent, pos, child) VALUES (?, ?, ?)",
+                (
+                    (descr.id, pos, child_id)
+                    for descr in object_data
+                    for pos, child_id in enumerate(descr.child_ids)
+                ),
+            )
+            self._insert_counts(conn, type_counts, cur_time)
+
+            conn.execute(
+                "INSERT INTO snapshots (number, timestamp, count, described) "
+                "VALUES (?, ?, ?, (SELECT COUNT(*) FROM objects))",
+                (snapshot, cur_time, sum(type_counts.values())),
+            )
+            conn.execute(
+                "INSERT INTO snapshot_objects (snapshot, id, type_module, type_name, "
+                "size) SELECT snapshot, id, type_module, type_name, size FROM objects"
+            )
+            # history samples are thinned, diffs need the exact counts
+            conn.executemany(
+                "INSERT INTO snapshot_counts (snapshot, type_module, type_name, count) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (snapshot, type_module, type_name, count)
+                    for (type_module, type_name), count in type_counts.items()
+                ),
+            )
+            oldest = snapshot - self._max_snapshots
+            conn.execute("DELETE FROM snapshots WHERE number <= ?", (oldest,))
+            conn.execute("DELETE FROM snapshot_objects WHERE snapshot <= ?", (oldest,))
+            conn.execute("DELETE FROM snapshot_counts WHERE snapshot <= ?", (oldest,))
+            self._reset_cache()
+        self._version.bump()
+
+    def _insert_counts(
+        self,
+        conn: sqlite3.Connection,
+        type_counts: Dict[Tuple[str, str], int],
+        timestamp: float,
+    ):
+        conn.execute(
+            "INSERT OR IGNORE INTO samples (timestamp) VALUES (?)", (timestamp,)
+        )
+        conn.executemany(
+            "INSERT INTO history (timestamp, type_module, type_name, count) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                (timestamp, type_module, type_name, count)
+                for (type_module, type_name), count in type_counts.items()
+            ),
+        )
+        self._prune_history(conn, timestamp)
+
+    def _prune_history(self, conn: sqlite3.Connection, now: float):
+        """
+        Keep the last `max_history` samples, then the last sample of each bucket of
+        the finest tier which still covers it, like the rollups of
+        ::class::`pyloot.history.TieredHistory`
+        """
+        timestamps = conn.execute(
+            "SELECT timestamp FROM samples ORDER BY timestamp DESC LIMIT -1 OFFSET ?",
+            (self._max_history,),
+        ).fetchall()
+        buckets = set()
+        expired = []
+        for row in timestamps:
+            (timestamp,) = row
+            for resolution, count in self._history_tiers:
+                if timestamp >= now - resolution * count:
+                    bucket = (resolution, int(timestamp // resolution))
+                    if bucket in buckets:
+                        expired.append(row)
+                    buckets.add(bucket)
+                    break
+            else:
+                expired.append(row)
+        conn.executemany("DELETE FROM samples WHERE timestamp = ?", expired)
+        conn.executemany("DELETE FROM history WHERE timestamp = ?", expired)
+
+    def store_counts(self, type_counts: Dict[Tuple[str, str], int]):
+        conn = self._connect()
+        with self._lock, conn:
+            self._insert_counts(conn, type_counts, time.time())
+        self._version.bump()
+
+    def get_version(self) -> Optional[str]:
+        return str(self._version)
+
+    @staticmethod
+    def _to_descriptor(
+        row: Tuple, child_ids: List[int], parent_ids: List[int]
+    ) -> ObjectDescriptor:
+        (
+            _id,
+            type_name,
+            type_module,
+            obj_name,
+            text,
+            attrs,
+            seen,
+            lazy,
+            stale,
+            size,
+        ) = row
+        return ObjectDescriptor(
+            repr=text,
+            type_name=type_name,
+            type_module=type_module,
+            obj_name=obj_name,
+            id=_id,
+            attrs=json.loads(attrs),
+            parent_ids=parent_ids,
+            child_ids=child_ids,
+            seen=seen,
+            lazy=bool(lazy),
+            stale=bool(stale),
+            size=size,
+        )
+
+    def _fetch_rows(self, query: str, params: Sequence = ()) -> List[ObjectDescriptor]:
+        conn = self._connect()
+        rows = conn.execute(query, params).fetchall()
+        # references of all rows are loaded with one query per chunk of ids
+        ids = list({row[0] for row in rows})
+        child_ids: Dict[int, List[int]] = {}
+        parent_ids: Dict[int, List[int]] = {}
+        for start in range(0, len(ids), _MAX_VARIABLES):
+            chunk = ids[start : start + _MAX_VARIABLES]
+            marks = ", ".join("?" * len(chunk))
+            for parent, child in conn.execute(
+                "SELECT parent, child FROM edges WHERE parent IN ({}) "
+                "ORDER BY parent, pos".format(marks),
+                chunk,
+            ):
+                child_ids.setdefault(parent, []).append(child)
+            for child, parent in conn.execute(
+                "SELECT DISTINCT child, parent FROM edges WHERE child IN ({}) "
+                "ORDER BY child, parent".format(marks),
+                chunk,
+            ):
+                parent_ids.setdefault(child, []).append(parent)
+        return [
+            self._to_descriptor(
+                row, list(child_ids.get(row[0], ())), list(parent_ids.get(row[0], ()))
+            )
+            for row in rows
+        ]
+
+    def fetch(self, limit: Optional[int] = None) -> List[ObjectDescriptor]:
+        if limit is None or limit <= 0:
+            limit = -1
+        return self._fetch_rows(
+            "SELECT {} FROM objects ORDER BY seen, id LIMIT ?".format(_COLUMNS),
+            (limit,),
+        )
+
+    def fetch_by_id(self, _id: int) -> Optional[ObjectDescriptor]:
+        items = self._fetch_rows(
+            "SELECT {} FROM objects WHERE id = ?".format(_COLUMNS), (_id,)
+        )
+        if not items:
+            return None
+
+        item = items[0]
+        if item.lazy:
+            item = materialize(item)
+            if not item.lazy or item.stale:
+                conn = self._connect()
+                with self._lock, conn:
+                    conn.execute(
+                        "UPDATE objects SET repr = ?, attrs = ?, lazy = ?, stale = ? "
+                        "WHERE id = ?",
+                        (item.repr, json.dumps(item.attrs), item.lazy, item.stale, _id),
+                    )
+        return item
+
+    def fetch_children_of(self, _id: int) -> List[ObjectDescriptor]:
+        return self._fetch_rows(
+            "SELECT {} FROM edges JOIN objects ON objects.id = edges.child "
+            "WHERE edges.parent = ? ORDER BY edges.pos".format(
+                ", ".join("objects." + name for name in _COLUMNS.split(", "))
+            ),
+            (_id,),
+        )
+
+    def fetch_parents_of(self, _id: int) -> List[ObjectDescriptor]:
+        return self._fetch_rows(
+            "SELECT {} FROM objects WHERE id IN "
+            "(SELECT parent FROM edges WHERE child = ?) ORDER BY id".format(_COLUMNS),
+            (_id,),
+        )
+
+    def fetch_by_group(
+        self, group: str, limit: Optional[int] = None, offset: int = 0
+    ) -> List[ObjectDescriptor]:
+        if limit is None or limit <= 0:
+            limit = -1
+        return self._fetch_rows(
+            "SELECT {} FROM objects WHERE group_name = ? "
+            "ORDER BY seen, id LIMIT ? OFFSET ?".format(_COLUMNS),
+            (group, limit, offset),
+        )
+
+    def _get_graph(self) -> ReferenceGraph:
+        # loaded on first use and kept until the next snapshot is stored
+        if self._graph is None:
+            conn = self._connect()
+            with self._lock:
+                ids = array(
+                    "q",
+                    (
+                        _id
+                        for (_id,) in conn.execute("SELECT id FROM objects ORDER BY id")
+                    ),
+                )
+                degrees = LootDict(
+                    conn.execute("SELECT parent, COUNT(*) FROM edges GROUP BY parent")
+                )
+                child_offsets = array("q", [0])
+                child_offsets.extend(accumulate(degrees.get(_id, 0) for _id in ids))
+                del degrees
+                child_edges = array(
+                    "q",
+                    (
+                        child_id
+                        for (child_id,) in conn.execute(
+                            "SELECT child FROM edges ORDER BY parent, pos"
+                        )
+                    ),
+                )
+                strings: Dict[str, str] = {}
+                groups = LootList()
+                sizes = array("q")
+                for group, size in conn.execute(
+                    "SELECT group_name, size FROM objects ORDER BY id"
+                ):
+                    groups.append(strings.setdefault(group, group))
+                    sizes.append(size)
+                self._groups = groups
+                self._sizes = sizes
+                self._graph = ReferenceGraph(ids, child_offsets, child_edges)
+        return self._graph
+
+    def _group_of(self, idx: int) -> str:
+        assert self._groups is not None
+        return self._groups[idx]
+
+    def _get_dominators(self) -> DominatorTree:
+        graph = self._get_graph()
+        if self._dominators is None:
+            assert self._sizes is not None
+            self._dominators = DominatorTree(graph, self._sizes)
+        return self._dominators
+
+    def _get_retained(
+        self, dominators: DominatorTree, idx: int
+    ) -> Optional[RetainedSize]:
+        ids = self._get_graph().ids
+        row = (
+            self._connect()
+            .execute(
+                "SELECT type_name, type_module, size FROM objects WHERE id = ?",
+                (ids[idx],),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        type_name, type_module, size = row
+        dominator = dominators.dominator_of(idx)
+        return RetainedSize(
+            id=ids[idx],
+            type_name=type_name,
+            type_module=type_module,
+            size=size,
+            retained_size=dominators.retained_size(idx),
+            dominator_id=None if dominator is None else ids[dominator],
+        )
+
+    def fetch_retained(self, _id: int) -> Optional[RetainedSize]:
+        idx = self._get_graph().index_of(_id)
+        if idx is None:
+            return None
+        return self._get_retained(self._get_dominators(), idx)
+
+    def fetch_top_retainers(self, top: int = 100) -> List[RetainedSize]:
+        dominators = self._get_dominators()
+        items = (self._get_retained(dominators, idx) for idx in dominators.top(top))
+        return [item for item in items if item is not None]
+
+    def fetch_paths_to_root(
+        self, _id: int, count: int = 1, max_depth: int = 32
+    ) -> List[List[ObjectDescriptor]]:
+        graph = self._get_graph()
+        idx = graph.index_of(_id)
+        if idx is None:
+            logger.warning("Unable to find item with id %s", _id)
+            return []
+
+        if self._roots is None:
+            self._roots = find_roots(graph, self._group_of)
+        paths = paths_to_root(
+            graph, idx, self._roots, self._group_of, count=count, max_depth=max_depth
+        )
+        query = "SELECT {} FROM objects WHERE id = ?".format(_COLUMNS)
+        return [
+            [
+                item
+                for node in path
+                for item in self._fetch_rows(query, (graph.ids[node],))
+            ]
+            for path in paths
+        ]
+
+    def fetch_history(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
+        conditions = ["1"]
+        params: List[float] = []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            params.append(end)
+        where = " AND ".join(conditions)
+
+        conn = self._connect()
+        timestamps = [
+            timestamp
+            for (timestamp,) in conn.execute(
+                "SELECT timestamp FROM samples WHERE {} ORDER BY timestamp".format(
+                    where
+                ),
+                params,
+            )
+        ]
+        if not timestamps:
+            return []
+
+        # types missing from a sample are counted as 0
+        types = conn.execute(
+            "SELECT type_module, type_name, "
+            "SUM(CASE WHEN timestamp = ? THEN count ELSE 0 END) AS last "
+            "FROM history WHERE {} GROUP BY type_module, type_name "
+            "ORDER BY last DESC LIMIT ?".format(where),
+            [timestamps[-1]] + params + [-1 if top is None or top <= 0 else top],
+        ).fetchall()
+
+        results = []
+        for type_module, type_name, _ in types:
+            samples = dict(
+                conn.execute(
+                    "SELECT timestamp, count FROM history "
+                    "WHERE type_module = ? AND type_name = ? AND {}".format(where),
+                    [type_module, type_name] + params,
+                )
+            )
+            counts = [samples.get(timestamp, 0) for timestamp in timestamps]
+            if resolution:
+                results.append(
+                    _rollup(type_module, type_name, timestamps, counts, resolution)
+                )
+            else:
+                results.append(
+                    ObjectTypeHistory(
+                        type_name=type_name,
+                        type_module=type_module,
+                        counts=counts,
+                        min=min(counts),
+                        max=max(counts),
+                        timestamps=timestamps,
+                    )
+                )
+        return results
+
+    def fetch_snapshots(self) -> List[SnapshotInfo]:
+        return [
+            SnapshotInfo(*row)
+            for row in self._connect().execute(
+                "SELECT number, timestamp, count, described FROM snapshots "
+                "ORDER BY number"
+            )
+        ]
+
+    def _get_snapshot(
+        self, conn: sqlite3.Connection, number: int
+    ) -> Optional[Tuple[int, float]]:
+        if number < 0:
+            row = conn.execute(
+                "SELECT number, timestamp FROM snapshots ORDER BY number DESC "
+                "LIMIT 1 OFFSET ?",
+                (-number - 1,),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT number, timestamp FROM snapshots WHERE number = ?", (number,)
+            ).fetchone()
+        return row
+
+    def fetch_diff(
+        self, start: int = -2, end: int = -1, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        conn = self._connect()
+        old = self._get_snapshot(conn, start)
+        new = self._get_snapshot(conn, end)
+        if old is None or new is None:
+            return None
+
+        def newer(
+            start: int, end: int
+        ) -> Tuple[Dict[Tuple[str, str], int], Dict[Tuple[str, str], List[int]]]:
+            counts: Dict[Tuple[str, str], int] = Counter()
+            ids: Dict[Tuple[str, str], List[int]] = {}
+            rows = conn.execute(_NEWER_OBJECTS, dict(start=start, end=end))
+            for type_module, type_name, _id in rows:
+                key = (type_module, type_name)
+                counts[key] += 1
+                if counts[key] <= max_ids:
+                    ids.setdefault(key, []).append(_id)
+            return counts, ids
+
+        def get_counts(number: int) -> Dict[Tuple[str, str], int]:
+            rows = conn.execute(
+                "SELECT type_module, type_name, count FROM snapshot_counts "
+                "WHERE snapshot = ?",
+                (number,),
+            )
+            return {(module, name): count for module, name, count in rows}
+
+        def get_sizes(number: int) -> Dict[Tuple[str, str], int]:
+            rows = conn.execute(
+                "SELECT type_module, type_name, SUM(size) FROM snapshot_objects "
+                "WHERE snapshot = ? GROUP BY type_module, type_name",
+                (number,),
+            )
+            return {(module, name): size for module, name, size in rows}
+
+        added, added_ids = newer(old[0], new[0])
+        freed, freed_ids = newer(new[0], old[0])
+        return make_diff(
+            added,
+            added_ids,
+            freed,
+            freed_ids,
+            get_counts(old[0]),
+            get_counts(new[0]),
+            get_sizes(old[0]),
+            get_sizes(new[0]),
+        )
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self._local)
+        yield id(self._lock)
+        for conn in self._connections:
+            yield id(conn)
+        if self._graph is not None:
+            yield from self._graph.get_ids()
+        if self._sizes is not None:
+            yield id(self._sizes)
+        if self._dominators is not None:
+            yield from self._dominators.get_ids()
+        yield from self._version.get_ids()
+        # the group list is excluded by type
+
+
+def _rollup(
+    type_module: str,
+    type_name: str,
+    timestamps: List[float],
+    counts: List[int],
+    resolution: float,
+) -> ObjectTypeHistory:
+    """
+    Downsample raw counts to one sample per `resolution` seconds, like the rollups
+    of ::class::`pyloot.history.TieredHistory`.
+    """
+    buckets: Dict[int, List[int]] = {}
+    for timestamp, count in zip(timestamps, counts):
+        buckets.setdefault(int(timestamp // resolution), []).append(count)
+    mins = [min(values) for values in buckets.values()]
+    maxs = [max(values) for values in buckets.values()]
+    return ObjectTypeHistory(
+        type_name=type_name,
+        type_module=type_module,
+        counts=[values[-1] for values in buckets.values()],
+        min=min(mins),
+        max=max(maxs),
+        timestamps=[bucket * resolution for bucket in buckets],
+        mins=mins,
+        maxs=maxs,
+        means=[sum(values) / len(values) for values in buckets.values()],
+    )
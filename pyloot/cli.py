@@ -1,8 +1,20 @@
 import logging
+import os
+import re
 from argparse import ArgumentParser
 from argparse import SUPPRESS
 
+from typing import List
+
+from pyloot import AggregateBackend
+from pyloot import FileBackend
 from pyloot import PyLootServer
+from pyloot import SQLiteBackend
+from pyloot.backends.base import BaseBackend
+from pyloot.snapshot import diff_snapshots
+from pyloot.snapshot import Snapshot
+from pyloot.snapshot import top_groups
+from pyloot.types import GroupDiff
 
 
 def parse_args():
@@ -20,6 +32,25 @@ def parse_args():
         type=int,
         help="Port to listen on. (Default: 8000)",
     )
+    parser.add_argument(
+        "--sqlite",
+        metavar="PATH",
+        help="Store objects and history in SQLite databases so that they survive "
+        "restarts. Each process gets its own database next to PATH. "
+        "(Default: in memory)",
+    )
+    parser.add_argument(
+        "--source-ttl",
+        default=300,
+        type=float,
+        help="Seconds after which a process which stopped uploading is dropped. "
+        "(Default: 300)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        help="Serve a snapshot file written by FileBackend read-only",
+    )
     parser.add_argument(
         "--help",
         action="help",
@@ -27,13 +58,94 @@ def parse_args():
         default=SUPPRESS,
     )
 
+    commands = parser.add_subparsers(dest="command", metavar="{analyze}")
+    analyze = commands.add_parser(
+        "analyze", help="Analyze a snapshot file without running a server"
+    )
+    analyze.add_argument("file", help="Snapshot file written by FileBackend")
+    actions = analyze.add_subparsers(dest="action", required=True)
+
+    top = actions.add_parser("top", help="Groups with the most objects")
+    top.add_argument("-n", "--count", type=int, default=20, help="(Default: 20)")
+
+    path = actions.add_parser("path", help="Shortest chains of references to an id")
+    path.add_argument("id", type=int)
+    path.add_argument("-n", "--count", type=int, default=1, help="(Default: 1)")
+    path.add_argument("--max-depth", type=int, default=32, help="(Default: 32)")
+
+    diff = actions.add_parser("diff", help="Compare with a later snapshot file")
+    diff.add_argument("other", help="Snapshot file taken after FILE")
+    diff.add_argument("-n", "--count", type=int, default=20, help="(Default: 20)")
+
     return parser.parse_args()
 
 
+def _print_groups(items: List[GroupDiff], columns: List[str], headers: List[str]):
+    print(" ".join("{:>12}".format(header) for header in headers), "group")
+    for item in items:
+        values = [getattr(item, column) for column in columns]
+        print(
+            " ".join("{:>12}".format(value) for value in values),
+            "{}.{}".format(item.type_module, item.type_name),
+        )
+
+
+def _sqlite_factory(path: str):
+    root, ext = os.path.splitext(path)
+
+    def factory(source: str) -> SQLiteBackend:
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", source)
+        return SQLiteBackend("{}.{}{}".format(root, name, ext))
+
+    return factory
+
+
+def analyze(args):
+    if args.action == "path":
+        backend = FileBackend(args.file, read_only=True)
+        paths = backend.fetch_paths_to_root(
+            args.id, count=args.count, max_depth=args.max_depth
+        )
+        if not paths:
+            print("No path found to {}".format(args.id))
+        for num, path in enumerate(paths, 1):
+            print("path {}:".format(num))
+            for descr in path:
+                print("  {} {} {}".format(descr.id, descr.group, descr.repr[:80]))
+        backend.close()
+        return
+
+    snapshot = Snapshot(args.file)
+    if args.action == "top":
+        _print_groups(
+            top_groups(snapshot, args.count), ["count", "size_delta"], ["count", "size"]
+        )
+    else:
+        other = Snapshot(args.other)
+        _print_groups(
+            diff_snapshots(snapshot, other)[: args.count],
+            ["new", "freed", "count_delta", "size_delta"],
+            ["new", "freed", "count", "size"],
+        )
+        other.close()
+    snapshot.close()
+
+
 def main():
     logging.basicConfig(
         format="[%(asctime)s %(name)s %(levelname)s]: %(message)s", level=logging.INFO
     )
     args = parse_args()
-    server = PyLootServer()
+    if args.command == "analyze":
+        analyze(args)
+        return
+
+    backend: BaseBackend
+    if args.snapshot:
+        backend = FileBackend(args.snapshot, read_only=True)
+    elif args.sqlite:
+        backend = AggregateBackend(_sqlite_factory(args.sqlite), ttl=args.source_ttl)
+    else:
+        backend = AggregateBackend(ttl=args.source_ttl)
+    server = PyLootServer(backend=backend)
     server.serve_forever(host=args.host, port=args.port)
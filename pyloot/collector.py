@@ -1,20 +1,48 @@
 import cgi
 import gc
 import logging
+import random
+import reprlib
 import sys
+import time
+import weakref
+from collections import Counter
 from collections import defaultdict
+from collections import deque
+from types import ClassMethodDescriptorType
 from types import FrameType
+from types import FunctionType
+from types import MethodDescriptorType
+from types import WrapperDescriptorType
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import NamedTuple
 from typing import Optional
+from typing import Sequence
 from typing import Set
+from typing import Tuple
+from typing import TypeVar
 
+from pyloot.graph import ReferenceGraph
+from pyloot.types import CollectionStats
+from pyloot.types import LootDict
+from pyloot.types import LootList
 from pyloot.types import ObjectDescriptor
+from pyloot.utils import yield_thread
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+try:
+    from zope.interface.ro import C3 as _ZopeC3
+except Exception:  # pylint: disable=broad-except
+    _ZopeC3 = None
+
 METHOD_TYPES = [
     type(tuple.__le__),  # 'wrapper_descriptor'
     type([1].__le__),  # 'method-wrapper'
@@ -23,27 +51,236 @@ METHOD_TYPES = [
     type(logger.addFilter),  # 'bound instancemethod'
 ]
 
+# Class attributes of these types usually return one of METHOD_TYPES when looked up
+# on an instance. They are skipped without calling getattr once confirmed for a type.
+METHOD_DESCRIPTOR_TYPES = (
+    FunctionType,
+    WrapperDescriptorType,
+    MethodDescriptorType,
+    ClassMethodDescriptorType,
+    classmethod,
+)
+
+DEFAULT_EXCLUDED_MODULES = ("pyloot", "__main__")
+# Instances of types defined here are never collected, whatever the filter
+_INTERNAL_MODULES = ("pyloot",)
+
+_THIS_FILE = sys._getframe().f_code.co_filename
+
+# Attribute names per type, see `_get_attr_schema`. Cleared after every collection so
+# that types are not kept alive by the collector.
+_attr_schemas: Dict[type, Optional[Tuple[List[str], Set[str], Set[str]]]] = {}
+
+
+class DescriptorBudget(NamedTuple):
+    """
+    Bounds the size, in characters, of the repr and attrs of a descriptor.
+    """
+
+    # size of the repr of the object
+    repr_size: int = 4096
+    # size of the repr of each attribute value
+    attr_size: int = 512
+    # size of the repr plus the keys and values of all attributes
+    total_size: int = 65536
+
+
+DEFAULT_BUDGET = DescriptorBudget()
+
+# Called with the object and the maximum size of the returned string
+Describer = Callable[[Any, int], str]
+
+_describers: Dict[type, Describer] = {}
+
+
+class _ObjectRef(weakref.ref):
+    """Weak reference to a collected object held until it is materialized."""
+
+    __slots__ = ()
+
+
+# Maps ids collected in lazy mode to a weakref of the object
+_lazy_refs: Dict[int, _ObjectRef] = {}
+
+
+def _supports_weakref(obj_type: type) -> bool:
+    return obj_type.__weakrefoffset__ != 0
+
 
 def _type_name(obj: object) -> str:
     return type(obj).__name__
 
 
-def _safe_repr(obj: object) -> str:
+def register_describer(obj_type: type, describer: Describer):
+    """
+    Register a function used instead of `repr()` to describe objects of the given
+    type and of its subclasses.
+
+    The describer is called with the object and the maximum size of the returned
+    string. Longer strings are truncated.
+
+    :param obj_type: type of the described objects
+    :param describer: function returning a string describing the object
+    """
+    _describers[obj_type] = describer
+
+
+def get_describer(obj_type: type) -> Optional[Describer]:
+    """
+    Get the describer registered for the type or the closest of its base classes
+
+    :param obj_type: type of the described objects
+    :return: the describer or `None` if objects are described using `repr()`
+    """
+    for klass in obj_type.__mro__:
+        describer = _describers.get(klass)
+        if describer is not None:
+            return describer
+    if hasattr(obj_type, "__array_interface__"):
+        return describe_array
+    return None
+
+
+class _Limiter(reprlib.Repr):
+    def __init__(self, size: int):
+        super().__init__()
+        self.maxlevel = 3
+        self.maxtuple = 32
+        self.maxlist = 32
+        self.maxarray = 32
+        self.maxdict = 32
+        self.maxset = 32
+        self.maxfrozenset = 32
+        self.maxdeque = 32
+        self.maxstring = size
+        self.maxlong = size
+        self.maxother = size
+
+    def get_base_method(self, x) -> Optional[Callable[[Any, int], str]]:
+        for klass in type(x).__mro__:
+            method = getattr(self, "repr_" + klass.__name__, None)
+            if method is not None:
+                return method
+        return None
+
+    def repr_instance(self, x, level):
+        # Subclasses of builtin containers keep the level so recursion is bounded
+        method = self.get_base_method(x)
+        if method is not None and method is not self.repr_instance:
+            return method(x, level)
+        return _safe_repr(x, self.maxother)
+
+
+_limiters: Dict[int, _Limiter] = {}
+
+
+def _get_limiter(size: int) -> _Limiter:
+    limiter = _limiters.get(size)
+    if limiter is None:
+        limiter = _limiters[size] = _Limiter(size)
+    return limiter
+
+
+def _summarize(obj: Any, text: str, **details: Any) -> str:
+    details["getsizeof"] = sys.getsizeof(obj)
+    return "{}({}) {}".format(
+        _type_name(obj),
+        ", ".join("{}={}".format(k, v) for k, v in details.items()),
+        text,
+    ).rstrip()
+
+
+def describe_container(obj: Any, size: int) -> str:
+    """
+    Describe builtin containers and their subclasses with a bounded number of items.
+    Large containers are prefixed with their length and `sys.getsizeof`.
+    """
+    limiter = _get_limiter(size)
+    base = next(
+        klass
+        for klass in type(obj).__mro__
+        if hasattr(limiter, "repr_" + klass.__name__)
+    )
+    text = getattr(limiter, "repr_" + base.__name__)(obj, limiter.maxlevel)
+    if len(obj) <= limiter.maxlist and type(obj) is base:
+        return text
+    return _summarize(obj, text, len=len(obj))
+
+
+def describe_text(obj: Any, size: int) -> str:
+    """
+    Describe str, bytes and bytearray with a bounded prefix.
+    Long values are prefixed with their length and `sys.getsizeof`.
+    """
+    if len(obj) <= size:
+        return repr(obj)
+    return _summarize(obj, repr(obj[:size]) + "...", len=len(obj))
+
+
+def describe_memoryview(obj: memoryview, size: int) -> str:
+    """
+    Describe memoryview objects without reading the underlying buffer
+    """
     try:
+        return _summarize(
+            obj, "", nbytes=obj.nbytes, format=obj.format, shape=obj.shape
+        )
+    except ValueError:  # released
         return repr(obj)
+
+
+def describe_array(obj: Any, size: int) -> str:
+    """
+    Describe numpy-like arrays exposing `__array_interface__` by their shape, dtype
+    and size without reading the underlying buffer
+    """
+    return _summarize(
+        obj,
+        "",
+        shape=getattr(obj, "shape", None),
+        dtype=getattr(obj, "dtype", None),
+        nbytes=getattr(obj, "nbytes", None),
+    )
+
+
+for _container_type in (list, tuple, dict, set, frozenset, deque):
+    register_describer(_container_type, describe_container)
+for _text_type in (str, bytes, bytearray):
+    register_describer(_text_type, describe_text)
+register_describer(memoryview, describe_memoryview)
+
+
+def _safe_repr(obj: object, size: Optional[int] = None) -> str:
+    try:
+        describer = get_describer(type(obj))
+        if describer is not None and size is not None:
+            text = describer(obj, size)
+        else:
+            text = repr(obj)
     except Exception as e:
         return "(__repr_error__:{}:{})".format(_type_name(e), _type_name(obj))
 
+    if size is not None and len(text) > size:
+        return text[:size] + "..."
+    return text
+
 
-def _safe_getattr(obj: object, k: str, default: Any = Exception):
+def _is_zope_c3(obj: object) -> bool:
+    if _ZopeC3 is None:
+        return False
     try:
-        from zope.interface.ro import C3
+        return isinstance(obj, _ZopeC3) or issubclass(obj, _ZopeC3)  # type: ignore
+    except Exception:  # pylint: disable=broad-except
+        return False
 
-        if isinstance(obj, C3) or issubclass(obj, C3):  # type: ignore
-            if k.startswith("ORIG_"):
-                return "__ignored_zope_interface_C3_{}__".format(k)
-    except (ImportError, TypeError, Exception):
-        pass
+
+def _safe_getattr(
+    obj: object, k: str, default: Any = Exception, is_zope_c3: Optional[bool] = None
+):
+    if is_zope_c3 is None:
+        is_zope_c3 = _is_zope_c3(obj)
+    if is_zope_c3 and k.startswith("ORIG_"):
+        return "__ignored_zope_interface_C3_{}__".format(k)
 
     try:
         return getattr(obj, k)
@@ -54,42 +291,229 @@ def _safe_getattr(obj: object, k: str, default: Any = Exception):
             return default
 
 
-def _get_pretty_name(obj: object) -> str:
+def _get_pretty_type(obj: object) -> str:
     obj_type = type(obj)
     type_name = "%s.%s" % (obj_type.__module__, obj_type.__name__)
     pretty_type = type_name.replace("__builtin__.", "")
-    pretty_type = pretty_type.replace("builtins.", "")
+    return pretty_type.replace("builtins.", "")
+
 
-    name = _safe_getattr(obj, "__name__", default=None)
+def _get_pretty_name(obj: object) -> str:
+    pretty_type = _get_pretty_type(obj)
+    name = _safe_getattr(obj, "__name__", default=None, is_zope_c3=False)
     if name is not None:
         pretty_type = "%s %r" % (pretty_type, name)
     return pretty_type
 
 
-def _safe_get_attrs(obj: object) -> Dict[str, str]:
+def _get_attr_schema(obj: object) -> Optional[Tuple[List[str], Set[str], Set[str]]]:
+    """
+    Return the sorted attribute names of the type of the object, the same names as a
+    set and the names of its method attributes.
+    `None` is returned when `dir()` of instances can not be derived from the type.
+    """
+    obj_type = type(obj)
     try:
-        keys = dir(obj)
-    except Exception as e:
-        return {"__dir_error__": "{}:{}".format(_type_name(e), str(e))}
-    kv_pairs = [(k, _safe_getattr(obj, k)) for k in keys]
-    return {k: _safe_repr(v) for k, v in kv_pairs if type(v) not in METHOD_TYPES}
+        return _attr_schemas[obj_type]
+    except KeyError:
+        pass
 
+    schema = None
+    if (
+        obj_type.__dir__ is object.__dir__
+        and obj_type.__getattribute__ is object.__getattribute__
+        and not hasattr(obj_type, "__getattr__")
+        and not isinstance(obj_type.__dict__.get("__class__"), property)
+    ):
+        names = dir(obj_type)
+        methods = set()
+        for name in names:
+            for klass in obj_type.__mro__:
+                if name in klass.__dict__:
+                    if isinstance(
+                        klass.__dict__[name], METHOD_DESCRIPTOR_TYPES
+                    ) and _is_method_attr(obj, name):
+                        methods.add(name)
+                    break
+        schema = (names, set(names), methods)
 
-def _should_include_object(ref: object, ignore_set: Set[int]) -> bool:
-    thisfile = sys._getframe().f_code.co_filename
-    # Exclude all frames that are from this module.
-    if isinstance(ref, FrameType) and ref.f_code.co_filename == thisfile:
-        return False
+    _attr_schemas[obj_type] = schema
+    return schema
 
-    # Exclude all functions and classes from this module or reftree.
-    mod = str(getattr(ref, "__module__", ""))
-    if "pyloot" in mod or mod == "__main__":
-        return False  # pragma: nocover -- avoid bug in coverage due to Python's peephole optimizer
 
-    if id(ref) in ignore_set:
+def _is_method_attr(obj: object, name: str) -> bool:
+    try:
+        return type(getattr(obj, name)) in METHOD_TYPES
+    except Exception:  # pylint: disable=broad-except
         return False
 
-    return True
+
+def _get_attr_names(obj: object) -> Tuple[List[str], Set[str]]:
+    """
+    Return the same names as `dir(obj)` and the names which can be skipped because
+    they are methods of the type.
+    """
+    schema = _get_attr_schema(obj)
+    if schema is None:
+        return dir(obj), set()
+
+    names, name_set, methods = schema
+    instance_dict = getattr(obj, "__dict__", None)
+    if not instance_dict or not isinstance(instance_dict, dict):
+        return names, methods
+
+    instance_names = name_set.union(instance_dict)
+    if len(instance_names) != len(name_set):
+        names = sorted(instance_names)
+    return names, methods.difference(instance_dict)
+
+
+def _safe_get_attrs(
+    obj: object, budget: DescriptorBudget = DEFAULT_BUDGET, used: int = 0
+) -> Dict[str, str]:
+    try:
+        keys, skipped = _get_attr_names(obj)
+    except Exception as e:
+        return LootDict(__dir_error__="{}:{}".format(_type_name(e), str(e)))
+    is_zope_c3 = _is_zope_c3(obj)
+    attrs: Dict[str, str] = LootDict()
+    keys = [k for k in keys if k not in skipped]
+    for i, k in enumerate(keys):
+        v = _safe_getattr(obj, k, is_zope_c3=is_zope_c3)
+        if type(v) in METHOD_TYPES:
+            continue
+        text = _safe_repr(v, budget.attr_size)
+        used += len(k) + len(text)
+        if used > budget.total_size:
+            attrs["__truncated__"] = "{} attributes omitted".format(len(keys) - i)
+            break
+        attrs[k] = text
+    return attrs
+
+
+class ObjectFilter:
+    """
+    Decides which objects are collected.
+
+    Objects are excluded by the module they or their type are defined in. Decisions
+    are cached per type whenever `__module__` of an object comes from its type.
+    Frames of the collector and instances of types defined in pyloot, which hold
+    its own data, are always excluded.
+    """
+
+    __slots__ = ("exclude_modules", "include_modules", "_decisions")
+
+    def __init__(
+        self,
+        exclude_modules: Sequence[str] = DEFAULT_EXCLUDED_MODULES,
+        include_modules: Sequence[str] = (),
+    ):
+        """
+        :param exclude_modules: modules whose objects, functions and classes are not
+            collected. Submodules are excluded as well
+        :param include_modules: modules which are collected even if they match
+            `exclude_modules`
+        """
+        self.exclude_modules = tuple(exclude_modules)
+        self.include_modules = tuple(include_modules)
+        self._decisions: Dict[type, Tuple[Optional[bool], bool]] = {}
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this filter which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self._decisions)
+
+    def clear(self):
+        """
+        Forget cached decisions so that types are not kept alive.
+        """
+        self._decisions.clear()
+
+    def is_module_included(self, mod: str) -> bool:
+        if _matches_module(mod, self.include_modules):
+            return True
+        return not _matches_module(mod, self.exclude_modules)
+
+    def should_include(self, ref: object, ignore_set: Set[int]) -> bool:
+        if id(ref) in ignore_set:
+            return False
+
+        ref_type = type(ref)
+        try:
+            decision, has_dict = self._decisions[ref_type]
+        except KeyError:
+            if _is_internal_type(ref_type):
+                decision = False
+            else:
+                decision = self._get_type_decision(ref_type)
+            has_dict = bool(getattr(ref_type, "__dictoffset__", 0))
+            self._decisions[ref_type] = (decision, has_dict)
+        if decision is not None:
+            # The instance can still shadow __module__ of its type.
+            # e.g. staticmethod and TypeVar copy __module__ into their __dict__
+            if not has_dict or "__module__" not in _get_instance_dict(ref):
+                return decision
+
+        # Exclude all frames that are from this module.
+        if ref_type is FrameType:
+            return ref.f_code.co_filename != _THIS_FILE  # type: ignore
+
+        # Exclude all functions and classes from excluded modules.
+        return self.is_module_included(str(getattr(ref, "__module__", "")))
+
+    def _get_type_decision(self, ref_type: type) -> Optional[bool]:
+        """
+        Return whether all instances of the type are included, or `None` when the
+        decision depends on the instance.
+        """
+        if ref_type is FrameType:
+            return None
+        if ref_type.__getattribute__ is not object.__getattribute__ or hasattr(
+            ref_type, "__getattr__"
+        ):
+            return None
+
+        for klass in ref_type.__mro__:
+            if "__module__" in klass.__dict__:
+                mod = klass.__dict__["__module__"]
+                if isinstance(mod, str):
+                    return self.is_module_included(mod)
+                # A descriptor. e.g. functions and classes have their own __module__
+                return None
+
+        return self.is_module_included("")
+
+
+def _is_internal_type(ref_type: type) -> bool:
+    # vars() does not go through the metaclass, unlike `ref_type.__module__`
+    mod = vars(ref_type).get("__module__")
+    return isinstance(mod, str) and _matches_module(mod, _INTERNAL_MODULES)
+
+
+def _get_instance_dict(obj: object) -> Dict[str, Any]:
+    try:
+        instance_dict = obj.__dict__
+    except Exception:  # pylint: disable=broad-except
+        return {}
+    return instance_dict if isinstance(instance_dict, dict) else {}
+
+
+def _matches_module(mod: str, modules: Sequence[str]) -> bool:
+    for module in modules:
+        if mod == module or mod.startswith(module + "."):
+            return True
+    return False
+
+
+_default_filter = ObjectFilter()
+
+
+def _should_include_object(ref: object, ignore_set: Set[int]) -> bool:
+    return _default_filter.should_include(ref, ignore_set)
 
 
 def get_child_ids(obj: object) -> List[int]:
@@ -102,63 +526,568 @@ def get_child_ids(obj: object) -> List[int]:
     return [id(child) for child in gc.get_referents(obj)]
 
 
-def get_data(obj: object) -> ObjectDescriptor:
+def get_size(obj: object) -> int:
+    """
+    Return the shallow size of the object using sys.getsizeof
+
+    :param obj: The object
+    :return: size in bytes. 0 if the size is unknown
+    """
+    try:
+        return sys.getsizeof(obj)
+    except Exception:  # pylint: disable=broad-except
+        return 0
+
+
+def get_data(
+    obj: object, lazy: bool = False, budget: DescriptorBudget = DEFAULT_BUDGET
+) -> ObjectDescriptor:
     """
     Return a Object descriptor for the given object
 
     :param obj: The object
+    :param lazy: only record type, id and referents. attrs and repr can be
+        computed later using `materialize`. Objects which do not support weak
+        references are always described in full
+    :param budget: bounds the size of attrs and repr
     :return:
     """
     obj_type = type(obj)
+    if lazy and _supports_weakref(obj_type):
+        return ObjectDescriptor(
+            type_name=str(obj_type.__name__),
+            type_module=str(obj_type.__module__),
+            obj_name=_get_pretty_type(obj),
+            id=id(obj),
+            attrs=LootDict(),
+            parent_ids=[],
+            child_ids=get_child_ids(obj),
+            repr="",
+            lazy=True,
+            size=get_size(obj),
+        )
+
+    text = _safe_repr(obj, budget.repr_size)
     return ObjectDescriptor(
         type_name=str(obj_type.__name__),
         type_module=str(obj_type.__module__),
         obj_name=_get_pretty_name(obj),
         id=id(obj),
-        attrs=_safe_get_attrs(obj),
+        attrs=_safe_get_attrs(obj, budget, len(text)),
         parent_ids=[],
         child_ids=get_child_ids(obj),
-        repr=_safe_repr(obj),
+        repr=text,
+        size=get_size(obj),
     )
 
 
+def _register_lazy(objs: List[object]):
+    global _lazy_refs
+
+    refs: Dict[int, _ObjectRef] = {}
+    for obj in objs:
+        if _supports_weakref(type(obj)):
+            refs[id(obj)] = _ObjectRef(obj)
+    _lazy_refs = refs
+
+
+def materialize(
+    descr: ObjectDescriptor, budget: DescriptorBudget = DEFAULT_BUDGET
+) -> ObjectDescriptor:
+    """
+    Compute attrs and repr of a descriptor collected in lazy mode.
+
+    Only objects supporting weak references are collected lazily, they are resolved
+    through a weakref. If the object has died since it was collected, the returned
+    descriptor is marked as stale.
+    Descriptors collected in another process are returned unchanged.
+
+    :param descr: ::class::`ObjectDescriptor` returned by `get_data` in lazy mode
+    :param budget: bounds the size of attrs and repr
+    :return: ::class::`ObjectDescriptor`
+    """
+    if not descr.lazy or descr.stale:
+        return descr
+
+    ref = _lazy_refs.get(descr.id)
+    if ref is None:
+        return descr
+
+    obj = ref()
+    if obj is None:
+        _lazy_refs.pop(descr.id, None)
+        return descr._replace(stale=True)
+
+    text = _safe_repr(obj, budget.repr_size)
+    return descr._replace(
+        obj_name=_get_pretty_name(obj),
+        attrs=_safe_get_attrs(obj, budget, len(text)),
+        repr=text,
+        lazy=False,
+    )
+
+
+# Shared by cached descriptors, which are copied before being returned
+_NO_IDS: List[int] = LootList()
+
+
+class _CacheEntry(NamedTuple):
+    type_id: int
+    descr: ObjectDescriptor
+
+
+class DescriptorCache:
+    """
+    Per-process cache of ::class::`ObjectDescriptor` instances keyed by `(id, type)`.
+
+    Objects already described on a previous collection only get their referents
+    refreshed. The expensive attrs and repr are rebuilt only for new ids or when an id
+    has been reused by an object of a different type.
+
+    NOTE: attrs and repr of cached objects reflect the object when it was first seen.
+    """
+
+    def __init__(self):
+        self._entries: Dict[int, _CacheEntry] = LootDict()
+        self._next_entries: Dict[int, _CacheEntry] = LootDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def begin(self):
+        """
+        Start a collection. Entries not requested before `end` are dropped.
+        """
+        self._next_entries = LootDict()
+
+    def end(self):
+        """
+        Finish a collection, forgetting every object that was not seen during it.
+        """
+        self._entries = self._next_entries
+        self._next_entries = LootDict()
+
+    def get_data(
+        self,
+        obj: object,
+        lazy: bool = False,
+        budget: DescriptorBudget = DEFAULT_BUDGET,
+    ) -> ObjectDescriptor:
+        """
+        Return a Object descriptor for the given object, reusing the cached one if the
+        object was seen during the previous collection.
+
+        :param obj: The object
+        :param lazy: see `get_data`
+        :param budget: see `get_data`
+        :return: ::class::`ObjectDescriptor`
+        """
+        _id = id(obj)
+        obj_type = type(obj)
+        type_id = id(obj_type)
+        lazy = lazy and _supports_weakref(obj_type)
+        entry = self._entries.get(_id)
+        if entry is None or entry.type_id != type_id or entry.descr.lazy != lazy:
+            descr = get_data(obj, lazy=lazy, budget=budget)
+            entry = _CacheEntry(
+                type_id, descr._replace(parent_ids=_NO_IDS, child_ids=_NO_IDS)
+            )
+        else:
+            descr = entry.descr._replace(
+                parent_ids=[], child_ids=get_child_ids(obj), size=get_size(obj)
+            )
+
+        self._next_entries[_id] = entry
+        return descr
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this cache which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self)
+        yield id(self.__dict__)
+        # entries and their descriptors are excluded by type
+
+
+class TimeSlicer:
+    """
+    Splits a collection into slices which hold the GIL for at most `budget` seconds.
+    Other threads are allowed to run in between slices.
+
+    Pauses are recorded even without a budget, in which case the collection runs in a
+    single slice.
+
+    NOTE: objects can change in between slices so a sliced collection is not an
+    atomic snapshot of the heap.
+    """
+
+    def __init__(self, budget: Optional[float] = None, pause: float = 0.0):
+        """
+        :param budget: seconds a slice can run for before yielding
+        :param pause: seconds to sleep for in between slices
+        """
+        self.budget = budget
+        self.pause = pause
+        self.max_pause = 0.0
+        self.total_pause = 0.0
+        self.slices = 0
+        self._started: Optional[float] = None
+        self._stopped: Optional[float] = None
+        self._slice_started = 0.0
+
+    def start(self):
+        self._started = self._slice_started = time.monotonic()
+
+    def check(self):
+        """
+        End the current slice and yield to other threads if it ran over budget.
+        """
+        if self.budget is None:
+            return
+        now = time.monotonic()
+        if now - self._slice_started >= self.budget:
+            self._end_slice(now)
+            yield_thread(self.pause)
+            self._slice_started = time.monotonic()
+
+    def stop(self):
+        self._stopped = time.monotonic()
+        self._end_slice(self._stopped)
+
+    def iterate(self, items: Iterable[T]) -> Iterable[T]:
+        """
+        Iterate items, checking the slice budget before each one.
+        """
+        if self.budget is None:
+            return items
+        return self._iterate(items)
+
+    def _iterate(self, items: Iterable[T]) -> Iterator[T]:
+        for item in items:
+            self.check()
+            yield item
+
+    def _end_slice(self, now: float):
+        pause = now - self._slice_started
+        self.slices += 1
+        self.total_pause += pause
+        self.max_pause = max(self.max_pause, pause)
+
+    def get_stats(self) -> CollectionStats:
+        duration = 0.0
+        if self._started is not None:
+            duration = (self._stopped or time.monotonic()) - self._started
+        return CollectionStats(
+            duration=duration,
+            max_pause=self.max_pause,
+            total_pause=self.total_pause,
+            slices=self.slices,
+        )
+
+
+class SamplingPolicy:
+    """
+    Limits the number of objects described per group using reservoir sampling.
+
+    Every object is counted but at most `size` uniformly chosen objects per group are
+    described. Objects whose id was requested are always described.
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = 100,
+        group_sizes: Optional[Dict[str, Optional[int]]] = None,
+        requested_ids: Optional[Iterable[int]] = None,
+    ):
+        """
+        :param size: number of objects described per group. `None` describes all
+        :param group_sizes: overrides of `size` by group e.g. `{"builtins.dict": 10}`
+        :param requested_ids: ids of objects which should always be described
+        """
+        self.size = size
+        self.group_sizes: Dict[str, Optional[int]] = dict(group_sizes or {})
+        self.requested_ids: Set[int] = set(requested_ids or ())
+
+    def get_size(self, group: str) -> Optional[int]:
+        """
+        Get the number of objects described for the group
+        :param group: descriptor group
+        :return: size of the reservoir or `None` when unbounded
+        """
+        return self.group_sizes.get(group, self.size)
+
+    def request(self, _id: int):
+        """
+        Always describe the object with the given id
+        :param _id: id of object as returned by `id()`
+        """
+        self.requested_ids.add(_id)
+
+    def sample(
+        self, objs: Iterable[object], type_counts: Dict[Tuple[str, str], int]
+    ) -> List[object]:
+        """
+        Return the objects which should be described.
+
+        :param objs: objects to sample from
+        :param type_counts: filled with the number of objects per
+            `(type_module, type_name)`
+        :return: list of sampled objects
+        """
+        sizes: Dict[type, Tuple[Tuple[str, str], Optional[int]]] = {}
+        reservoirs: Dict[Tuple[str, str], List[object]] = defaultdict(list)
+        requested: List[object] = []
+        for obj in objs:
+            obj_type = type(obj)
+            try:
+                key, size = sizes[obj_type]
+            except KeyError:
+                key = (str(obj_type.__module__), str(obj_type.__name__))
+                size = self.get_size("{}.{}".format(*key))
+                sizes[obj_type] = (key, size)
+
+            count = type_counts.get(key, 0) + 1
+            type_counts[key] = count
+
+            if id(obj) in self.requested_ids:
+                requested.append(obj)
+                continue
+
+            reservoir = reservoirs[key]
+            if size is None or len(reservoir) < size:
+                reservoir.append(obj)
+            else:
+                idx = random.randrange(count)
+                if idx < size:
+                    reservoir[idx] = obj
+
+        for reservoir in reservoirs.values():
+            requested.extend(reservoir)
+
+        return requested
+
+
 def get_object_descriptors(
     ignored: Optional[Iterable[int]] = None,
+    cache: Optional[DescriptorCache] = None,
+    lazy: bool = False,
+    sampling: Optional[SamplingPolicy] = None,
+    type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    slicer: Optional[TimeSlicer] = None,
+    object_filter: Optional[ObjectFilter] = None,
+    budget: DescriptorBudget = DEFAULT_BUDGET,
 ) -> List[ObjectDescriptor]:
     """
     Return list of ::class::`ObjectDescriptor` instances for all objects in memory
     after a call to gc.collect.
 
     WARNING: Logging in this thread can cause a race condition if gevent is enabled
+
+    :param ignored: ids of objects which should not be collected
+    :param cache: when given, reuse descriptors of objects seen on the last collection
+    :param lazy: skip computing attrs and repr. See `materialize`
+    :param sampling: only describe the objects sampled by this policy. parent_ids
+        then only reference sampled objects
+    :param type_counts: when given, filled with the exact number of objects per
+        `(type_module, type_name)` regardless of sampling
+    :param slicer: when given, bound how long the GIL is held at once and record
+        pauses. `gc.collect` and `gc.get_objects` always run in the first slice
+    :param object_filter: decides which objects are collected. Defaults to
+        excluding objects from pyloot and `__main__`
+    :param budget: bounds the size of attrs and repr of each descriptor
+    """
+    results, _ = _collect(
+        ignored,
+        cache,
+        lazy,
+        sampling,
+        type_counts,
+        slicer,
+        object_filter,
+        budget,
+        with_parents=True,
+    )
+    return results
+
+
+def get_object_graph(
+    ignored: Optional[Iterable[int]] = None,
+    cache: Optional[DescriptorCache] = None,
+    lazy: bool = False,
+    sampling: Optional[SamplingPolicy] = None,
+    type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    slicer: Optional[TimeSlicer] = None,
+    object_filter: Optional[ObjectFilter] = None,
+    budget: DescriptorBudget = DEFAULT_BUDGET,
+) -> Tuple[List[ObjectDescriptor], ReferenceGraph]:
+    """
+    Like `get_object_descriptors` but return the references as a
+    ::class::`ReferenceGraph` instead of filling the `parent_ids` of descriptors,
+    which are left empty. Cheaper when the graph is stored as is, see
+    `BaseBackend.accepts_graph`
+
+    :return: the descriptors and the graph of their references
     """
+    return _collect(
+        ignored,
+        cache,
+        lazy,
+        sampling,
+        type_counts,
+        slicer,
+        object_filter,
+        budget,
+        with_parents=False,
+    )
+
+
+def _collect(
+    ignored: Optional[Iterable[int]],
+    cache: Optional[DescriptorCache],
+    lazy: bool,
+    sampling: Optional[SamplingPolicy],
+    type_counts: Optional[Dict[Tuple[str, str], int]],
+    slicer: Optional[TimeSlicer],
+    object_filter: Optional[ObjectFilter],
+    budget: DescriptorBudget,
+    with_parents: bool,
+) -> Tuple[List[ObjectDescriptor], ReferenceGraph]:
+    if slicer is None:
+        slicer = TimeSlicer()
+    slicer.start()
 
+    if object_filter is None:
+        object_filter = _default_filter
+
+    ignore_set = _get_ignore_set(ignored, object_filter)
+    del ignored
+
+    try:
+        results = _get_object_descriptors(
+            ignore_set,
+            object_filter,
+            cache,
+            lazy,
+            sampling,
+            type_counts,
+            slicer,
+            budget,
+            with_parents,
+        )
+    finally:
+        _clear_type_caches(object_filter)
+    slicer.stop()
+
+    return results
+
+
+def _get_ignore_set(
+    ignored: Optional[Iterable[int]], object_filter: ObjectFilter
+) -> Set[int]:
     if ignored:
         ignore_set = set(ignored)
     else:
         ignore_set = set()
 
     ignore_set.add(id(ignore_set))
+    ignore_set.add(id(_lazy_refs))
+    ignore_set.add(id(_attr_schemas))
+    ignore_set.update(object_filter.get_ids())
+    return ignore_set
 
-    del ignored
 
+def _clear_type_caches(object_filter: ObjectFilter):
+    object_filter.clear()
+    _attr_schemas.clear()
+
+
+def _get_object_descriptors(
+    ignore_set: Set[int],
+    object_filter: ObjectFilter,
+    cache: Optional[DescriptorCache],
+    lazy: bool,
+    sampling: Optional[SamplingPolicy],
+    type_counts: Optional[Dict[Tuple[str, str], int]],
+    slicer: TimeSlicer,
+    budget: DescriptorBudget,
+    with_parents: bool,
+) -> Tuple[List[ObjectDescriptor], ReferenceGraph]:
     gc.collect()
 
     objs: List[object] = gc.get_objects()
 
-    objs = [obj for obj in objs if _should_include_object(obj, ignore_set)]
-    results = [get_data(obj) for obj in objs]
+    should_include = object_filter.should_include
+    objs = [obj for obj in slicer.iterate(objs) if should_include(obj, ignore_set)]
+    if sampling is not None:
+        objs = sampling.sample(
+            slicer.iterate(objs), type_counts if type_counts is not None else {}
+        )
+    elif type_counts is not None:
+        for obj_type, count in Counter(type(obj) for obj in objs).items():
+            key = (str(obj_type.__module__), str(obj_type.__name__))
+            type_counts[key] = type_counts.get(key, 0) + count
+
+    if lazy:
+        _register_lazy(objs)
+
+    if cache is not None:
+        cache.begin()
+        results = [
+            cache.get_data(obj, lazy=lazy, budget=budget)
+            for obj in slicer.iterate(objs)
+        ]
+        cache.end()
+    else:
+        results = [
+            get_data(obj, lazy=lazy, budget=budget) for obj in slicer.iterate(objs)
+        ]
     del objs
     del ignore_set
-    child_to_parent: Dict[int, Set[int]] = defaultdict(set)
+    graph = ReferenceGraph.from_descriptors(results, slicer.iterate)
 
-    for descr in results:
-        for child_id in descr.child_ids:
-            child_to_parent[child_id].add(descr.id)
+    if with_parents:
+        for descr in slicer.iterate(results):
+            idx = graph.index_of(descr.id)
+            if idx is not None:
+                descr.parent_ids.extend(graph.ids[i] for i in graph.parent_indices(idx))
 
-    for descr in results:
-        if descr.id in child_to_parent:
-            descr.parent_ids.extend(child_to_parent[descr.id])
+    return results, graph
 
-    del child_to_parent
 
-    return results
+def get_type_counts(
+    ignored: Optional[Iterable[int]] = None,
+    object_filter: Optional[ObjectFilter] = None,
+) -> Dict[Tuple[str, str], int]:
+    """
+    Return the number of objects in memory per `(type_module, type_name)` after a call
+    to gc.collect without building any ::class::`ObjectDescriptor`.
+
+    :param ignored: ids of objects which should not be counted
+    :param object_filter: decides which objects are counted
+    """
+    if object_filter is None:
+        object_filter = _default_filter
+
+    ignore_set = _get_ignore_set(ignored, object_filter)
+    del ignored
+
+    gc.collect()
+
+    objs: List[object] = gc.get_objects()
+    should_include = object_filter.should_include
+    try:
+        type_counts = Counter(
+            type(obj) for obj in objs if should_include(obj, ignore_set)
+        )
+    finally:
+        _clear_type_caches(object_filter)
+    del objs
+    del ignore_set
+
+    return {
+        (str(obj_type.__module__), str(obj_type.__name__)): count
+        for obj_type, count in type_counts.items()
+    }
@@ -0,0 +1,277 @@
+import sys
+from array import array
+from collections import Counter
+from collections import defaultdict
+from itertools import repeat
+from operator import add
+from operator import mul
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyloot.types import GroupDiff
+from pyloot.types import LootList
+from pyloot.types import SnapshotInfo
+
+
+class SnapshotIndex:
+    """
+    Ids, type and shallow size of the objects of a snapshot, enough to compare it
+    with another snapshot. `types` holds an index in `type_keys` per id.
+    """
+
+    def __init__(
+        self,
+        number: int,
+        timestamp: float,
+        ids: Sequence[int],
+        types: Sequence[int],
+        sizes: Sequence[int],
+        type_keys: Sequence[Tuple[str, str]],
+        type_counts: Dict[Tuple[str, str], int],
+    ):
+        """
+        :param number: number of the snapshot, starting at 1
+        :param timestamp: unix time of the snapshot
+        :param ids: ids of the described objects
+        :param types: index in `type_keys` of each object
+        :param sizes: shallow size of each object
+        :param type_keys: `(type_module, type_name)` of each type
+        :param type_counts: exact number of objects per `(type_module, type_name)`
+        """
+        self.number = number
+        self.timestamp = timestamp
+        self.ids = ids
+        self.types = types
+        self.sizes = sizes
+        self.type_keys = type_keys
+        self.type_counts = type_counts
+        self._type_sizes: Optional[Dict[Tuple[str, str], int]] = None
+
+    def info(self) -> SnapshotInfo:
+        return SnapshotInfo(
+            number=self.number,
+            timestamp=self.timestamp,
+            count=sum(self.type_counts.values()),
+            described=len(self.ids),
+        )
+
+    def _keys(self, type_ids: Sequence[int], width: int) -> Iterable[int]:
+        # an id and its type as a single int so that sets of objects are compared
+        # in C
+        types = map(type_ids.__getitem__, self.types)
+        return map(add, map(mul, self.ids, repeat(width)), types)
+
+    def get_sizes(self) -> Dict[Tuple[str, str], int]:
+        """
+        Get the total shallow size of the described objects per type. Computed on
+        first use since a snapshot is usually compared more than once
+        """
+        if self._type_sizes is None:
+            sizes: Dict[Tuple[str, str], int] = Counter()
+            for type_idx, size in zip(self.types, self.sizes):
+                sizes[self.type_keys[type_idx]] += size
+            self._type_sizes = sizes
+        return self._type_sizes
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this index which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self.ids)
+        yield id(self.types)
+        yield id(self.sizes)
+        yield id(self.type_counts)
+
+
+def diff(
+    old: Optional[SnapshotIndex], new: SnapshotIndex, max_ids: int = 100
+) -> List[GroupDiff]:
+    """
+    Compare two snapshots group by group. An id of another type in `new` is
+    counted as freed and new.
+
+    :param old: ::class::`SnapshotIndex` taken first, `None` for an empty snapshot
+    :param new: ::class::`SnapshotIndex` taken last
+    :param max_ids: maximum number of new and freed ids returned per group
+    :return: list of ::class::`GroupDiff` by decreasing count delta
+    """
+    all_keys: Dict[Tuple[str, str], int] = {}
+    for index in (old, new):
+        if index is not None:
+            for key in index.type_keys:
+                all_keys.setdefault(key, len(all_keys))
+    keys = list(all_keys)
+    width = max(len(keys), 1)
+
+    def to_set(index: Optional[SnapshotIndex]) -> set:
+        if index is None:
+            return set()
+        type_ids = array("q", (all_keys[key] for key in index.type_keys))
+        return set(index._keys(type_ids, width))
+
+    old_set = to_set(old)
+    new_set = to_set(new)
+    added = new_set - old_set
+    freed = old_set - new_set
+    del old_set
+    del new_set
+
+    def per_type(items: set) -> Dict[Tuple[str, str], List[int]]:
+        results: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for item in sorted(items):
+            _id, type_id = divmod(item, width)
+            results[keys[type_id]].append(_id)
+        return results
+
+    added_ids = per_type(added)
+    freed_ids = per_type(freed)
+    return make_diff(
+        {key: len(ids) for key, ids in added_ids.items()},
+        {key: ids[:max_ids] for key, ids in added_ids.items()},
+        {key: len(ids) for key, ids in freed_ids.items()},
+        {key: ids[:max_ids] for key, ids in freed_ids.items()},
+        old.type_counts if old is not None else {},
+        new.type_counts,
+        old.get_sizes() if old is not None else {},
+        new.get_sizes(),
+    )
+
+
+def make_diff(
+    added: Dict[Tuple[str, str], int],
+    added_ids: Dict[Tuple[str, str], List[int]],
+    freed: Dict[Tuple[str, str], int],
+    freed_ids: Dict[Tuple[str, str], List[int]],
+    old_counts: Dict[Tuple[str, str], int],
+    new_counts: Dict[Tuple[str, str], int],
+    old_sizes: Dict[Tuple[str, str], int],
+    new_sizes: Dict[Tuple[str, str], int],
+) -> List[GroupDiff]:
+    """
+    Build the diff of each group from per `(type_module, type_name)` dicts
+
+    :return: list of ::class::`GroupDiff` by decreasing count delta
+    """
+    results = []
+    for key in set(old_counts).union(new_counts, added, freed):
+        type_module, type_name = key
+        count = new_counts.get(key, 0)
+        results.append(
+            GroupDiff(
+                type_name=type_name,
+                type_module=type_module,
+                new=added.get(key, 0),
+                freed=freed.get(key, 0),
+                count=count,
+                count_delta=count - old_counts.get(key, 0),
+                size_delta=new_sizes.get(key, 0) - old_sizes.get(key, 0),
+                new_ids=added_ids.get(key, []),
+                freed_ids=freed_ids.get(key, []),
+            )
+        )
+    results.sort(
+        key=lambda item: (
+            -item.count_delta,
+            -item.count,
+            item.type_module,
+            item.type_name,
+        )
+    )
+    return results
+
+
+class SnapshotLog:
+    """
+    Keeps the ::class::`SnapshotIndex` of the last `max_snapshots` snapshots.
+    Snapshots are numbered from 1. Negative numbers count from the last snapshot.
+    """
+
+    def __init__(self, max_snapshots: int = 5):
+        """
+        :param max_snapshots: number of snapshots which can be compared
+        """
+        self.max_snapshots = max_snapshots
+        self._indexes: List[SnapshotIndex] = LootList()
+        self._last = 0
+
+    def add(
+        self,
+        timestamp: float,
+        ids: Sequence[int],
+        types: Sequence[int],
+        sizes: Sequence[int],
+        type_keys: Sequence[Tuple[str, str]],
+        type_counts: Dict[Tuple[str, str], int],
+    ) -> SnapshotIndex:
+        self._last += 1
+        index = SnapshotIndex(
+            self._last, timestamp, ids, types, sizes, type_keys, type_counts
+        )
+        self._indexes.append(index)
+        if len(self._indexes) > self.max_snapshots:
+            del self._indexes[0]
+        return index
+
+    def get(self, number: int) -> Optional[SnapshotIndex]:
+        """
+        :param number: number of the snapshot. -1 for the last one
+        :return: ::class::`SnapshotIndex` or `None` if it is not kept
+        """
+        if number < 0:
+            number += self._last + 1
+        for index in self._indexes:
+            if index.number == number:
+                return index
+        return None
+
+    def list(self) -> List[SnapshotInfo]:
+        return [index.info() for index in self._indexes]
+
+    def diff(
+        self, start: int, end: int, max_ids: int = 100
+    ) -> Optional[List[GroupDiff]]:
+        """
+        Compare two kept snapshots
+
+        :param start: number of the first snapshot
+        :param end: number of the last snapshot
+        :param max_ids: maximum number of new and freed ids returned per group
+        :return: list of ::class::`GroupDiff` or `None` if a snapshot is not kept
+        """
+        old = self.get(start)
+        new = self.get(end)
+        if old is None or new is None:
+            return None
+        return diff(old, new, max_ids=max_ids)
+
+    def get_memory_usage(self, shared: Iterable[Sequence[int]] = ()) -> int:
+        """
+        Approximate number of bytes used by the kept snapshots
+
+        :param shared: arrays accounted elsewhere, such as the ids of the current
+            reference graph
+        """
+        counted = {id(values) for values in shared}
+        usage = sys.getsizeof(self._indexes)
+        for index in self._indexes:
+            for values in (index.ids, index.types, index.sizes):
+                if id(values) not in counted:
+                    counted.add(id(values))
+                    usage += len(values) * getattr(values, "itemsize", 8)
+            usage += sys.getsizeof(index.type_keys) + sys.getsizeof(index.type_counts)
+        return usage
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self)
+        yield id(self.__dict__)
+        for index in self._indexes:
+            yield from index.get_ids()
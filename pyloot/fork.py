@@ -0,0 +1,138 @@
+import os
+import pickle
+import signal
+import tempfile
+import time
+from typing import Any
+from typing import Callable
+from typing import Optional
+from typing import Tuple
+
+from pyloot.types import CollectionStats
+from pyloot.utils import yield_thread
+
+try:
+    import resource
+except ImportError:  # pragma: nocover -- not available on windows
+    resource = None  # type: ignore
+
+
+class ForkCollectionError(RuntimeError):
+    pass
+
+
+def is_fork_supported() -> bool:
+    return hasattr(os, "fork")
+
+
+def _get_address_space_size() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def _limit_child(timeout: float, memory_limit: Optional[int]):
+    # SIGALRM terminates the child if the parent is unable to kill it in time.
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    signal.alarm(max(1, int(timeout + 1)))
+
+    if memory_limit is None or resource is None:
+        return
+
+    # The child starts with the address space of the parent. Copy-on-write pages
+    # do not grow the address space so only new allocations count towards the limit.
+    current = _get_address_space_size()
+    if current is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = current + memory_limit
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+def _run_child(
+    func: Callable[[], Any], path: str, timeout: float, memory_limit: Optional[int]
+):
+    # NOTE: Only the forking thread exists in the child. Locks held by other threads
+    # (e.g. logging) are never released, so nothing here may log.
+    status = 1
+    try:
+        _limit_child(timeout, memory_limit)
+        result = func()
+        with open(path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        status = 0
+    except BaseException:  # pylint: disable=broad-except
+        status = 1
+    finally:
+        os._exit(status)  # pylint: disable=protected-access
+
+
+def _wait_child(pid: int, timeout: float) -> int:
+    deadline = time.monotonic() + timeout
+    while True:
+        waited_pid, status = os.waitpid(pid, os.WNOHANG)
+        if waited_pid == pid:
+            return status
+        if time.monotonic() >= deadline:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise ForkCollectionError(
+                "child process {} timed out after {} secs".format(pid, timeout)
+            )
+        yield_thread(0.05)
+
+
+def collect_in_child(
+    func: Callable[[], Any],
+    timeout: float = 300,
+    memory_limit: Optional[int] = None,
+) -> Tuple[Any, CollectionStats]:
+    """
+    Call `func` in a short lived child process created with `fork()`.
+
+    The child works from a copy-on-write image of the heap, so the calling process
+    only pauses for the duration of the fork and of loading the result.
+    The result of `func` is passed back to the parent through a temporary file.
+
+    :param func: function to call in the child. Its result must be picklable
+    :param timeout: seconds after which the child is killed
+    :param memory_limit: bytes the child can allocate on top of the parent's heap
+    :return: the result of `func` and the ::class::`CollectionStats` of the parent
+    """
+    if not is_fork_supported():
+        raise ForkCollectionError("fork is not supported on this platform")
+
+    fd, path = tempfile.mkstemp(prefix="pyloot-", suffix=".pickle")
+    os.close(fd)
+    try:
+        st = time.monotonic()
+        pid = os.fork()
+        if pid == 0:  # pragma: nocover -- runs in the child
+            _run_child(func, path, timeout, memory_limit)
+        fork_pause = time.monotonic() - st
+
+        status = _wait_child(pid, timeout)
+        if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+            raise ForkCollectionError(
+                "child process {} failed with status {}".format(pid, status)
+            )
+
+        load_st = time.monotonic()
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+        load_pause = time.monotonic() - load_st
+    finally:
+        os.unlink(path)
+
+    stats = CollectionStats(
+        duration=time.monotonic() - st,
+        max_pause=max(fork_pause, load_pause),
+        total_pause=fork_pause + load_pause,
+        slices=2,
+    )
+    return result, stats
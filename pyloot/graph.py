@@ -0,0 +1,851 @@
+import heapq
+import logging
+import weakref
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from itertools import accumulate
+from itertools import chain
+from itertools import compress
+from itertools import islice
+from itertools import repeat
+from operator import add
+from operator import attrgetter
+from operator import eq
+from operator import gt
+from operator import sub
+from typing import Callable
+from typing import Dict
+from typing import FrozenSet
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+from pyloot.types import LootList
+from pyloot.types import ObjectDescriptor
+
+
+logger = logging.getLogger(__name__)
+
+# Chains of references to an object start from these or from objects without parents
+ROOT_GROUPS = frozenset(("builtins.module", "builtins.frame"))
+
+
+def _weak_groups() -> FrozenSet[str]:
+    class Target:
+        def method(self):
+            pass
+
+    target = Target()
+    # names of the weakref types changed in python 3.10
+    types = (
+        type(weakref.ref(target)),
+        type(weakref.proxy(target)),
+        type(weakref.proxy(target.method.__func__)),
+        weakref.KeyedRef,
+        weakref.WeakMethod,
+        weakref.WeakSet,
+    )
+    groups = {"{}.{}".format(typ.__module__, typ.__name__) for typ in types}
+    # as reported by collectors running python < 3.10, which may upload to this one
+    groups.update(
+        ("builtins.weakref", "builtins.weakproxy", "builtins.weakcallableproxy")
+    )
+    return frozenset(groups)
+
+
+# Objects which are never part of a chain of references
+NOISE_GROUPS = _weak_groups()
+_CONTAINER_GROUPS = frozenset(
+    (
+        "builtins.dict",
+        "builtins.list",
+        "builtins.tuple",
+        "builtins.set",
+        "builtins.frozenset",
+    )
+)
+
+
+def _zeros(size: int) -> "array[int]":
+    return array("q", bytes(8 * size))
+
+
+# nodes or edges processed by a build pass in between calls to `iterate`
+_CHUNK = 4096
+
+Iterate = Callable[[Iterable[int]], Iterable[int]]
+
+
+def _chunks(size: int, iterate: Optional[Iterate]) -> Iterator[Tuple[int, int]]:
+    starts: Iterable[int] = range(0, size, _CHUNK)
+    if iterate is not None:
+        starts = iterate(starts)
+    for start in starts:
+        yield start, min(start + _CHUNK, size)
+
+
+def _zeros_chunked(size: int, iterate: Optional[Iterate]) -> "array[int]":
+    zeros = _zeros(min(size, _CHUNK))
+    values = array("q")
+    for start, stop in _chunks(size, iterate):
+        values.extend(zeros[: stop - start])
+    return values
+
+
+def _offsets(
+    lengths: Sequence[int], iterate: Optional[Iterate], size: Optional[int] = None
+) -> "array[int]":
+    """
+    Prefix sums of `lengths` starting from 0
+
+    :param size: number of lengths summed. All of them when `None`
+    """
+    offsets = array("q", [0])
+    for start, stop in _chunks(len(lengths) if size is None else size, iterate):
+        # accumulate(initial=) requires python 3.8
+        offsets.extend(map(add, accumulate(lengths[start:stop]), repeat(offsets[-1])))
+    return offsets
+
+
+def _transpose(
+    size: int,
+    offsets: Sequence[int],
+    targets: Sequence[int],
+    iterate: Optional[Iterate] = None,
+):
+    """
+    Reverse the edges of a graph in compressed sparse row format with a counting
+    sort: edges are counted per target, then each source is written at the next
+    free position of its target, so parents are ordered by node index. Negative
+    targets and duplicate edges are dropped.
+
+    :param iterate: called with the chunks of each pass, e.g. to yield to other
+        threads
+    """
+    total = len(targets)
+    # edges to unknown targets (-1) are counted in the last slot and cut
+    counts = _zeros_chunked(size + 1, iterate)
+    for start, stop in _chunks(total, iterate):
+        for target in targets[start:stop]:
+            counts[target] += 1
+    rev_offsets = _offsets(counts, iterate, size)
+    del counts
+    known = rev_offsets[-1]
+
+    positions = array("q")
+    for start, stop in _chunks(size + 1, iterate):
+        positions.extend(rev_offsets[start:stop])
+    rev_edges = _zeros_chunked(total, iterate)
+    for start, stop in _chunks(size, iterate):
+        degrees = map(sub, offsets[start + 1 : stop + 1], offsets[start:stop])
+        sources = chain.from_iterable(map(repeat, range(start, stop), degrees))
+        for source, target in zip(sources, targets[offsets[start] : offsets[stop]]):
+            pos = positions[target]
+            rev_edges[pos] = source
+            positions[target] = pos + 1
+    del positions
+    del rev_edges[known:]
+
+    # a source referencing a target more than once repeats in the target's row
+    repeated = array("q")
+    for start, stop in _chunks(known, iterate):
+        start = max(start, 1)
+        repeated.extend(
+            compress(
+                range(start, stop),
+                map(eq, rev_edges[start:stop], rev_edges[start - 1 : stop - 1]),
+            )
+        )
+    duplicates = [
+        pos for pos in repeated if rev_offsets[bisect_left(rev_offsets, pos)] != pos
+    ]
+    del repeated
+    if not duplicates:
+        return rev_offsets, rev_edges
+
+    keep = bytearray(b"\x01") * known
+    for pos in duplicates:
+        keep[pos] = 0
+    unique = array("q")
+    for start, stop in _chunks(known, iterate):
+        unique.extend(compress(rev_edges[start:stop], keep[start:stop]))
+    # each offset moves back by the number of duplicates before it
+    deduplicated = array("q")
+    for start, stop in _chunks(size + 1, iterate):
+        chunk = rev_offsets[start:stop]
+        deduplicated.extend(
+            map(sub, chunk, map(bisect_left, repeat(duplicates), chunk))
+        )
+    return deduplicated, unique
+
+
+def splice(
+    ids: Sequence[int], removed: Iterable[int], added: Sequence[int]
+) -> List[Tuple[int, int, Optional[int]]]:
+    """
+    Layout of a sorted id table after removing and adding ids, as the runs of rows
+    kept from `ids` interleaved with the added ids.
+
+    :param ids: sorted ids
+    :param removed: ids dropped from the table. Ids which are not in it are ignored
+    :param added: sorted ids inserted into the table. They must not be in `ids`
+        unless they are also removed
+    :return: list of `(start, stop, None)` for the rows `ids[start:stop]` which are
+        kept and `(pos, pos, id)` for each added id, in order
+    """
+    events: List[Tuple[int, int, int]] = [
+        (bisect_left(ids, _id), 0, _id) for _id in added
+    ]
+    for _id in removed:
+        idx = bisect_left(ids, _id)
+        if idx < len(ids) and ids[idx] == _id:
+            events.append((idx, 1, _id))
+    events.sort()
+    pieces: List[Tuple[int, int, Optional[int]]] = []
+    cursor = 0
+    for pos, skip, _id in events:
+        if cursor < pos:
+            pieces.append((cursor, pos, None))
+            cursor = pos
+        if skip:
+            cursor = pos + 1
+        else:
+            pieces.append((pos, pos, _id))
+    if cursor < len(ids):
+        pieces.append((cursor, len(ids), None))
+    return pieces
+
+
+class ReferenceGraph:
+    """
+    References between objects stored in compressed sparse row (CSR) format.
+
+    Nodes are identified by their index in the sorted `ids` table.
+    The ids of the children of node `i` are
+    `child_edges[child_offsets[i]:child_offsets[i + 1]]`, including children which
+    are not nodes of the graph. The parents of node `i` are the node indices
+    `parent_edges[parent_offsets[i]:parent_offsets[i + 1]]`.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[int],
+        child_offsets: Sequence[int],
+        child_edges: Sequence[int],
+        parent_offsets: Optional[Sequence[int]] = None,
+        parent_edges: Optional[Sequence[int]] = None,
+    ):
+        """
+        :param ids: sorted ids of the nodes
+        :param child_offsets: offsets of the children of each node in `child_edges`
+        :param child_edges: ids of children
+        :param parent_offsets: offsets of the parents of each node in `parent_edges`.
+            computed from the children when not provided
+        :param parent_edges: node indices of parents
+        """
+        self.ids = ids
+        self.child_offsets = child_offsets
+        self.child_edges = child_edges
+        if parent_offsets is None or parent_edges is None:
+            targets = array("q", (self._index_of(_id) for _id in child_edges))
+            parent_offsets, parent_edges = _transpose(len(ids), child_offsets, targets)
+        self.parent_offsets = parent_offsets
+        self.parent_edges = parent_edges
+
+    @classmethod
+    def from_descriptors(
+        cls,
+        descriptors: Sequence[ObjectDescriptor],
+        iterate: Optional[Iterate] = None,
+    ) -> "ReferenceGraph":
+        """
+        Build a graph from the `child_ids` of descriptors.
+        When an id is repeated, the first descriptor wins.
+
+        :param descriptors: list of ::class::`ObjectDescriptor`
+        :param iterate: called with the chunks of each build pass, e.g.
+            ::meth::`pyloot.collector.TimeSlicer.iterate` to yield to other threads
+        :return: ::class::`ReferenceGraph`
+        """
+        nodes = sorted(descriptors, key=attrgetter("id"))
+        ids = array("q")
+        repeated = False
+        for start, stop in _chunks(len(nodes), iterate):
+            ids.extend(map(attrgetter("id"), nodes[start:stop]))
+            lo = max(start, 1)
+            repeated = repeated or any(map(eq, ids[lo - 1 : stop - 1], ids[lo:stop]))
+        if repeated:
+            nodes = nodes[:1] + [
+                descr
+                for prev_id, descr in zip(ids, islice(nodes, 1, None))
+                if descr.id != prev_id
+            ]
+            ids = array("q", map(attrgetter("id"), nodes))
+
+        child_lists: List[Sequence[int]] = []
+        for start, stop in _chunks(len(nodes), iterate):
+            child_lists.extend(map(attrgetter("child_ids"), nodes[start:stop]))
+        del nodes
+        return cls._from_child_lists(ids, child_lists, iterate)
+
+    @classmethod
+    def _from_child_lists(
+        cls,
+        ids: "array[int]",
+        child_lists: List[Sequence[int]],
+        iterate: Optional[Iterate] = None,
+    ) -> "ReferenceGraph":
+        lengths = array("q")
+        child_edges = array("q")
+        for start, stop in _chunks(len(child_lists), iterate):
+            chunk = child_lists[start:stop]
+            lengths.extend(map(len, chunk))
+            child_edges.extend(chain.from_iterable(chunk))
+        del child_lists
+        child_offsets = _offsets(lengths, iterate)
+        del lengths
+
+        graph = cls(ids, child_offsets, child_edges, array("q", [0]), array("q"))
+        targets = graph.get_child_targets(iterate)
+        graph.parent_offsets, graph.parent_edges = _transpose(
+            len(ids), child_offsets, targets, iterate
+        )
+        return graph
+
+    def patch(
+        self, descriptors: Sequence[ObjectDescriptor], removed_ids: Iterable[int]
+    ) -> "ReferenceGraph":
+        """
+        Build the graph of the next snapshot from the objects added or changed since
+        this one and the ids of the objects removed. Runs of unchanged nodes are
+        copied from this graph, only the parent rows of nodes which gained or lost
+        a parent are rebuilt.
+
+        :param descriptors: list of ::class::`ObjectDescriptor` added or changed.
+            When an id is repeated, the first descriptor wins
+        :param removed_ids: ids of the nodes dropped from the graph
+        :return: ::class::`ReferenceGraph`
+        """
+        children: Dict[int, Sequence[int]] = {}
+        for descr in descriptors:
+            children.setdefault(descr.id, descr.child_ids)
+        added = sorted(children)
+        dropped = set(removed_ids)
+        dropped.update(added)
+        pieces = splice(self.ids, dropped, added)
+
+        # node index in this graph -> node index in the patched one, -1 if dropped
+        remap = array("q", [-1]) * len(self.ids)
+        ids = array("q")
+        offsets, edges = self.child_offsets, self.child_edges
+        child_offsets = array("q", [0])
+        child_edges = array("q")
+        for start, stop, _id in pieces:
+            if _id is None:
+                remap[start:stop] = array("q", range(len(ids), len(ids) + stop - start))
+                ids.extend(self.ids[start:stop])
+                shift = len(child_edges) - offsets[start]
+                child_edges.extend(edges[offsets[start] : offsets[stop]])
+                child_offsets.extend(
+                    map(add, offsets[start + 1 : stop + 1], repeat(shift))
+                )
+            else:
+                ids.append(_id)
+                child_edges.extend(children[_id])
+                child_offsets.append(len(child_edges))
+        graph = type(self)(ids, child_offsets, child_edges, array("q", [0]), array("q"))
+
+        # parents of the rebuilt rows, as node indices of the patched graph
+        rows: Dict[int, Set[int]] = {graph._index_of(_id): set() for _id in added}
+        for idx in map(self._index_of, dropped):
+            if idx < 0:
+                continue
+            for target in map(self._index_of, edges[offsets[idx] : offsets[idx + 1]]):
+                if target >= 0 and remap[target] >= 0:
+                    rows.setdefault(remap[target], set())
+        for _id in added:
+            source = graph._index_of(_id)
+            for target in map(graph._index_of, children[_id]):
+                if target >= 0:
+                    rows.setdefault(target, set()).add(source)
+        # unchanged nodes referencing the added ones
+        for start, stop in _chunks(len(edges), None):
+            for pos in compress(
+                range(start, stop), map(children.__contains__, edges[start:stop])
+            ):
+                source = remap[bisect_right(offsets, pos) - 1]
+                if source >= 0:
+                    rows[graph._index_of(edges[pos])].add(source)
+
+        parent_offsets, parent_edges = self.parent_offsets, self.parent_edges
+
+        def copy_rows(start: int, stop: int):
+            shift = len(graph.parent_edges) - parent_offsets[start]
+            graph.parent_edges.extend(
+                map(
+                    remap.__getitem__,
+                    parent_edges[parent_offsets[start] : parent_offsets[stop]],
+                )
+            )
+            graph.parent_offsets.extend(
+                map(add, parent_offsets[start + 1 : stop + 1], repeat(shift))
+            )
+
+        def write_row(idx: int, old_idx: int):
+            parents = rows[idx]
+            if old_idx >= 0:
+                old_parents = parent_edges[
+                    parent_offsets[old_idx] : parent_offsets[old_idx + 1]
+                ]
+                parents.update(map(remap.__getitem__, old_parents))
+                parents.discard(-1)
+            graph.parent_edges.extend(sorted(parents))
+            graph.parent_offsets.append(len(graph.parent_edges))
+
+        rebuilt = sorted(rows)
+        for start, stop, _id in pieces:
+            if _id is not None:
+                write_row(len(graph.parent_offsets) - 1, -1)
+                continue
+            shift = remap[start] - start
+            first = bisect_left(rebuilt, start + shift)
+            last = bisect_left(rebuilt, stop + shift)
+            for idx in rebuilt[first:last]:
+                copy_rows(start, idx - shift)
+                write_row(idx, idx - shift)
+                start = idx - shift + 1
+            copy_rows(start, stop)
+        return graph
+
+    @classmethod
+    def empty(cls) -> "ReferenceGraph":
+        return cls(array("q"), array("q", [0]), array("q"), array("q", [0]), array("q"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, _id: int) -> bool:
+        return self.index_of(_id) is not None
+
+    def index_of(self, _id: int) -> Optional[int]:
+        """
+        Get the node index of an object
+
+        :param _id: id of object as returned by `id()`
+        :return: index of the node or `None` if the object is not in the graph
+        """
+        idx = self._index_of(_id)
+        return None if idx < 0 else idx
+
+    def _index_of(self, _id: int) -> int:
+        idx = bisect_left(self.ids, _id)
+        if idx < len(self.ids) and self.ids[idx] == _id:
+            return idx
+        return -1
+
+    def child_indices(self, idx: int) -> List[int]:
+        """
+        Get the node indices of the children of a node which are part of the graph
+        """
+        indices = (
+            self._index_of(_id)
+            for _id in self.child_edges[
+                self.child_offsets[idx] : self.child_offsets[idx + 1]
+            ]
+        )
+        return [child for child in indices if child >= 0]
+
+    def get_child_targets(self, iterate: Optional[Iterate] = None) -> "array[int]":
+        """
+        Get the node index of every child in `child_edges`, -1 for children which
+        are not nodes of the graph.
+
+        :param iterate: called with the chunks of each pass
+        """
+        index: Dict[int, int] = {}
+        for start, stop in _chunks(len(self.ids), iterate):
+            index.update(zip(self.ids[start:stop], range(start, stop)))
+        targets = array("q")
+        for start, stop in _chunks(len(self.child_edges), iterate):
+            targets.extend(map(index.get, self.child_edges[start:stop], repeat(-1)))
+        return targets
+
+    def parent_indices(self, idx: int) -> Sequence[int]:
+        return self.parent_edges[
+            self.parent_offsets[idx] : self.parent_offsets[idx + 1]
+        ]
+
+    def children_of(self, _id: int) -> List[int]:
+        """
+        Get ids of the children of an object
+
+        :param _id: id of object as returned by `id()`
+        :return: list of ids. empty if the object is not in the graph
+        """
+        idx = self.index_of(_id)
+        if idx is None:
+            return []
+        return list(
+            self.child_edges[self.child_offsets[idx] : self.child_offsets[idx + 1]]
+        )
+
+    def parents_of(self, _id: int) -> List[int]:
+        """
+        Get ids of the parents of an object
+
+        :param _id: id of object as returned by `id()`
+        :return: list of ids. empty if the object is not in the graph
+        """
+        idx = self.index_of(_id)
+        if idx is None:
+            return []
+        return [self.ids[parent] for parent in self.parent_indices(idx)]
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this graph which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self.ids)
+        yield id(self.child_offsets)
+        yield id(self.child_edges)
+        yield id(self.parent_offsets)
+        yield id(self.parent_edges)
+
+
+class DominatorTree:
+    """
+    Immediate dominators and retained sizes of the nodes of a ::class::`ReferenceGraph`.
+
+    Computed with the iterative algorithm of Cooper, Harvey and Kennedy from a
+    virtual root whose children are the nodes without parents. Nodes only reachable
+    through reference cycles are attached to the virtual root in index order.
+    The retained size of a node is its own size plus the retained size of every
+    node it immediately dominates.
+    """
+
+    def __init__(
+        self, graph: ReferenceGraph, sizes: Sequence[int], max_passes: int = 100
+    ):
+        """
+        :param graph: ::class::`ReferenceGraph`
+        :param sizes: shallow size of each node of `graph`, in node order
+        :param max_passes: bound on the number of passes over the nodes. Heaps
+            usually converge in a few passes. When reached, some dominators may be
+            deeper than the exact ones and retained sizes are overestimated
+        """
+        size = len(graph)
+        order, root_children = self._get_postorder(graph)
+
+        # nodes are numbered in postorder so that the virtual root is `size` and
+        # a dominator always has a larger number than the nodes it dominates
+        number = _zeros(size)
+        for num, node in enumerate(order):
+            number[node] = num
+        parent_offsets = graph.parent_offsets
+        parent_edges = graph.parent_edges
+        pred_offsets = array("q", [0])
+        preds = array("q")
+        for node in order:
+            preds.extend(
+                map(
+                    number.__getitem__,
+                    parent_edges[parent_offsets[node] : parent_offsets[node + 1]],
+                )
+            )
+            if root_children[node]:
+                preds.append(size)
+            pred_offsets.append(len(preds))
+
+        idom = array("q", [-1]) * (size + 1)
+        idom[size] = size
+        # reverse postorder. The only predecessor of a node is its parent in the
+        # depth first search, so the first pass settles it and later passes only
+        # visit nodes with several predecessors
+        nodes: Iterable[int] = range(size - 1, -1, -1)
+        for _ in range(max_passes):
+            changed = False
+            for num in nodes:
+                new_idom = -1
+                for pred in preds[pred_offsets[num] : pred_offsets[num + 1]]:
+                    if idom[pred] < 0:
+                        continue
+                    if new_idom < 0:
+                        new_idom = pred
+                        continue
+                    # walk up to the closest common dominator
+                    finger = pred
+                    while finger != new_idom:
+                        while finger < new_idom:
+                            finger = idom[finger]
+                        while new_idom < finger:
+                            new_idom = idom[new_idom]
+                if idom[num] != new_idom:
+                    idom[num] = new_idom
+                    changed = True
+            if not changed:
+                break
+            if isinstance(nodes, range):
+                degrees = map(sub, pred_offsets[1:], pred_offsets[:-1])
+                nodes = array("q", compress(range(size), map(gt, degrees, repeat(1))))
+                nodes.reverse()
+        else:
+            logger.warning(
+                "Dominators did not converge in %s passes. Retained sizes may be "
+                "overestimated",
+                max_passes,
+            )
+        del preds
+        del pred_offsets
+
+        retained = array("q", map(sizes.__getitem__, order))
+        retained.append(0)
+        for num in range(size):
+            retained[idom[num]] += retained[num]
+
+        self.total_size: int = retained.pop()
+        order.append(-1)
+        self.idom = array("q", map(order.__getitem__, map(idom.__getitem__, number)))
+        self.retained = array("q", map(retained.__getitem__, number))
+
+    @staticmethod
+    def _get_postorder(graph: ReferenceGraph):
+        size = len(graph)
+        offsets = graph.child_offsets
+        targets = graph.get_child_targets()
+        parent_offsets = graph.parent_offsets
+        visited = bytearray(size)
+        root_children = bytearray(size)
+        order = array("q")
+
+        # position of the next child to visit of each node
+        cursors = array("q", offsets)
+
+        def visit(start: int):
+            root_children[start] = 1
+            visited[start] = 1
+            stack = [start]
+            while stack:
+                node = stack[-1]
+                pos = cursors[node]
+                end = offsets[node + 1]
+                while pos < end:
+                    child = targets[pos]
+                    pos += 1
+                    if child >= 0 and not visited[child]:
+                        cursors[node] = pos
+                        visited[child] = 1
+                        stack.append(child)
+                        break
+                else:
+                    stack.pop()
+                    order.append(node)
+
+        for node in range(size):
+            if parent_offsets[node] == parent_offsets[node + 1]:
+                visit(node)
+        for node in range(size):
+            if not visited[node]:
+                visit(node)
+
+        return order, root_children
+
+    def dominator_of(self, idx: int) -> Optional[int]:
+        """
+        Get the node index of the immediate dominator of a node
+
+        :param idx: node index
+        :return: node index or `None` if the node is only dominated by the root
+        """
+        dominator = self.idom[idx]
+        return None if dominator < 0 else dominator
+
+    def retained_size(self, idx: int) -> int:
+        return self.retained[idx]
+
+    def top(self, count: int) -> List[int]:
+        """
+        Get the nodes retaining the most memory
+
+        :param count: number of nodes to return
+        :return: list of node indices by decreasing retained size
+        """
+        return heapq.nlargest(
+            count, range(len(self.retained)), key=self.retained.__getitem__
+        )
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this tree which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self.idom)
+        yield id(self.retained)
+
+
+def _walk(links: Dict[int, int], node: int) -> List[int]:
+    chain = []
+    while node >= 0:
+        chain.append(node)
+        node = links[node]
+    return chain
+
+
+def shortest_paths(
+    graph: ReferenceGraph,
+    target: int,
+    roots: Iterable[int],
+    skip: Optional[Callable[[int], bool]] = None,
+    count: int = 1,
+    max_depth: int = 32,
+    max_visited: int = 200000,
+) -> List[List[int]]:
+    """
+    Find the shortest chains of references from any root to a target node with a
+    bidirectional breadth first search. The smaller frontier is expanded first:
+    roots along child edges and the target along parent edges.
+
+    :param graph: ::class::`ReferenceGraph`
+    :param target: node index of the target
+    :param roots: node indices chains may start from
+    :param skip: returns `True` for nodes which may not be part of a chain
+    :param count: maximum number of chains to return
+    :param max_depth: maximum number of references in a chain
+    :param max_visited: stop searching after visiting this many nodes
+    :return: list of chains of node indices from a root to the target, shortest first
+    """
+    if skip is None:
+        skip = lambda node: False  # noqa: E731
+
+    # node -> previous node towards a root and next node towards the target
+    forward: Dict[int, int] = {root: -1 for root in roots if not skip(root)}
+    backward: Dict[int, int] = {target: -1}
+    if target in forward:
+        return [[target]]
+
+    forward_frontier = list(forward)
+    backward_frontier = [target]
+    meetings: List[int] = []
+    depth = 0
+    while (
+        forward_frontier
+        and backward_frontier
+        and len(meetings) < count
+        and depth < max_depth
+        and len(forward) + len(backward) < max_visited
+    ):
+        depth += 1
+        frontier: List[int] = []
+        if len(forward_frontier) <= len(backward_frontier):
+            for node in forward_frontier:
+                for child in graph.child_indices(node):
+                    if child in forward or skip(child):
+                        continue
+                    forward[child] = node
+                    if child in backward:
+                        meetings.append(child)
+                    else:
+                        frontier.append(child)
+            forward_frontier = frontier
+        else:
+            for node in backward_frontier:
+                for parent in graph.parent_indices(node):
+                    if parent in backward or skip(parent):
+                        continue
+                    backward[parent] = node
+                    if parent in forward:
+                        meetings.append(parent)
+                    else:
+                        frontier.append(parent)
+            backward_frontier = frontier
+
+    paths = []
+    for node in meetings[:count]:
+        path = _walk(forward, node)
+        path.reverse()
+        path.extend(_walk(backward, backward[node]))
+        paths.append(path)
+    return paths
+
+
+def find_roots(graph: ReferenceGraph, group_of: Callable[[int], str]) -> List[int]:
+    """
+    Get the node indices chains of references may start from: modules, frames and
+    objects without parents.
+
+    :param graph: ::class::`ReferenceGraph`
+    :param group_of: returns the group of a node index
+    :return: list of node indices
+    """
+    parent_offsets = graph.parent_offsets
+    return LootList(
+        idx
+        for idx in range(len(graph))
+        if parent_offsets[idx] == parent_offsets[idx + 1]
+        or group_of(idx) in ROOT_GROUPS
+    )
+
+
+def paths_to_root(
+    graph: ReferenceGraph,
+    target: int,
+    roots: Iterable[int],
+    group_of: Callable[[int], str],
+    count: int = 1,
+    max_depth: int = 32,
+) -> List[List[int]]:
+    """
+    Find the shortest chains of references from a root to a target node.
+    Weak references are skipped and the `__dict__` of modules and instances is
+    left out of the chains.
+
+    :param graph: ::class::`ReferenceGraph`
+    :param target: node index of the target
+    :param roots: node indices returned by `find_roots`
+    :param group_of: returns the group of a node index
+    :param count: maximum number of chains to return
+    :param max_depth: maximum number of references in a chain
+    :return: list of chains of node indices from a root to the target
+    """
+
+    def is_attr_dict(idx: int, owner: int) -> bool:
+        # the `__dict__` of an instance is only referenced by its owner. The
+        # `__dict__` of a module is also referenced by the globals of its functions
+        if group_of(idx) != "builtins.dict":
+            return False
+        owner_group = group_of(owner)
+        if owner_group == "builtins.module":
+            return True
+        return (
+            owner_group not in _CONTAINER_GROUPS and len(graph.parent_indices(idx)) == 1
+        )
+
+    paths = shortest_paths(
+        graph,
+        target,
+        roots,
+        skip=lambda idx: group_of(idx) in NOISE_GROUPS,
+        count=count,
+        max_depth=max_depth,
+    )
+    return [
+        [
+            node
+            for pos, node in enumerate(path)
+            if pos == 0 or pos == len(path) - 1 or not is_attr_dict(node, path[pos - 1])
+        ]
+        for path in paths
+    ]
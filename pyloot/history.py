@@ -0,0 +1,443 @@
+import heapq
+import sys
+import time
+from abc import ABC
+from abc import abstractmethod
+from array import array
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyloot.types import LootDict
+from pyloot.types import LootList
+from pyloot.types import ObjectTypeHistory
+
+
+# (resolution in seconds, number of samples) of each rollup tier.
+# 10 minutes over a day and 1 hour over a week
+DEFAULT_TIERS: Tuple[Tuple[int, int], ...] = ((600, 144), (3600, 168))
+
+
+# a `(type_module, type_name)` key, the names being shared with other structures
+_KEY_SIZE = sys.getsizeof(("", ""))
+
+
+def _zeros(size: int) -> "array[int]":
+    return array("q", bytes(8 * size))
+
+
+class _RingBuffer(ABC):
+    """
+    Per type rows of `max_history` columns. Each column is a sample taken at
+    the time recorded in `_times`. Once full, the oldest column is reused.
+    """
+
+    # per row arrays, each holding `max_history` values per row
+    _row_fields: Tuple[str, ...] = ()
+    resolution: float = 0
+
+    def __init__(self, max_history: int):
+        self.max_history = max_history
+        self._rows: Dict[Tuple[str, str], int] = LootDict()
+        self._keys: List[Tuple[str, str]] = LootList()
+        self._times = array("d", bytes(8 * max_history))
+        for name in self._row_fields:
+            setattr(self, name, array("q"))
+        # column of the oldest sample and number of samples
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _add_rows(self, type_counts: Dict[Tuple[str, str], int]):
+        for key in type_counts:
+            if key not in self._rows:
+                # earlier samples of a new type are zeros
+                self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                for name in self._row_fields:
+                    getattr(self, name).extend(_zeros(self.max_history))
+
+    def _advance(self, timestamp: float) -> Tuple[int, bool]:
+        """
+        Start a new column
+
+        :return: the column and whether it replaced the oldest one
+        """
+        full = self._size == self.max_history
+        if full:
+            column = self._head
+            self._head = (self._head + 1) % self.max_history
+        else:
+            column = self._size
+            self._size += 1
+        self._times[column] = timestamp
+        return column, full
+
+    def _columns(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> List[int]:
+        """
+        Get columns from oldest to newest with `start <= time <= end`
+        """
+        columns = [
+            (self._head + offset) % self.max_history for offset in range(self._size)
+        ]
+        if start is not None:
+            columns = [column for column in columns if self._times[column] >= start]
+        if end is not None:
+            columns = [column for column in columns if self._times[column] <= end]
+        return columns
+
+    def oldest(self) -> Optional[float]:
+        if not self._size:
+            return None
+        return self._times[self._head]
+
+    @abstractmethod
+    def _get_last(self, row: int, column: int) -> int:
+        """
+        Get the count of a row in a column
+        """
+
+    @abstractmethod
+    def _get_history(self, row: int, columns: List[int]) -> ObjectTypeHistory:
+        """
+        Get the history of a row over columns, oldest first
+        """
+
+    def query(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
+        """
+        Get the history of the types with the highest last count
+
+        :param top: number of types to return. All types when `None` or <= 0
+        :param start: only include samples taken at or after this unix time
+        :param end: only include samples taken at or before this unix time
+        :return: list of ::class::`ObjectTypeHistory` by decreasing last count
+        """
+        columns = self._columns(start, end)
+        if not columns:
+            return []
+
+        last_column = columns[-1]
+        rows: Iterable[int] = range(len(self._keys))
+        key = lambda row: self._get_last(row, last_column)  # noqa: E731
+        if top is None or top <= 0:
+            rows = sorted(rows, key=key, reverse=True)
+        else:
+            rows = heapq.nlargest(top, rows, key=key)
+        return [self._get_history(row, columns) for row in rows]
+
+    def get_memory_usage(self) -> int:
+        """
+        Approximate number of bytes used by the rows and samples of this buffer
+        """
+        arrays = [values for values in vars(self).values() if isinstance(values, array)]
+        return (
+            sys.getsizeof(self._rows)
+            + sys.getsizeof(self._keys)
+            + len(self._keys) * _KEY_SIZE
+            + sum(len(values) * values.itemsize for values in arrays)
+        )
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this buffer which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self._times)
+        for name in self._row_fields:
+            yield id(getattr(self, name))
+
+
+class HistoryBuffer(_RingBuffer):
+    """
+    Object counts per type held in a ring buffer of `types x max_history` samples.
+
+    Every type has a row in a single flat array. Appending a sample writes one column
+    and rotates the buffer once it is full. Types missing from a sample are counted
+    as 0. The min and max count of each row are maintained incrementally.
+    """
+
+    _row_fields = ("_counts",)
+
+    def __init__(self, max_history: int = 300):
+        """
+        :param max_history: number of samples kept per type
+        """
+        super().__init__(max_history)
+        self._counts: "array[int]"
+        self._min = array("q")
+        self._max = array("q")
+
+    def append(
+        self, type_counts: Dict[Tuple[str, str], int], timestamp: Optional[float] = None
+    ):
+        """
+        Add a sample
+
+        :param type_counts: number of objects per `(type_module, type_name)`
+        :param timestamp: unix time of the sample. Defaults to now
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        rows = len(self._keys)
+        self._add_rows(type_counts)
+        for _ in range(rows, len(self._keys)):
+            self._min.append(0)
+            self._max.append(0)
+
+        first = self._size == 0
+        column, full = self._advance(timestamp)
+
+        width = self.max_history
+        counts = self._counts
+        mins = self._min
+        maxs = self._max
+        for row, key in enumerate(self._keys):
+            count = type_counts.get(key, 0)
+            pos = row * width + column
+            evicted = counts[pos]
+            counts[pos] = count
+            if first:
+                mins[row] = maxs[row] = count
+                continue
+
+            if count <= mins[row]:
+                mins[row] = count
+            elif full and evicted == mins[row]:
+                mins[row] = min(counts[row * width : (row + 1) * width])
+            if count >= maxs[row]:
+                maxs[row] = count
+            elif full and evicted == maxs[row]:
+                maxs[row] = max(counts[row * width : (row + 1) * width])
+
+    def _get_last(self, row: int, column: int) -> int:
+        return self._counts[row * self.max_history + column]
+
+    def _get_history(self, row: int, columns: List[int]) -> ObjectTypeHistory:
+        type_module, type_name = self._keys[row]
+        offset = row * self.max_history
+        counts = [self._counts[offset + column] for column in columns]
+        if len(columns) == self._size:
+            _min = self._min[row]
+            _max = self._max[row]
+        else:
+            _min = min(counts)
+            _max = max(counts)
+        return ObjectTypeHistory(
+            type_name=type_name,
+            type_module=type_module,
+            counts=counts,
+            min=_min,
+            max=_max,
+            timestamps=[self._times[column] for column in columns],
+        )
+
+    def top(self, count: Optional[int] = None) -> List[ObjectTypeHistory]:
+        return self.query(top=count)
+
+    def get_ids(self) -> Iterable[int]:
+        yield from super().get_ids()
+        yield id(self._min)
+        yield id(self._max)
+
+
+class RollupBuffer(_RingBuffer):
+    """
+    Object counts per type downsampled to one column per `resolution` seconds.
+
+    Each column holds the min, max, sum and last count of the samples taken during
+    its time bucket. Columns are reused once `max_history` buckets are stored.
+    """
+
+    _row_fields = ("_mins", "_maxs", "_sums", "_lasts")
+
+    def __init__(self, resolution: float, max_history: int):
+        """
+        :param resolution: seconds covered by each column
+        :param max_history: number of columns kept per type
+        """
+        super().__init__(max_history)
+        self.resolution = resolution
+        self._mins: "array[int]"
+        self._maxs: "array[int]"
+        self._sums: "array[int]"
+        self._lasts: "array[int]"
+        self._samples = _zeros(max_history)
+        self._bucket: Optional[int] = None
+        self._column = 0
+
+    def add(self, type_counts: Dict[Tuple[str, str], int], timestamp: float):
+        """
+        Add a sample to the bucket of `timestamp`. Samples older than the current
+        bucket are added to the current bucket.
+
+        :param type_counts: number of objects per `(type_module, type_name)`
+        :param timestamp: unix time of the sample
+        """
+        self._add_rows(type_counts)
+
+        width = self.max_history
+        bucket = int(timestamp // self.resolution)
+        if self._bucket is None or bucket > self._bucket:
+            self._bucket = bucket
+            self._column, _ = self._advance(bucket * self.resolution)
+            self._samples[self._column] = 0
+            for name in self._row_fields:
+                values = getattr(self, name)
+                for row in range(len(self._keys)):
+                    values[row * width + self._column] = 0
+
+        column = self._column
+        samples = self._samples[column]
+        mins = self._mins
+        maxs = self._maxs
+        sums = self._sums
+        lasts = self._lasts
+        for row, key in enumerate(self._keys):
+            count = type_counts.get(key, 0)
+            pos = row * width + column
+            if samples == 0:
+                mins[pos] = maxs[pos] = count
+            else:
+                if count < mins[pos]:
+                    mins[pos] = count
+                if count > maxs[pos]:
+                    maxs[pos] = count
+            sums[pos] += count
+            lasts[pos] = count
+        self._samples[column] = samples + 1
+
+    def _get_last(self, row: int, column: int) -> int:
+        return self._lasts[row * self.max_history + column]
+
+    def _get_history(self, row: int, columns: List[int]) -> ObjectTypeHistory:
+        type_module, type_name = self._keys[row]
+        offset = row * self.max_history
+        positions = [offset + column for column in columns]
+        mins = [self._mins[pos] for pos in positions]
+        maxs = [self._maxs[pos] for pos in positions]
+        return ObjectTypeHistory(
+            type_name=type_name,
+            type_module=type_module,
+            counts=[self._lasts[pos] for pos in positions],
+            min=min(mins),
+            max=max(maxs),
+            timestamps=[self._times[column] for column in columns],
+            mins=mins,
+            maxs=maxs,
+            means=[
+                self._sums[pos] / max(self._samples[column], 1)
+                for pos, column in zip(positions, columns)
+            ],
+        )
+
+    def get_ids(self) -> Iterable[int]:
+        yield from super().get_ids()
+        yield id(self._samples)
+
+
+class TieredHistory:
+    """
+    Raw history samples plus rollups kept at coarser resolutions so that long
+    time ranges cost a fixed amount of memory.
+    """
+
+    def __init__(
+        self, max_history: int = 300, tiers: Sequence[Tuple[int, int]] = DEFAULT_TIERS
+    ):
+        """
+        :param max_history: number of raw samples kept per type
+        :param tiers: `(resolution in seconds, number of samples)` of each rollup
+        """
+        self.raw = HistoryBuffer(max_history)
+        self.rollups = LootList(
+            RollupBuffer(resolution, size) for resolution, size in sorted(tiers)
+        )
+
+    def append(
+        self, type_counts: Dict[Tuple[str, str], int], timestamp: Optional[float] = None
+    ):
+        """
+        Add a sample to the raw history and to every rollup
+
+        :param type_counts: number of objects per `(type_module, type_name)`
+        :param timestamp: unix time of the sample. Defaults to now
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.raw.append(type_counts, timestamp)
+        for rollup in self.rollups:
+            rollup.add(type_counts, timestamp)
+
+    def _select(
+        self, start: Optional[float], resolution: Optional[float]
+    ) -> _RingBuffer:
+        buffers: List[_RingBuffer] = [self.raw]
+        buffers.extend(self.rollups)
+        if resolution is not None:
+            # the coarsest buffer which is at least as fine as requested
+            candidates = [b for b in buffers if b.resolution <= resolution]
+            return candidates[-1] if candidates else self.raw
+        if start is None:
+            return self.raw
+        # the finest buffer going back to `start`
+        for buffer in buffers:
+            oldest = buffer.oldest()
+            if oldest is not None and oldest <= start:
+                return buffer
+        return buffers[-1]
+
+    def query(
+        self,
+        top: Optional[int] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        resolution: Optional[float] = None,
+    ) -> List[ObjectTypeHistory]:
+        """
+        Get the history of the types with the highest last count
+
+        :param top: number of types to return. All types when `None` or <= 0
+        :param start: only include samples taken at or after this unix time
+        :param end: only include samples taken at or before this unix time
+        :param resolution: seconds in between samples. 0 for raw samples. Defaults
+            to the finest resolution covering `start`
+        :return: list of ::class::`ObjectTypeHistory` by decreasing last count
+        """
+        return self._select(start, resolution).query(top=top, start=start, end=end)
+
+    def get_memory_usage(self) -> int:
+        """
+        Approximate number of bytes used by the raw samples and the rollups
+        """
+        return self.raw.get_memory_usage() + sum(
+            rollup.get_memory_usage() for rollup in self.rollups
+        )
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this history which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self)
+        yield id(self.__dict__)
+        yield from self.raw.get_ids()
+        for rollup in self.rollups:
+            yield from rollup.get_ids()
@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable
+from typing import Deque
+from typing import Iterable
+from typing import Optional
+
+from pyloot.types import SenderMetrics
+from pyloot.utils import start_thread
+
+
+logger = logging.getLogger(__name__)
+
+
+class FatalSendError(Exception):
+    """
+    Raised by a send function when retrying would fail the same way
+    """
+
+
+class BackgroundSender:
+    """
+    Runs send jobs from a bounded queue in a background thread so that slow or
+    failing sends never block the caller. A job is called without arguments and
+    returns the number of bytes it sent.
+
+    When the queue is full, the oldest job is dropped. Failed jobs are called again
+    with exponential backoff unless they raise ::class::`FatalSendError`.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 2,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30,
+    ):
+        """
+        :param max_queue: number of jobs waiting to be sent before the oldest is
+            dropped
+        :param max_retries: number of times a failed send is retried
+        :param backoff: seconds before the first retry. Doubled on every retry
+        :param max_backoff: maximum seconds in between retries
+        """
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._queue: Deque[Callable[[], int]] = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self._busy = False
+        self._running = False
+        self._closed = False
+        # threads do not survive fork, a child process starts its own
+        self._pid: Optional[int] = None
+
+        self._sent = 0
+        self._dropped = 0
+        self._failed = 0
+        self._retries = 0
+        self._bytes_sent = 0
+        self._last_latency = 0.0
+        self._max_latency = 0.0
+
+    def put(self, job: Callable[[], int]):
+        """
+        Queue a job, dropping the oldest one when the queue is full
+        """
+        with self._cond:
+            if self._closed:
+                logger.warning("Sender is closed. Dropping job")
+                self._dropped += 1
+                return
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._running = True
+                start_thread(self._run)
+            if len(self._queue) == self._queue.maxlen:
+                self._dropped += 1
+                logger.warning("Send queue is full. Dropping the oldest job")
+            self._queue.append(job)
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued job was sent or given up on
+
+        :param timeout: maximum seconds to wait. Forever when `None`
+        :return: `False` if jobs are still queued after `timeout`
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._busy, timeout
+            )
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Send queued jobs then stop the background thread. Jobs queued afterwards
+        are dropped
+
+        :param timeout: maximum seconds to wait for queued jobs
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._running = False
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or not self._running)
+                if not self._running:
+                    return
+                job = self._queue.popleft()
+                self._busy = True
+            try:
+                self._send_with_retries(job)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _send_with_retries(self, job: Callable[[], int]):
+        delay = self._backoff
+        for attempt in range(self._max_retries + 1):
+            st = time.monotonic()
+            try:
+                size = job()
+            except FatalSendError:
+                logger.exception("Unable to send. Dropping job")
+                break
+            except Exception:  # pylint: disable=broad-except
+                if attempt == self._max_retries:
+                    logger.exception("Unable to send after %s retries", attempt)
+                    break
+                logger.warning("Error sending. Retrying in %ss", delay)
+                with self._cond:
+                    self._retries += 1
+                    stopped = self._cond.wait_for(lambda: not self._running, delay)
+                if stopped:
+                    break
+                delay = min(delay * 2, self._max_backoff)
+                continue
+
+            latency = time.monotonic() - st
+            with self._cond:
+                self._sent += 1
+                self._bytes_sent += size
+                self._last_latency = latency
+                self._max_latency = max(self._max_latency, latency)
+            return
+        with self._cond:
+            self._failed += 1
+
+    def get_metrics(self) -> SenderMetrics:
+        with self._cond:
+            return SenderMetrics(
+                queue_depth=len(self._queue) + self._busy,
+                sent=self._sent,
+                dropped=self._dropped,
+                failed=self._failed,
+                retries=self._retries,
+                bytes_sent=self._bytes_sent,
+                last_latency=self._last_latency,
+                max_latency=self._max_latency,
+            )
+
+    def get_ids(self) -> Iterable[int]:
+        yield id(self)
+        yield id(self.__dict__)
+        yield id(self._queue)
+        yield id(self._cond)
+        for job in list(self._queue):
+            get_ids = getattr(job, "get_ids", None)
+            if get_ids is not None:
+                yield from get_ids()
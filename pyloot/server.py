@@ -2,13 +2,15 @@ import gzip
 import json
 import logging
 import re
+import threading
+import zlib
 
 try:
     from importlib import resources
 except ImportError:
     import importlib_resources as resources  # type: ignore
 
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from wsgiref import simple_server
 
 from webob import exc
@@ -16,7 +18,16 @@ from webob import Request
 from webob import Response
 from webob import static
 
+from pyloot import wire
+from pyloot.backends.aggregate import AGGREGATES
+from pyloot.backends.aggregate import AggregateBackend
+from pyloot.backends.aggregate import DEFAULT_SOURCE
 from pyloot.backends.base import BaseBackend
+from pyloot.backends.http import BATCH_HEADER
+from pyloot.backends.http import CHUNK_SIZE
+from pyloot.backends.http import DELTA_HEADER
+from pyloot.backends.http import NDJSON
+from pyloot.backends.http import SOURCE_HEADER
 from pyloot.backends.memory import InMemoryBackend
 from pyloot.types import ObjectDescriptor
 
@@ -35,6 +46,96 @@ def _get_param(req: Request, name: str, default=None, typ=None):
     return val
 
 
+def _iter_chunks(stream, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Decompress a gzip stream without reading it whole
+    """
+    decompressor = zlib.decompressobj(wbits=47)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        yield decompressor.decompress(chunk)
+    yield decompressor.flush()
+
+
+def _iter_lines(stream, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Decompress a gzip stream of lines without reading it whole
+    """
+    pending = b""
+    for chunk in _iter_chunks(stream, chunk_size):
+        *lines, pending = (pending + chunk).split(b"\n")
+        yield from lines
+    if pending.strip():
+        yield pending
+
+
+class _ChunkedReader:
+    """
+    Decodes a request body sent with chunked transfer encoding, for servers such
+    as `wsgiref` which pass it through as is
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._left = 0
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        data = bytearray()
+        while not self._done and (size < 0 or len(data) < size):
+            if self._left == 0:
+                line = self._stream.readline()
+                self._left = int(line.split(b";", 1)[0].strip() or b"0", 16)
+                if self._left == 0:
+                    # skip trailers up to the final empty line
+                    while self._stream.readline().strip():
+                        pass
+                    self._done = True
+                    break
+            want = self._left if size < 0 else min(self._left, size - len(data))
+            chunk = self._stream.read(want)
+            if not chunk:
+                raise ValueError("Truncated chunked request body")
+            data += chunk
+            self._left -= len(chunk)
+            if self._left == 0:
+                self._stream.readline()
+        return bytes(data)
+
+
+def _dechunk(app):
+    def wrapper(environ, start_response):
+        if environ.get("HTTP_TRANSFER_ENCODING", "").lower() == "chunked":
+            environ["wsgi.input"] = _ChunkedReader(environ["wsgi.input"])
+            environ["wsgi.input_terminated"] = True
+        return app(environ, start_response)
+
+    return wrapper
+
+
+class _PendingUpload:
+    """
+    Batches of a snapshot received so far from one source
+    """
+
+    def __init__(self, snapshot: int, count: int):
+        self.snapshot = snapshot
+        self.count = count
+        self.batches: Dict[int, List[ObjectDescriptor]] = {}
+        self.type_counts: Optional[Dict[Tuple[str, str], int]] = None
+        self.removed_ids: List[int] = []
+
+
+def _get_source(req: Request) -> str:
+    return req.headers.get(SOURCE_HEADER) or DEFAULT_SOURCE
+
+
+def _parse_type_counts(items: List[Dict]) -> Dict[Tuple[str, str], int]:
+    return {(item["type_module"], item["type_name"]): item["count"] for item in items}
+
+
 class PyLootServer:
     def __init__(
         self, backend: Optional[BaseBackend] = None, disable_response_gzip: bool = False
@@ -42,11 +143,18 @@ class PyLootServer:
         self._handlers = {
             ("GET", "/static/[a-z0-9._-]+"): self._static,
             ("GET", "/api/history"): self._get_history,
+            ("POST", "/api/history"): self._post_history,
             ("GET", "/api/objects"): self._get_objects,
             ("POST", "/api/objects"): self._post_objects,
             ("GET", "/api/objects/([0-9]+)"): self._get_object_by_id,
             ("GET", "/api/objects/([0-9]+)/children"): self._get_object_children,
             ("GET", "/api/objects/([0-9]+)/parents"): self._get_object_parents,
+            ("GET", "/api/objects/([0-9]+)/retained"): self._get_object_retained,
+            ("GET", "/api/objects/([0-9]+)/path-to-root"): self._get_object_paths,
+            ("GET", "/api/retainers"): self._get_retainers,
+            ("GET", "/api/snapshots"): self._get_snapshots,
+            ("GET", "/api/diff"): self._get_diff,
+            ("GET", "/api/sources"): self._get_sources,
         }
         if backend:
             self._storage = backend
@@ -54,10 +162,32 @@ class PyLootServer:
             self._storage = InMemoryBackend()
 
         self._disable_response_gzip: bool = disable_response_gzip
+        # source -> snapshot uploaded in batches which is not complete yet
+        self._uploads: Dict[str, _PendingUpload] = {}
+        # source -> last snapshot stored, which the next delta applies to. The
+        # objects themselves are only held by the backend
+        self._deltas: Dict[str, int] = {}
+        self._uploads_lock = threading.Lock()
 
     def get_backend(self) -> BaseBackend:
         return self._storage
 
+    def _get_storage(self, req: Request) -> Optional[BaseBackend]:
+        """
+        Backend serving a request. `?source=` selects the backend of one process
+        when uploads are kept per source
+
+        :return: the backend or `None` if the source is unknown
+        """
+        source = _get_param(req, "source")
+        if (
+            req.method == "GET"
+            and source
+            and isinstance(self._storage, AggregateBackend)
+        ):
+            return self._storage.get_source(source)
+        return self._storage
+
     def _make_response(
         self, data: ResponseData, status: Optional[int] = None
     ) -> Response:
@@ -66,6 +196,32 @@ class PyLootServer:
             response.encode_content()
         return response
 
+    @staticmethod
+    def _set_version(response: Response, version: str):
+        # weak since the body depends on the negotiated format and encoding
+        response.etag = (version, False)
+        response.cache_control = "no-cache"
+        response.vary = ("Accept", "Accept-Encoding")
+
+    def _not_modified(self, version: str) -> Response:
+        response = Response(status=304)
+        self._set_version(response, version)
+        del response.content_type
+        return response
+
+    def _make_objects_response(
+        self, req: Request, items: List[ObjectDescriptor]
+    ) -> Response:
+        offers = req.accept.acceptable_offers(["application/json", wire.MEDIA_TYPE])
+        if offers and offers[0][0] == wire.MEDIA_TYPE:
+            response = Response(
+                body=wire.encode(items), content_type=wire.MEDIA_TYPE, charset=None
+            )
+            if not self._disable_response_gzip:
+                response.encode_content()
+            return response
+        return self._make_response([item._asdict() for item in items])
+
     def __call__(self, environ, start_response):
         if isinstance(self._storage, InMemoryBackend):
             assert not environ["wsgi.multiprocess"], (
@@ -91,40 +247,248 @@ class PyLootServer:
             method, handler_pattern = handler_spec
             match = re.fullmatch(handler_pattern, req.path_info.rstrip("/"))
             if method == req.method and match:
+                if method == "POST" and self._storage.read_only:
+                    return exc.HTTPMethodNotAllowed("Backend is read-only")(
+                        environ, start_response
+                    )
+                storage = self._get_storage(req)
+                if storage is None:
+                    return exc.HTTPNotFound("Source not found")(environ, start_response)
+                req.environ["pyloot.storage"] = storage
+                # read before the handler so that a store in between only makes
+                # the next request miss
+                version = None
+                if method == "GET" and req.path_info.startswith("/api/"):
+                    version = storage.get_version()
+                if version is not None and version in req.if_none_match:
+                    logger.info("[_dispatch] %s not modified", req.path_info)
+                    return self._not_modified(version)(environ, start_response)
                 logger.info(
                     "[_dispatch] %s handler=%s", req.path_info, handler.__name__
                 )
-                return handler(req, *match.groups())(environ, start_response)
+                response = handler(req, *match.groups())
+                if version is not None and response.status_code == 200:
+                    self._set_version(response, version)
+                return response(environ, start_response)
         return exc.HTTPNotFound("No endpoint found")(environ, start_response)
 
     def _get_history(self, req: Request) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
         top = _get_param(req, "top", typ=int)
-        items = self._storage.fetch_history(top=top)
+        start = _get_param(req, "start", typ=float)
+        end = _get_param(req, "end", typ=float)
+        resolution = _get_param(req, "resolution", typ=float)
+        aggregate = _get_param(req, "aggregate")
+        if aggregate and isinstance(storage, AggregateBackend):
+            if aggregate not in AGGREGATES:
+                return self._make_response(
+                    dict(error="Unknown aggregate {}".format(aggregate)), status=400
+                )
+            items = storage.fetch_history(
+                top=top,
+                start=start,
+                end=end,
+                resolution=resolution,
+                aggregate=aggregate,
+            )
+        else:
+            items = storage.fetch_history(
+                top=top, start=start, end=end, resolution=resolution
+            )
         data = [item._asdict() for item in items]
-        logger.info("[history] returning %s items [top=%s]", len(data), top)
+        logger.info(
+            "[history] returning %s items [top=%s resolution=%s]",
+            len(data),
+            top,
+            resolution,
+        )
         return self._make_response(data)
 
+    def _post_history(self, req: Request) -> Response:
+        data = gzip.GzipFile(fileobj=req.body_file).read().decode(req.charset)
+        type_counts = _parse_type_counts(json.loads(data))
+        if isinstance(self._storage, AggregateBackend):
+            self._storage.store_counts(type_counts, source=_get_source(req))
+        else:
+            self._storage.store_counts(type_counts)
+        logger.info("[history] stored %s counts", len(type_counts))
+        return self._make_response({})
+
     def _get_objects(self, req: Request) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
         limit = _get_param(req, "limit", typ=int)
         group = _get_param(req, "group")
         if group:
-            items = self._storage.fetch_by_group(group, limit=limit)
+            offset = _get_param(req, "offset", default=0, typ=int)
+            items = storage.fetch_by_group(group, limit=limit, offset=offset)
         else:
-            items = self._storage.fetch(limit=limit)
-        data = [item._asdict() for item in items]
-        logger.info("[objects] returning %s items [group=%s]", len(data), group)
-        return self._make_response(data)
+            items = storage.fetch(limit=limit)
+        logger.info("[objects] returning %s items [group=%s]", len(items), group)
+        return self._make_objects_response(req, items)
 
     def _post_objects(self, req: Request) -> Response:
-        data = gzip.GzipFile(fileobj=req.body_file).read().decode(req.charset)
-        items = json.loads(data)
-        items = [ObjectDescriptor(**item) for item in items]
-        self._storage.store(items)
-        logger.info("[objects] stored %s items", len(items))
-        return self._make_response({})
+        if not req.is_body_readable:
+            return self._make_response(dict(error="Missing request body"), status=411)
+        type_counts = None
+        removed_ids: List[int] = []
+        if req.content_type == wire.MEDIA_TYPE:
+            items = []
+            try:
+                for record in wire.decode_stream(_iter_chunks(req.body_file)):
+                    if isinstance(record, ObjectDescriptor):
+                        items.append(record)
+                    elif isinstance(record, dict):
+                        type_counts = record
+                    else:
+                        removed_ids.extend(record)
+            except wire.WireError as e:
+                return self._make_response(dict(error=str(e)), status=400)
+        elif req.content_type == NDJSON:
+            items = []
+            for line in _iter_lines(req.body_file):
+                item = json.loads(line)
+                if "type_counts" in item:
+                    type_counts = _parse_type_counts(item["type_counts"])
+                elif "removed_ids" in item:
+                    removed_ids.extend(item["removed_ids"])
+                else:
+                    items.append(ObjectDescriptor(**item))
+        elif req.content_type in ("", "application/json"):
+            data = gzip.GzipFile(fileobj=req.body_file).read().decode(req.charset)
+            items = json.loads(data)
+            if isinstance(items, dict):
+                type_counts = _parse_type_counts(items["type_counts"])
+                items = items["objects"]
+            items = [ObjectDescriptor(**item) for item in items]
+        else:
+            return self._make_response(
+                dict(error="Unsupported content type {}".format(req.content_type)),
+                status=415,
+            )
+
+        source = _get_source(req)
+        snapshot = 0
+        delta = req.headers.get(DELTA_HEADER)
+        base = None if delta is None else int(delta)
+        batch = req.headers.get(BATCH_HEADER)
+        if batch:
+            snapshot, index, count = map(int, batch.split(":"))
+        if base and not self._has_base(source, base):
+            logger.info("[objects] missing snapshot %s of %s", base, source)
+            return self._make_response(
+                dict(error="Snapshot {} not found".format(base)), status=409
+            )
+
+        if batch:
+            upload = self._add_batch(
+                source, snapshot, index, count, items, type_counts, removed_ids
+            )
+            if upload is None:
+                logger.info("[objects] received batch %s of %s", index + 1, count)
+                return self._make_response({})
+            items = [item for idx in range(count) for item in upload.batches[idx]]
+            type_counts = upload.type_counts
+            removed_ids = upload.removed_ids
+
+        if base is None:
+            with self._uploads_lock:
+                self._deltas.pop(source, None)
+        elif not self._apply_delta(source, snapshot, base):
+            return self._make_response(
+                dict(error="Snapshot {} not found".format(base)), status=409
+            )
+
+        if base:
+            if isinstance(self._storage, AggregateBackend):
+                self._storage.store_delta(
+                    items, removed_ids, type_counts=type_counts, source=source
+                )
+            else:
+                self._storage.store_delta(items, removed_ids, type_counts=type_counts)
+            logger.info(
+                "[objects] applied %s items and %s removed ids to snapshot %s",
+                len(items),
+                len(removed_ids),
+                base,
+            )
+        else:
+            if isinstance(self._storage, AggregateBackend):
+                self._storage.store(items, type_counts=type_counts, source=source)
+            else:
+                self._storage.store(items, type_counts=type_counts)
+            logger.info("[objects] stored %s items", len(items))
+        response = self._make_response({})
+        if base is not None:
+            response.headers[DELTA_HEADER] = str(snapshot)
+        return response
+
+    def _has_base(self, source: str, base: int) -> bool:
+        # the objects of an expired source are gone with its backend
+        if (
+            isinstance(self._storage, AggregateBackend)
+            and self._storage.get_source(source) is None
+        ):
+            return False
+        with self._uploads_lock:
+            return self._deltas.get(source) == base
 
-    def _get_object_by_id(self, _: Request, _id: str) -> Response:
-        item = self._storage.fetch_by_id(int(_id))
+    def _apply_delta(self, source: str, snapshot: int, base: int) -> bool:
+        """
+        Record that snapshot `snapshot` of a source is stored on top of snapshot
+        `base`. A `base` of 0 starts from no objects.
+
+        :return: `False` if `base` is not the last snapshot of the source
+        """
+        if base and not self._has_base(source, base):
+            with self._uploads_lock:
+                self._deltas.pop(source, None)
+            return False
+        with self._uploads_lock:
+            if base and self._deltas.get(source) != base:
+                self._deltas.pop(source, None)
+                return False
+            self._deltas[source] = snapshot
+            # forget processes dropped by the backend
+            if isinstance(self._storage, AggregateBackend):
+                for name in list(self._deltas):
+                    if name != source and self._storage.get_source(name) is None:
+                        del self._deltas[name]
+            return True
+
+    def _add_batch(
+        self,
+        source: str,
+        snapshot: int,
+        index: int,
+        count: int,
+        items: List[ObjectDescriptor],
+        type_counts: Optional[Dict[Tuple[str, str], int]],
+        removed_ids: List[int],
+    ) -> Optional[_PendingUpload]:
+        """
+        Keep a batch until every batch of its snapshot was received. A batch sent
+        again replaces the previous copy and a new snapshot from the same source
+        discards an incomplete one.
+
+        :return: the complete upload or `None` if batches are missing
+        """
+        with self._uploads_lock:
+            upload = self._uploads.get(source)
+            if upload is None or upload.snapshot != snapshot:
+                upload = self._uploads[source] = _PendingUpload(snapshot, count)
+            upload.batches[index] = items
+            if type_counts is not None:
+                upload.type_counts = type_counts
+            if removed_ids:
+                upload.removed_ids = removed_ids
+            if len(upload.batches) < upload.count:
+                return None
+            del self._uploads[source]
+            return upload
+
+    def _get_object_by_id(self, req: Request, _id: str) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        item = storage.fetch_by_id(int(_id))
         status = None
         if item:
             data = item._asdict()
@@ -136,18 +500,79 @@ class PyLootServer:
 
         return self._make_response(data, status=status)
 
-    def _get_object_children(self, _: Request, _id: str) -> Response:
-        items = self._storage.fetch_children_of(int(_id))
+    def _get_object_children(self, req: Request, _id: str) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        items = storage.fetch_children_of(int(_id))
+        logger.info("[object children] returning %s items [id=%s]", len(items), _id)
+
+        return self._make_objects_response(req, items)
+
+    def _get_object_parents(self, req: Request, _id: str) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        items = storage.fetch_parents_of(int(_id))
+        logger.info("[object parents] returning %s items [id=%s]", len(items), _id)
+
+        return self._make_objects_response(req, items)
+
+    def _get_object_paths(self, req: Request, _id: str) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        count = _get_param(req, "count", default=1, typ=int)
+        max_depth = _get_param(req, "max_depth", default=32, typ=int)
+        paths = storage.fetch_paths_to_root(int(_id), count=count, max_depth=max_depth)
+        data = [[item._asdict() for item in path] for path in paths]
+        logger.info("[object paths] returning %s paths [id=%s]", len(data), _id)
+
+        return self._make_response(data)
+
+    def _get_object_retained(self, req: Request, _id: str) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        item = storage.fetch_retained(int(_id))
+        status = None
+        if item:
+            data = item._asdict()
+            logger.info("[object retained] found %s [%s]", _id, item.retained_size)
+        else:
+            logger.error("[object retained] not found %s", _id)
+            status = 404
+            data = dict(error="Item not found")
+
+        return self._make_response(data, status=status)
+
+    def _get_retainers(self, req: Request) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        top = _get_param(req, "top", default=100, typ=int)
+        items = storage.fetch_top_retainers(top=top)
         data = [item._asdict() for item in items]
-        logger.info("[object children] returning %s items [id=%s]", len(data), _id)
+        logger.info("[retainers] returning %s items [top=%s]", len(data), top)
+        return self._make_response(data)
 
+    def _get_snapshots(self, req: Request) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        items = storage.fetch_snapshots()
+        data = [item._asdict() for item in items]
+        logger.info("[snapshots] returning %s items", len(data))
         return self._make_response(data)
 
-    def _get_object_parents(self, _: Request, _id: str) -> Response:
-        items = self._storage.fetch_parents_of(int(_id))
+    def _get_diff(self, req: Request) -> Response:
+        storage: BaseBackend = req.environ["pyloot.storage"]
+        start = _get_param(req, "from", default=-2, typ=int)
+        end = _get_param(req, "to", default=-1, typ=int)
+        max_ids = _get_param(req, "max_ids", default=100, typ=int)
+        items = storage.fetch_diff(start=start, end=end, max_ids=max_ids)
+        if items is None:
+            logger.error("[diff] not found %s %s", start, end)
+            return self._make_response(dict(error="Snapshot not found"), status=404)
+
         data = [item._asdict() for item in items]
-        logger.info("[object parents] returning %s items [id=%s]", len(data), _id)
+        logger.info("[diff] returning %s items [from=%s to=%s]", len(data), start, end)
+        return self._make_response(data)
 
+    def _get_sources(self, _: Request) -> Response:
+        items = []
+        if isinstance(self._storage, AggregateBackend):
+            items = self._storage.fetch_sources()
+        data = [item._asdict() for item in items]
+        logger.info("[sources] returning %s items", len(data))
         return self._make_response(data)
 
     def _static(self, req: Request):
@@ -163,7 +588,7 @@ class PyLootServer:
                 return static.DirectoryApp(path)
 
     def serve_forever(self, host: str = "0.0.0.0", port: int = 8000):
-        httpd = simple_server.make_server(host, port, self)
+        httpd = simple_server.make_server(host, port, _dechunk(self))
         try:
             logger.info("Starting PyLoot Server at http://%s:%s", host, port)
             httpd.serve_forever()
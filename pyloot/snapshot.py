@@ -0,0 +1,421 @@
+"""
+Binary snapshot files.
+
+A snapshot is written in little-endian byte order as a header followed by sections:
+
+- string offsets: `n_strings + 1` int64 offsets in the string data
+- types: `(module string, name string, exact count)` per type
+- ids: sorted int64 ids of the objects
+- records: one fixed-width record per object, in the order of `ids`
+- child offsets, child ids, parent offsets and parent node indices of the
+  ::class::`pyloot.graph.ReferenceGraph`
+- string data: utf-8
+- blobs: repr and attrs of each object as a JSON list
+
+Every section before the string data is a multiple of 8 bytes so numeric sections
+are read through `mmap` as zero-copy `memoryview`s. Big-endian hosts read byte
+swapped copies instead.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyloot.diff import diff
+from pyloot.diff import SnapshotIndex
+from pyloot.graph import ReferenceGraph
+from pyloot.types import GroupDiff
+from pyloot.types import LootList
+from pyloot.types import ObjectDescriptor
+
+
+MAGIC = b"PYLOOTSN"
+VERSION = 1
+
+# magic, version, timestamp, number of: strings, types, objects, child edges,
+# parent edges, bytes of string data, bytes of blobs
+_HEADER = struct.Struct("<8sQdQQQQQQQ")
+# seen, size, blob offset, blob size, type, obj_name string, flags
+_RECORD = struct.Struct("<dqqqIII4x")
+# position of the size and type fields in a record cast to int64 and uint32
+_SIZE_FIELD = 1
+_TYPE_FIELD = 8
+_TYPE = struct.Struct("<IIq")
+
+_LAZY = 1
+_STALE = 2
+
+# numeric sections are cast in place only when the host is little-endian
+_NATIVE = sys.byteorder == "little"
+
+
+def _little_endian(values: Sequence[int]) -> Sequence[int]:
+    if _NATIVE:
+        return values
+    values = array("q", values)
+    values.byteswap()
+    return values
+
+
+class _StringTable:
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.offsets = array("q", [0])
+        self.data = bytearray()
+
+    def add(self, text: str) -> int:
+        idx = self.index.get(text)
+        if idx is None:
+            idx = self.index[text] = len(self.index)
+            self.data += text.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return idx
+
+
+def write_snapshot(
+    path: str,
+    descriptors: Iterable[ObjectDescriptor],
+    type_counts: Optional[Dict[Tuple[str, str], int]] = None,
+    timestamp: Optional[float] = None,
+    graph: Optional[ReferenceGraph] = None,
+):
+    """
+    Write descriptors to a snapshot file. The file is replaced atomically.
+
+    :param path: path of the snapshot file
+    :param descriptors: list of ::class::`ObjectDescriptor`. When an id is repeated,
+        the first descriptor wins
+    :param type_counts: exact number of objects per `(type_module, type_name)`
+        when `descriptors` is only a sample. Counted from `descriptors` otherwise
+    :param timestamp: unix time of the snapshot. Defaults to now
+    :param graph: references of `descriptors`, as built by
+        ::meth::`ReferenceGraph.from_descriptors`. Built when not given
+    """
+    nodes: Dict[int, ObjectDescriptor] = {}
+    for descr in descriptors:
+        nodes.setdefault(descr.id, descr)
+    items = [nodes[_id] for _id in sorted(nodes)]
+    del nodes
+    if graph is None:
+        graph = ReferenceGraph.from_descriptors(items)
+    if type_counts is None:
+        type_counts = Counter((descr.type_module, descr.type_name) for descr in items)
+
+    strings = _StringTable()
+    type_index: Dict[Tuple[str, str], int] = {}
+    type_data = bytearray()
+
+    def add_type(key: Tuple[str, str]) -> int:
+        idx = type_index.get(key)
+        if idx is None:
+            idx = type_index[key] = len(type_index)
+            type_module, type_name = key
+            type_data.extend(
+                _TYPE.pack(
+                    strings.add(type_module),
+                    strings.add(type_name),
+                    type_counts.get(key, 0),  # type: ignore
+                )
+            )
+        return idx
+
+    for key in type_counts:
+        add_type(key)
+
+    records = bytearray()
+    blobs = bytearray()
+    for descr in items:
+        blob = json.dumps([descr.repr, descr.attrs]).encode("utf-8")
+        flags = (_LAZY if descr.lazy else 0) | (_STALE if descr.stale else 0)
+        records += _RECORD.pack(
+            descr.seen or 0,
+            descr.size,
+            len(blobs),
+            len(blob),
+            add_type((descr.type_module, descr.type_name)),
+            strings.add(descr.obj_name),
+            flags,
+        )
+        blobs += blob
+    del items
+
+    header = _HEADER.pack(
+        MAGIC,
+        VERSION,
+        time.time() if timestamp is None else timestamp,
+        len(strings.index),
+        len(type_index),
+        len(graph),
+        len(graph.child_edges),
+        len(graph.parent_edges),
+        len(strings.data),
+        len(blobs),
+    )
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(_little_endian(strings.offsets))
+        f.write(type_data)
+        f.write(_little_endian(graph.ids))
+        f.write(records)
+        for values in (
+            graph.child_offsets,
+            graph.child_edges,
+            graph.parent_offsets,
+            graph.parent_edges,
+        ):
+            f.write(_little_endian(values))
+        f.write(strings.data)
+        f.write(blobs)
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """
+    Snapshot file mapped in memory. Sections are read in place and descriptors are
+    decoded on access.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: path of a file written by `write_snapshot`
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: List[memoryview] = LootList()
+        view = self._view(0, len(self._mmap))
+
+        (
+            magic,
+            version,
+            self.timestamp,
+            n_strings,
+            n_types,
+            n_nodes,
+            n_child_edges,
+            n_parent_edges,
+            string_size,
+            blob_size,
+        ) = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a pyloot snapshot".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError("{} has unsupported version {}".format(path, version))
+
+        pos = _HEADER.size
+
+        def section(size: int, fmt: Optional[str] = None) -> memoryview:
+            nonlocal pos
+            start = pos
+            pos += size
+            return self._view(start, pos, fmt)
+
+        self._string_offsets = section(8 * (n_strings + 1), "q")
+        self._types = section(_TYPE.size * n_types)
+        ids = section(8 * n_nodes, "q")
+        self._records = section(_RECORD.size * n_nodes)
+        child_offsets = section(8 * (n_nodes + 1), "q")
+        child_edges = section(8 * n_child_edges, "q")
+        parent_offsets = section(8 * (n_nodes + 1), "q")
+        parent_edges = section(8 * n_parent_edges, "q")
+        self._strings = section(string_size)
+        self._blobs = section(blob_size)
+
+        self.graph = ReferenceGraph(
+            ids, child_offsets, child_edges, parent_offsets, parent_edges
+        )
+        self._type_keys: List[Tuple[str, str]] = LootList(
+            (self.string(module), self.string(name))
+            for module, name, _ in _TYPE.iter_unpack(self._types)
+        )
+        self._groups: List[str] = LootList(
+            "{}.{}".format(*key) for key in self._type_keys
+        )
+
+    def _view(self, start: int, end: int, fmt: Optional[str] = None) -> memoryview:
+        view = memoryview(self._mmap)[start:end]
+        if fmt is not None:
+            if not _NATIVE:
+                values = array(fmt, view.tobytes())
+                values.byteswap()
+                view.release()
+                view = memoryview(values)
+            else:
+                view = view.cast(fmt)
+        self._views.append(view)
+        return view
+
+    def _record_field(self, fmt: str, field: int) -> Sequence[int]:
+        # one field of every record, read in place
+        values = self._records.cast(fmt)
+        view = values[field :: _RECORD.size // values.itemsize]
+        self._views.extend((values, view))
+        return view
+
+    def __len__(self) -> int:
+        return len(self.graph)
+
+    def close(self):
+        """
+        Release the mapping. Views still referenced elsewhere keep it alive until
+        they are garbage collected.
+        """
+        for view in self._views:
+            try:
+                view.release()
+            except BufferError:
+                pass
+        self._views.clear()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def string(self, idx: int) -> str:
+        start, end = self._string_offsets[idx], self._string_offsets[idx + 1]
+        return str(self._strings[start:end], "utf-8")
+
+    def _record(self, idx: int) -> Tuple:
+        return _RECORD.unpack_from(self._records, idx * _RECORD.size)
+
+    def seen_of(self, idx: int) -> float:
+        return self._record(idx)[0]
+
+    def size_of(self, idx: int) -> int:
+        return self._record(idx)[1]
+
+    def type_key_of(self, idx: int) -> Tuple[str, str]:
+        """
+        :param idx: node index
+        :return: `(type_module, type_name)` of a node
+        """
+        return self._type_keys[self._record(idx)[4]]
+
+    def group_of(self, idx: int) -> str:
+        return self._groups[self._record(idx)[4]]
+
+    def get_sizes(self) -> Sequence[int]:
+        """
+        Get the shallow size of every node
+        """
+        if _NATIVE:
+            return self._record_field("q", _SIZE_FIELD)
+        return array("q", (record[1] for record in _RECORD.iter_unpack(self._records)))
+
+    def get_types(self) -> Sequence[int]:
+        """
+        Get the type index of every node
+        """
+        if _NATIVE:
+            return self._record_field("I", _TYPE_FIELD)
+        return array("q", (record[4] for record in _RECORD.iter_unpack(self._records)))
+
+    def get_type_counts(self) -> Dict[Tuple[str, str], int]:
+        """
+        Get the exact number of objects per `(type_module, type_name)`
+        """
+        return {
+            key: count
+            for key, (_, _, count) in zip(
+                self._type_keys, _TYPE.iter_unpack(self._types)
+            )
+        }
+
+    def descriptor(self, idx: int) -> ObjectDescriptor:
+        """
+        Decode the descriptor of a node
+
+        :param idx: node index
+        :return: ::class::`ObjectDescriptor`
+        """
+        (
+            seen,
+            size,
+            blob_offset,
+            blob_size,
+            type_idx,
+            obj_name,
+            flags,
+        ) = _RECORD.unpack_from(self._records, idx * _RECORD.size)
+        text, attrs = json.loads(
+            str(self._blobs[blob_offset : blob_offset + blob_size], "utf-8")
+        )
+        graph = self.graph
+        type_module, type_name = self._type_keys[type_idx]
+        return ObjectDescriptor(
+            repr=text,
+            type_name=type_name,
+            type_module=type_module,
+            obj_name=self.string(obj_name),
+            id=graph.ids[idx],
+            attrs=attrs,
+            parent_ids=[graph.ids[parent] for parent in graph.parent_indices(idx)],
+            child_ids=graph.children_of(graph.ids[idx]),
+            seen=seen,
+            lazy=bool(flags & _LAZY),
+            stale=bool(flags & _STALE),
+            size=size,
+        )
+
+    def get_index(self, number: int = 1) -> SnapshotIndex:
+        """
+        :param number: number given to the snapshot
+        :return: ::class::`SnapshotIndex` reading ids, types and sizes in place
+        """
+        return SnapshotIndex(
+            number,
+            self.timestamp,
+            self.graph.ids,
+            self.get_types(),
+            self.get_sizes(),
+            self._type_keys,
+            self.get_type_counts(),
+        )
+
+    def get_ids(self) -> Iterable[int]:
+        """
+        Get object ids held by this snapshot which should be ignored when
+        collecting objects.
+
+        :return: Iterable of int ids generated by `id()`
+        """
+        yield id(self.__dict__)
+        yield id(self._mmap)
+        yield from self.graph.get_ids()
+        # views, type keys and groups are excluded by type
+
+
+def top_groups(snapshot: Snapshot, count: Optional[int] = None) -> List[GroupDiff]:
+    """
+    Get the groups with the most objects of a snapshot, as a diff from nothing
+
+    :param snapshot: ::class::`Snapshot`
+    :param count: number of groups to return. All groups when `None`
+    :return: list of ::class::`GroupDiff` by decreasing count
+    """
+    return diff(None, snapshot.get_index(), max_ids=0)[:count]
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot, max_ids: int = 100) -> List[GroupDiff]:
+    """
+    Compare two snapshot files group by group
+
+    :param old: ::class::`Snapshot` taken first
+    :param new: ::class::`Snapshot` taken last
+    :param max_ids: maximum number of new and freed ids returned per group
+    :return: list of ::class::`GroupDiff` by decreasing count delta
+    """
+    return diff(old.get_index(), new.get_index(), max_ids=max_ids)
@@ -4,6 +4,24 @@ from typing import NamedTuple
 from typing import Optional
 
 
+class LootDict(dict):
+    """
+    dict holding pyloot's own data. Like every object whose type is defined in
+    pyloot, instances are never collected.
+    """
+
+    __slots__ = ()
+
+
+class LootList(list):
+    """
+    list holding pyloot's own data. Like every object whose type is defined in
+    pyloot, instances are never collected.
+    """
+
+    __slots__ = ()
+
+
 class ObjectDescriptor(NamedTuple):
     repr: str
     type_name: str
@@ -14,6 +32,9 @@ class ObjectDescriptor(NamedTuple):
     parent_ids: List[int]
     child_ids: List[int]
     seen: Optional[float] = None
+    lazy: bool = False
+    stale: bool = False
+    size: int = 0
 
     @property
     def group(self):
@@ -26,3 +47,69 @@ class ObjectTypeHistory(NamedTuple):
     counts: List[int]
     min: int
     max: int
+    timestamps: Optional[List[float]] = None
+    # only set for rollups, per sample
+    mins: Optional[List[int]] = None
+    maxs: Optional[List[int]] = None
+    means: Optional[List[float]] = None
+
+
+class RetainedSize(NamedTuple):
+    id: int
+    type_name: str
+    type_module: str
+    size: int
+    retained_size: int
+    dominator_id: Optional[int]
+
+
+class GroupDiff(NamedTuple):
+    type_name: str
+    type_module: str
+    # objects of the later snapshot which are not in the earlier one, and
+    # the other way around
+    new: int
+    freed: int
+    count: int
+    count_delta: int
+    size_delta: int
+    # up to `max_ids` of the new and freed ids, sorted
+    new_ids: Optional[List[int]] = None
+    freed_ids: Optional[List[int]] = None
+
+
+class SnapshotInfo(NamedTuple):
+    number: int
+    timestamp: float
+    # exact number of objects and number of described objects
+    count: int
+    described: int
+
+
+class SourceInfo(NamedTuple):
+    # "host:pid" of the process which uploaded
+    source: str
+    last_seen: float
+    # number of objects in the last upload
+    count: int
+
+
+class SenderMetrics(NamedTuple):
+    # items waiting to be sent, including the one being sent
+    queue_depth: int
+    sent: int
+    # dropped when the queue was full and given up on after retries
+    dropped: int
+    failed: int
+    retries: int
+    bytes_sent: int
+    # seconds taken by the last and the slowest successful send
+    last_latency: float
+    max_latency: float
+
+
+class CollectionStats(NamedTuple):
+    duration: float
+    max_pause: float
+    total_pause: float
+    slices: int
@@ -1,5 +1,6 @@
 import logging
 import threading
+import time
 from concurrent.futures import Future
 from functools import wraps
 from typing import Any
@@ -23,6 +24,30 @@ def _wrap_call(func, fut: Future):
     return inner
 
 
+def _get_native_sleep() -> Callable[[float], None]:
+    try:
+        import gevent.monkey
+
+        if gevent.monkey.is_module_patched("time"):
+            return gevent.monkey.get_original("time", "sleep")
+    except ImportError:
+        pass
+    return time.sleep
+
+
+def yield_thread(duration: float = 0.0):
+    """
+    Release the GIL so other threads can run.
+
+    When gevent patched the time module, the original `time.sleep` is used. The
+    collector runs in a native thread of the gevent threadpool and sleeping natively
+    lets the hub thread run greenlets.
+
+    :param duration: seconds to sleep for
+    """
+    _get_native_sleep()(duration)
+
+
 def start_thread(func: Callable, *args: Any, **kwargs: Any) -> Future:
     future: Future = Future()
     should_spawn_thread = True
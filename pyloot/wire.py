@@ -0,0 +1,424 @@
+"""
+Binary encoding of object descriptors for uploads and responses of the remote
+server. It is denser and cheaper to decode than JSON since:
+
+- strings used as type, module, object name and attribute names are sent once per
+  payload and referenced by index afterwards
+- ids are zigzag varints of the delta to the previous id, and so are references,
+  starting from the id of the object
+- repr and attribute values are length prefixed utf-8
+
+A payload starts with `MAGIC` followed by records. A record is a tag byte, the
+varint length of its body and the body. A string reference is a varint index in
+the strings seen so far. The next free index introduces a new string, followed
+by its length prefixed utf-8. Payloads can be encoded and decoded record by
+record so that neither side holds all of it. Deltas of a snapshot also hold a
+record of the ids removed since the previous one.
+"""
+import struct
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from pyloot.types import ObjectDescriptor
+
+
+MEDIA_TYPE = "application/x-pyloot"
+MAGIC = b"PLW2"
+
+_OBJECT = 1
+_TYPE_COUNTS = 2
+_REMOVED = 3
+
+_LAZY = 1
+_STALE = 2
+_SEEN = 4
+
+_DOUBLE = struct.Struct("<d")
+
+TypeCounts = Dict[Tuple[str, str], int]
+Record = Union[ObjectDescriptor, TypeCounts, List[int]]
+
+
+class WireError(ValueError):
+    """
+    Raised when a payload is not valid
+    """
+
+
+def _varint(value: int, out: bytearray):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    result = byte & 0x7F
+    shift = 7
+    pos += 1
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class Encoder:
+    """
+    Encodes the records of one payload. The string table is shared by every
+    record of the payload.
+    """
+
+    def __init__(self):
+        # string -> encoded reference
+        self._strings: Dict[str, bytes] = {}
+        self._last_id = 0
+
+    def header(self) -> bytes:
+        return MAGIC
+
+    def _new_string(self, text: str) -> bytes:
+        out = bytearray()
+        _varint(len(self._strings), out)
+        self._strings[text] = bytes(out)
+        self._bytes(text, out)
+        return out
+
+    @staticmethod
+    def _bytes(text: str, out: bytearray):
+        data = text.encode("utf-8", "surrogatepass")
+        size = len(data)
+        if size < 0x80:
+            out.append(size)
+        else:
+            _varint(size, out)
+        out += data
+
+    @staticmethod
+    def _ids(ids: List[int], start: int, out: bytearray):
+        count = len(ids)
+        if count < 0x80:
+            out.append(count)
+        else:
+            _varint(count, out)
+        last = start
+        for _id in ids:
+            delta = _id - last
+            last = _id
+            value = delta << 1 if delta >= 0 else (-delta << 1) - 1
+            while value > 0x7F:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+
+    @staticmethod
+    def _record(tag: int, body: bytearray) -> bytes:
+        out = bytearray([tag])
+        _varint(len(body), out)
+        out += body
+        return bytes(out)
+
+    def encode(self, descr: ObjectDescriptor) -> bytes:
+        """
+        :param descr: ::class::`ObjectDescriptor`
+        :return: the record of the descriptor
+        """
+        strings = self._strings
+        out = bytearray()
+        for text in (descr.type_module, descr.type_name, descr.obj_name):
+            ref = strings.get(text)
+            out += ref if ref is not None else self._new_string(text)
+        _varint(_zigzag(descr.id - self._last_id), out)
+        self._last_id = descr.id
+        flags = (
+            (_LAZY if descr.lazy else 0)
+            | (_STALE if descr.stale else 0)
+            | (_SEEN if descr.seen is not None else 0)
+        )
+        out.append(flags)
+        if descr.seen is not None:
+            out += _DOUBLE.pack(descr.seen)
+        _varint(descr.size, out)
+        self._bytes(descr.repr, out)
+        attrs = descr.attrs
+        _varint(len(attrs), out)
+        for key, value in attrs.items():
+            key = str(key)
+            ref = strings.get(key)
+            out += ref if ref is not None else self._new_string(key)
+            self._bytes(str(value), out)
+        self._ids(descr.child_ids, descr.id, out)
+        self._ids(descr.parent_ids, descr.id, out)
+        return self._record(_OBJECT, out)
+
+    def encode_counts(self, type_counts: TypeCounts) -> bytes:
+        """
+        :param type_counts: exact number of objects per `(type_module, type_name)`
+        :return: the record of the counts
+        """
+        strings = self._strings
+        out = bytearray()
+        _varint(len(type_counts), out)
+        for key, count in type_counts.items():
+            for text in key:
+                ref = strings.get(text)
+                out += ref if ref is not None else self._new_string(text)
+            _varint(count, out)
+        return self._record(_TYPE_COUNTS, out)
+
+    def encode_removed(self, ids: List[int]) -> bytes:
+        """
+        :param ids: ids of the objects removed since the previous snapshot
+        :return: the record of the removed ids
+        """
+        out = bytearray()
+        self._ids(ids, 0, out)
+        return self._record(_REMOVED, out)
+
+
+def encode_stream(
+    object_data: Iterable[ObjectDescriptor],
+    type_counts: Optional[TypeCounts] = None,
+    removed_ids: Optional[List[int]] = None,
+) -> Iterator[bytes]:
+    """
+    Encode a payload record by record
+
+    :param object_data: list of ::class::`ObjectDescriptor`
+    :param type_counts: exact number of objects per `(type_module, type_name)`
+    :param removed_ids: ids removed since the previous snapshot, for a delta
+    :return: iterator of the header and records
+    """
+    encoder = Encoder()
+    yield encoder.header()
+    if type_counts is not None:
+        yield encoder.encode_counts(type_counts)
+    if removed_ids:
+        yield encoder.encode_removed(removed_ids)
+    for descr in object_data:
+        yield encoder.encode(descr)
+
+
+def encode(
+    object_data: Iterable[ObjectDescriptor],
+    type_counts: Optional[TypeCounts] = None,
+    removed_ids: Optional[List[int]] = None,
+) -> bytes:
+    return b"".join(encode_stream(object_data, type_counts, removed_ids))
+
+
+class Decoder:
+    """
+    Decodes the records of one payload from chunks of any size
+    """
+
+    def __init__(self):
+        self._strings: List[str] = []
+        self._last_id = 0
+        self._buf = b""
+        self._header = False
+
+    def _string(self, buf: bytes, pos: int) -> Tuple[str, int]:
+        idx, pos = _read_varint(buf, pos)
+        strings = self._strings
+        if idx < len(strings):
+            return strings[idx], pos
+        if idx != len(strings):
+            raise WireError("Unknown string {}".format(idx))
+        size, pos = _read_varint(buf, pos)
+        text = str(buf[pos : pos + size], "utf-8", "surrogatepass")
+        strings.append(text)
+        return text, pos + size
+
+    @staticmethod
+    def _ids(buf: bytes, pos: int, start: int) -> Tuple[List[int], int]:
+        count, pos = _read_varint(buf, pos)
+        ids = []
+        last = start
+        for _ in range(count):
+            byte = buf[pos]
+            pos += 1
+            value = byte & 0x7F
+            shift = 7
+            while byte & 0x80:
+                byte = buf[pos]
+                pos += 1
+                value |= (byte & 0x7F) << shift
+                shift += 7
+            last += value >> 1 if not value & 1 else -((value + 1) >> 1)
+            ids.append(last)
+        return ids, pos
+
+    def _object(self, buf: bytes) -> ObjectDescriptor:
+        string = self._string
+        strings = self._strings
+        # known strings with a single byte reference are the common case
+        idx = buf[0]
+        if idx < 0x80 and idx < len(strings):
+            type_module, pos = strings[idx], 1
+        else:
+            type_module, pos = string(buf, 0)
+        idx = buf[pos]
+        if idx < 0x80 and idx < len(strings):
+            type_name, pos = strings[idx], pos + 1
+        else:
+            type_name, pos = string(buf, pos)
+        idx = buf[pos]
+        if idx < 0x80 and idx < len(strings):
+            obj_name, pos = strings[idx], pos + 1
+        else:
+            obj_name, pos = string(buf, pos)
+        delta, pos = _read_varint(buf, pos)
+        _id = self._last_id = self._last_id + _unzigzag(delta)
+        flags = buf[pos]
+        pos += 1
+        seen = None
+        if flags & _SEEN:
+            (seen,) = _DOUBLE.unpack_from(buf, pos)
+            pos += _DOUBLE.size
+        size, pos = _read_varint(buf, pos)
+        length, pos = _read_varint(buf, pos)
+        text = str(buf[pos : pos + length], "utf-8", "surrogatepass")
+        pos += length
+        attrs = {}
+        count, pos = _read_varint(buf, pos)
+        for _ in range(count):
+            idx = buf[pos]
+            if idx < 0x80 and idx < len(strings):
+                key, pos = strings[idx], pos + 1
+            else:
+                key, pos = string(buf, pos)
+            length = buf[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = _read_varint(buf, pos)
+            attrs[key] = str(buf[pos : pos + length], "utf-8", "surrogatepass")
+            pos += length
+        child_ids, pos = self._ids(buf, pos, _id)
+        parent_ids, pos = self._ids(buf, pos, _id)
+        # in field order, cheaper than keyword arguments
+        return ObjectDescriptor._make(
+            (
+                text,
+                type_name,
+                type_module,
+                obj_name,
+                _id,
+                attrs,
+                parent_ids,
+                child_ids,
+                seen,
+                bool(flags & _LAZY),
+                bool(flags & _STALE),
+                size,
+            )
+        )
+
+    def _type_counts(self, buf: bytes) -> TypeCounts:
+        type_counts = {}
+        count, pos = _read_varint(buf, 0)
+        for _ in range(count):
+            type_module, pos = self._string(buf, pos)
+            type_name, pos = self._string(buf, pos)
+            type_counts[(type_module, type_name)], pos = _read_varint(buf, pos)
+        return type_counts
+
+    def feed(self, chunk: bytes) -> Iterator[Record]:
+        """
+        Decode the records completed by a chunk
+
+        :param chunk: next bytes of the payload
+        :return: iterator of ::class::`ObjectDescriptor`, type counts dicts and
+            lists of removed ids
+        """
+        buf = self._buf + chunk if self._buf else chunk
+        pos = 0
+        if not self._header:
+            if len(buf) < len(MAGIC):
+                self._buf = buf
+                return
+            if buf[: len(MAGIC)] != MAGIC:
+                raise WireError("Not a pyloot payload")
+            pos = len(MAGIC)
+            self._header = True
+
+        end = len(buf)
+        while pos < end:
+            tag = buf[pos]
+            try:
+                size, start = _read_varint(buf, pos + 1)
+            except IndexError:
+                break
+            if start + size > end:
+                break
+            body = buf[start : start + size]
+            pos = start + size
+            try:
+                if tag == _OBJECT:
+                    yield self._object(body)
+                elif tag == _TYPE_COUNTS:
+                    yield self._type_counts(body)
+                elif tag == _REMOVED:
+                    yield self._ids(body, 0, 0)[0]
+                else:
+                    raise WireError("Unknown record {}".format(tag))
+            except (IndexError, struct.error) as e:
+                raise WireError("Invalid record") from e
+        self._buf = buf[pos:]
+
+    def close(self):
+        """
+        :raise WireError: when the payload ends in the middle of a record
+        """
+        if self._buf or not self._header:
+            raise WireError("Truncated payload")
+
+
+def decode_stream(chunks: Iterable[bytes]) -> Iterator[Record]:
+    """
+    Decode a payload from chunks of any size
+
+    :param chunks: iterable of the bytes of a payload
+    :return: iterator of ::class::`ObjectDescriptor`, type counts dicts and lists
+        of removed ids
+    """
+    decoder = Decoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    decoder.close()
+
+
+def decode(
+    data: bytes,
+) -> Tuple[List[ObjectDescriptor], Optional[TypeCounts]]:
+    """
+    :param data: a whole payload
+    :return: the descriptors and type counts of the payload
+    """
+    items = []
+    type_counts = None
+    for record in decode_stream([data]):
+        if isinstance(record, ObjectDescriptor):
+            items.append(record)
+        elif isinstance(record, dict):
+            type_counts = record
+    return items, type_counts
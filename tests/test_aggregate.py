@@ -0,0 +1,103 @@
+import gzip
+import json
+import os
+from unittest import mock
+
+import pytest
+from webob import Request
+
+from pyloot import AggregateBackend
+from pyloot import collector
+from pyloot import HTTPRemoteBackend
+from pyloot import PyLootServer
+from pyloot.backends.http import SOURCE_HEADER
+
+
+def _post(server, path, data, source):
+    return Request.blank(
+        path,
+        method="POST",
+        body=gzip.compress(json.dumps(data).encode("utf-8")),
+        headers={SOURCE_HEADER: source},
+    ).get_response(server)
+
+
+def test_sources_are_stored_separately():
+    backend = AggregateBackend()
+    first = dict(a=1)
+    second = dict(b=2)
+    backend.store([collector.get_data(first)], source="web:1")
+    backend.store([collector.get_data(second)], source="web:2")
+
+    # an upload does not replace the objects of another source
+    assert [d.id for d in backend.get_source("web:1").fetch()] == [id(first)]
+    assert [d.id for d in backend.get_source("web:2").fetch()] == [id(second)]
+    # object queries go to the last source
+    assert [d.id for d in backend.fetch()] == [id(second)]
+    assert [s.source for s in backend.fetch_sources()] == ["web:2", "web:1"]
+    assert backend.get_source("web:3") is None
+
+
+def test_aggregated_history():
+    backend = AggregateBackend()
+    dicts = ("builtins", "dict")
+    backend.store_counts({dicts: 3}, source="web:1")
+    backend.store_counts({dicts: 5}, source="web:2")
+    backend.store_counts({dicts: 4}, source="web:1")
+
+    assert backend.fetch_history()[0].counts == [3, 8, 9]
+    assert backend.fetch_history(aggregate="max")[0].counts == [3, 5, 5]
+    assert backend.get_source("web:1").fetch_history()[0].counts == [3, 4]
+
+
+def test_stale_sources_expire():
+    backend = AggregateBackend(ttl=10)
+    dicts = ("builtins", "dict")
+    with mock.patch("pyloot.backends.aggregate.time.time", return_value=100):
+        backend.store_counts({dicts: 3}, source="web:1")
+    with mock.patch("pyloot.backends.aggregate.time.time", return_value=105):
+        backend.store_counts({dicts: 5}, source="web:2")
+    with mock.patch("pyloot.backends.aggregate.time.time", return_value=115):
+        backend.store_counts({dicts: 6}, source="web:2")
+        assert [s.source for s in backend.fetch_sources()] == ["web:2"]
+        # the expired source no longer counts towards the sum
+        assert backend.fetch_history()[0].counts == [3, 8, 6]
+
+    # a sample is appended when the last source expires without a new upload
+    with mock.patch("pyloot.backends.aggregate.time.time", return_value=130):
+        (history,) = backend.fetch_history()
+        assert history.counts == [3, 8, 6, 0]
+        assert history.timestamps[-1] == 130
+    with pytest.raises(ValueError):
+        backend.fetch_history(aggregate="mean")
+
+
+def test_server_sources():
+    backend = AggregateBackend()
+    server = PyLootServer(backend=backend, disable_response_gzip=True)
+    obj = dict(a=1)
+    data = [dict(collector.get_data(obj)._asdict())]
+    assert _post(server, "/api/objects", data, "web:1").status_code == 200
+    assert _post(server, "/api/objects", [], "web:2").status_code == 200
+
+    response = Request.blank("/api/sources").get_response(server)
+    assert [item["source"] for item in response.json] == ["web:2", "web:1"]
+
+    response = Request.blank("/api/objects?source=web:1").get_response(server)
+    assert [item["id"] for item in response.json] == [id(obj)]
+    response = Request.blank("/api/objects").get_response(server)
+    assert response.json == []
+    response = Request.blank("/api/objects?source=web:3").get_response(server)
+    assert response.status_code == 404
+
+    response = Request.blank("/api/history?aggregate=max").get_response(server)
+    assert response.json[0]["counts"] == [1, 1]
+    response = Request.blank("/api/history?aggregate=avg").get_response(server)
+    assert response.status_code == 400
+
+
+def test_remote_source_header():
+    backend = HTTPRemoteBackend(source="web:1")
+    request = backend._make_request("/api/objects", json_data=[])
+    assert request.get_header(SOURCE_HEADER.capitalize()) == "web:1"
+    assert HTTPRemoteBackend().get_source().endswith(":{}".format(os.getpid()))
@@ -1,7 +1,9 @@
 import sys
 from unittest import mock
 
+from pyloot import AggregateBackend
 from pyloot import cli
+from pyloot import SQLiteBackend
 
 
 @mock.patch("pyloot.cli.PyLootServer.serve_forever")
@@ -23,3 +25,18 @@ def test_cli_override_port_host(mocked_serve):
     with mock.patch.object(sys, "argv", ["pyloot", "-p", "8081", "-h", "127.0.0.1"]):
         cli.main()
     mocked_serve.assert_called_once_with(host="127.0.0.1", port=8081)
+
+
+@mock.patch("pyloot.cli.PyLootServer.serve_forever")
+def test_cli_sqlite(mocked_serve, tmp_path):
+    path = str(tmp_path / "pyloot.db")
+    with mock.patch.object(sys, "argv", ["pyloot", "--sqlite", path]):
+        with mock.patch("pyloot.cli.PyLootServer") as server:
+            cli.main()
+    backend = server.call_args[1]["backend"]
+    assert isinstance(backend, AggregateBackend)
+    backend.store_counts({("builtins", "dict"): 1}, source="web-1:42")
+    source = backend.get_source("web-1:42")
+    assert isinstance(source, SQLiteBackend)
+    source.close()
+    assert (tmp_path / "pyloot.web-1_42.db").exists()
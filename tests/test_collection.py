@@ -1,8 +1,14 @@
+import gc
+from types import SimpleNamespace
 from typing import NamedTuple
 from unittest import mock
 
 from pyloot import InMemoryBackend
 from pyloot import PyLoot
+from pyloot import collector
+from pyloot.collector import DescriptorCache
+from pyloot.collector import ObjectFilter
+from pyloot.collector import SamplingPolicy
 
 
 class Foo(NamedTuple):
@@ -10,6 +16,14 @@ class Foo(NamedTuple):
     b: int
 
 
+class Bar:
+    pass
+
+
+class Baz:
+    pass
+
+
 MEM_LK_SIM = []
 
 
@@ -30,3 +44,224 @@ def test_collection():
     assert obj
     objs = backend.fetch_by_group("test_collection.Foo")
     assert len(objs) == 1
+
+
+def test_incremental_collection():
+    f = Foo(1, 2)
+    pyloot = PyLoot(incremental=True)
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=[f]):
+        with mock.patch(
+            "pyloot.collector._safe_get_attrs", return_value={}
+        ) as mocked_get_attrs:
+            pyloot.collect_objects()
+            pyloot.collect_objects()
+            assert mocked_get_attrs.call_count == 1
+
+    obj = pyloot._backend.fetch_by_id(id(f))
+    assert obj
+    assert obj.child_ids == [id(child) for child in gc.get_referents(f)]
+
+
+def test_descriptor_cache_invalidates_reused_id():
+    cache = DescriptorCache()
+    obj = Bar()
+    cache.begin()
+    descr = cache.get_data(obj)
+    cache.end()
+    assert descr.type_name == "Bar"
+
+    # same id, different type
+    obj.__class__ = Baz
+    cache.begin()
+    descr = cache.get_data(obj)
+    cache.end()
+    assert descr.type_name == "Baz"
+    assert len(cache) == 1
+
+    # objects not seen during a collection are forgotten
+    cache.begin()
+    cache.end()
+    assert len(cache) == 0
+
+
+def test_lazy_collection():
+    obj = Bar()
+    obj.value = 1
+    pyloot = PyLoot(lazy=True)
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=[obj]):
+        pyloot.collect_objects()
+
+    backend: InMemoryBackend = pyloot._backend
+    item = backend.fetch_by_group("test_collection.Bar")[0]
+    assert item.lazy
+    assert item.attrs == {}
+
+    item = backend.fetch_by_id(id(obj))
+    assert not item.lazy
+    assert item.attrs["value"] == "1"
+    assert "Bar" in item.repr
+
+
+def test_lazy_collection_stale():
+    obj = Bar()
+    not_weakrefable = dict(a=1)
+    pyloot = PyLoot(lazy=True)
+    with mock.patch("pyloot.collector.gc.get_objects") as mocked_get_objects:
+        mocked_get_objects.side_effect = lambda: [obj, not_weakrefable]
+        pyloot.collect_objects()
+    # objects without weak references are described when collected
+    (item,) = pyloot._backend.fetch_by_group("builtins.dict")
+    assert not item.lazy
+    assert item.attrs
+    assert not pyloot._backend.fetch_by_id(id(not_weakrefable)).stale
+
+    _id = id(obj)
+    del obj
+    gc.collect()
+    item = pyloot._backend.fetch_by_id(_id)
+    assert item.lazy
+    assert item.stale
+
+
+def test_collect_counts():
+    objs = [Foo(1, 2), Foo(3, 4), Bar()]
+    pyloot = PyLoot()
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=objs):
+        pyloot.collect_objects()
+        pyloot.collect_counts()
+
+    backend: InMemoryBackend = pyloot._backend
+    history = {h.type_name: h.counts for h in backend.fetch_history()}
+    assert history == {"Foo": [2, 2], "Bar": [1, 1]}
+
+
+def test_sampled_collection():
+    foos = [Foo(i, i) for i in range(10)]
+    bars = [Bar() for _ in range(10)]
+    requested = foos[0]
+    sampling = SamplingPolicy(
+        size=2, group_sizes={"test_collection.Bar": None}, requested_ids=[id(requested)]
+    )
+    pyloot = PyLoot(sampling=sampling)
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=foos + bars):
+        pyloot.collect_objects()
+
+    backend: InMemoryBackend = pyloot._backend
+    foo_items = backend.fetch_by_group("test_collection.Foo")
+    assert len(foo_items) == 3
+    assert backend.fetch_by_id(id(requested))
+    assert len(backend.fetch_by_group("test_collection.Bar")) == 10
+
+    history = {h.type_name: h.counts for h in backend.fetch_history()}
+    assert history == {"Foo": [10], "Bar": [10]}
+
+
+def test_time_sliced_collection():
+    foos = [Foo(i, i) for i in range(10)]
+    pyloot = PyLoot(slice_budget=0)
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=foos):
+        with mock.patch("pyloot.collector.yield_thread") as mocked_yield:
+            pyloot.collect_objects()
+
+    stats = pyloot.get_stats()
+    assert stats.slices > len(foos)
+    assert mocked_yield.call_count == stats.slices - 1
+    assert stats.max_pause <= stats.total_pause <= stats.duration
+    assert len(pyloot._backend.fetch_by_group("test_collection.Foo")) == 10
+
+
+def test_object_filter():
+    object_filter = ObjectFilter(
+        exclude_modules=["test_collection"], include_modules=["test_collection.kept"]
+    )
+    assert not object_filter.should_include(Foo(1, 2), set())
+    assert not object_filter.should_include(Foo, set())
+    assert object_filter.should_include(dict(a=1), set())
+    assert object_filter.is_module_included("test_collection.kept")
+    assert object_filter.is_module_included("test_collections")
+    assert not object_filter.is_module_included("test_collection.other")
+
+    # instances can shadow the __module__ of their type
+    obj = SimpleNamespace()
+    assert object_filter.should_include(obj, set())
+    obj.__module__ = "test_collection"
+    assert not object_filter.should_include(obj, set())
+
+    d = dict(a=1)
+    assert not object_filter.should_include(d, {id(d)})
+
+
+def test_attrs_match_dir():
+    class WithAttrs:
+        x = 1
+
+        def method(self):
+            pass
+
+    obj = WithAttrs()
+    obj.y = 2
+    slotted = Foo(1, 2)
+    for item in [obj, slotted, dict(a=1), [1], WithAttrs, Bar()]:
+        attrs = collector._safe_get_attrs(item)
+        expected = {
+            k for k in dir(item) if type(getattr(item, k)) not in collector.METHOD_TYPES
+        }
+        assert set(attrs) == expected
+    assert collector._safe_get_attrs(obj)["y"] == "2"
+
+
+def test_describers():
+    assert collector._safe_repr([1, "a"], 100) == "[1, 'a']"
+    assert collector._safe_repr(list(range(1000)), 100).startswith(
+        "list(len=1000, getsizeof="
+    )
+    assert len(collector._safe_repr(b"x" * 10000, 100)) <= 103
+
+    class FakeArray:
+        __array_interface__ = {}
+        shape = (1000, 1000)
+        dtype = "float64"
+        nbytes = 8000000
+
+        def __repr__(self):
+            raise AssertionError("repr should not be called")
+
+    assert "shape=(1000, 1000)" in collector._safe_repr(FakeArray(), 100)
+
+    collector.register_describer(Bar, lambda obj, size: "a bar")
+    try:
+        assert collector.get_data(Bar()).repr == "a bar"
+    finally:
+        del collector._describers[Bar]
+
+
+def test_descriptor_budget():
+    obj = SimpleNamespace(**{"attr_{}".format(i): "v" * 100 for i in range(100)})
+    budget = collector.DescriptorBudget(repr_size=50, attr_size=20, total_size=500)
+    descr = collector.get_data(obj, budget=budget)
+    assert len(descr.repr) <= 53
+    assert "__truncated__" in descr.attrs
+    assert all(len(v) <= 23 for v in descr.attrs.values())
+    assert sum(len(k) + len(v) for k, v in descr.attrs.items()) <= 600
+
+
+def test_backend_excluded_by_type():
+    bars = [Bar() for _ in range(100)]
+    # the number of ignored ids grows with kept snapshots, not with objects
+    backend = InMemoryBackend(max_snapshots=1)
+    backend.store([collector.get_data(bar) for bar in bars[:10]])
+    backend.store_counts({("builtins", "dict"): 1})
+    backend.fetch_paths_to_root(id(bars[0]))
+    ignored = list(backend.get_ids())
+
+    backend.store([collector.get_data(bar) for bar in bars])
+    backend.fetch_paths_to_root(id(bars[0]))
+    assert len(list(backend.get_ids())) == len(ignored)
+
+    # a filter including pyloot still skips its storage
+    stored = [backend._data, backend._groups, backend._roots, backend._strings]
+    stored.extend(backend._data.values())
+    object_filter = ObjectFilter(exclude_modules=(), include_modules=("pyloot",))
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=stored + bars):
+        descrs = collector.get_object_descriptors(object_filter=object_filter)
+    assert [d.id for d in descrs] == [id(bar) for bar in bars]
@@ -0,0 +1,49 @@
+import os
+import time
+from typing import NamedTuple
+from unittest import mock
+
+import pytest
+
+from pyloot import PyLoot
+from pyloot.fork import collect_in_child
+from pyloot.fork import ForkCollectionError
+from pyloot.fork import is_fork_supported
+
+
+pytestmark = pytest.mark.skipif(not is_fork_supported(), reason="fork unsupported")
+
+
+class Foo(NamedTuple):
+    a: int
+    b: int
+
+
+def test_collect_in_child():
+    result, stats = collect_in_child(os.getpid)
+    assert result != os.getpid()
+    assert stats.slices == 2
+    assert stats.max_pause <= stats.total_pause <= stats.duration
+
+
+def test_collect_in_child_timeout():
+    with pytest.raises(ForkCollectionError):
+        collect_in_child(lambda: time.sleep(5), timeout=0.2)
+
+
+def test_collect_in_child_error():
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ForkCollectionError):
+        collect_in_child(fail)
+
+
+def test_forked_collection():
+    f = Foo(1, 2)
+    pyloot = PyLoot(fork=True)
+    with mock.patch("pyloot.collector.gc.get_objects", return_value=[f]):
+        pyloot.collect_objects()
+
+    assert pyloot._backend.fetch_by_id(id(f))
+    assert pyloot.get_stats().slices == 2
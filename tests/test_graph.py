@@ -0,0 +1,244 @@
+import random
+import weakref
+
+from pyloot import collector
+from pyloot import InMemoryBackend
+from pyloot.graph import DominatorTree
+from pyloot.graph import ReferenceGraph
+from pyloot.graph import shortest_paths
+
+
+def _descr(_id, child_ids):
+    return collector.get_data(object())._replace(id=_id, child_ids=child_ids)
+
+
+def test_reference_graph():
+    # 1 -> 2 (twice), 1 -> 3, 2 -> 3, 3 -> 1, 3 -> 99 (not collected)
+    graph = ReferenceGraph.from_descriptors(
+        [_descr(3, [1, 99]), _descr(1, [2, 2, 3]), _descr(2, [3])]
+    )
+    assert len(graph) == 3
+    assert list(graph.ids) == [1, 2, 3]
+    assert graph.index_of(99) is None
+    assert 99 not in graph
+
+    assert graph.children_of(1) == [2, 2, 3]
+    assert graph.children_of(3) == [1, 99]
+    assert graph.child_indices(graph.index_of(3)) == [graph.index_of(1)]
+
+    assert graph.parents_of(1) == [3]
+    assert graph.parents_of(2) == [1]
+    assert graph.parents_of(3) == [1, 2]
+    assert graph.parents_of(99) == []
+
+    # parents are rebuilt when only children are given
+    rebuilt = ReferenceGraph(graph.ids, graph.child_offsets, graph.child_edges)
+    assert list(rebuilt.parent_edges) == list(graph.parent_edges)
+    assert list(rebuilt.parent_offsets) == list(graph.parent_offsets)
+
+    # 2 is removed, 3 changes its references and 4 is new
+    patched = graph.patch([_descr(3, [4]), _descr(4, [1])], [2])
+    expected = ReferenceGraph.from_descriptors(
+        [_descr(1, [2, 2, 3]), _descr(3, [4]), _descr(4, [1])]
+    )
+    for name in ("ids", "child_offsets", "child_edges", "parent_offsets"):
+        assert list(getattr(patched, name)) == list(getattr(expected, name))
+    assert list(patched.parent_edges) == list(expected.parent_edges)
+
+
+def test_patch_matches_rebuild():
+    rng = random.Random(0)
+    for _ in range(200):
+        nodes = {
+            i: [rng.randrange(20) for _ in range(rng.randrange(4))]
+            for i in rng.sample(range(20), rng.randrange(15))
+        }
+        graph = ReferenceGraph.from_descriptors(
+            [_descr(*node) for node in nodes.items()]
+        )
+        removed = rng.sample(range(22), rng.randrange(5))
+        changed = {
+            i: [rng.randrange(20) for _ in range(rng.randrange(4))]
+            for i in rng.sample(range(20), rng.randrange(5))
+        }
+        patched = graph.patch([_descr(*node) for node in changed.items()], removed)
+        for _id in removed:
+            nodes.pop(_id, None)
+        nodes.update(changed)
+        expected = ReferenceGraph.from_descriptors(
+            [_descr(*node) for node in nodes.items()]
+        )
+        for name in (
+            "ids",
+            "child_offsets",
+            "child_edges",
+            "parent_offsets",
+            "parent_edges",
+        ):
+            assert list(getattr(patched, name)) == list(getattr(expected, name))
+
+
+def test_chunked_build(monkeypatch):
+    monkeypatch.setattr("pyloot.graph._CHUNK", 3)
+    # node i references i + 1 twice, i + 2 and an object which is not collected
+    descrs = [_descr(i, [i + 1, i + 1, i + 2, -i]) for i in range(1, 11)]
+    chunks = []
+
+    def iterate(starts):
+        for start in starts:
+            chunks.append(start)
+            yield start
+
+    graph = ReferenceGraph.from_descriptors(descrs[::-1], iterate)
+    assert len(chunks) > 10
+    for i in range(1, 11):
+        assert graph.children_of(i) == [i + 1, i + 1, i + 2, -i]
+        assert graph.parents_of(i) == [j for j in (i - 2, i - 1) if j >= 1]
+
+
+def test_backend_references():
+    backend = InMemoryBackend()
+    backend.store([_descr(1, [2, 99]), _descr(2, [1])])
+
+    descr = backend.fetch_by_id(1)
+    assert descr.child_ids == [2, 99]
+    assert descr.parent_ids == [2]
+    assert [d.id for d in backend.fetch_children_of(1)] == [2]
+    assert [d.id for d in backend.fetch_parents_of(2)] == [1]
+    assert backend.fetch_children_of(99) == []
+
+    # stored records do not keep their own lists of ids
+    assert not hasattr(backend._data[1], "child_ids")
+    assert id(backend._graph.child_edges) in set(backend.get_ids())
+
+
+class Node:
+    pass
+
+
+def test_collected_graph():
+    leaf = Node()
+    root = [leaf]
+    data, graph = collector.get_object_graph(lazy=True)
+    by_id = {descr.id: descr for descr in data}
+    # references are only in the graph
+    assert by_id[id(leaf)].parent_ids == []
+    assert id(root) in graph.parents_of(id(leaf))
+
+    backend = InMemoryBackend()
+    backend.store(data, graph=graph)
+    assert backend._graph is graph
+    assert id(root) in backend.fetch_by_id(id(leaf)).parent_ids
+
+
+def test_dominator_tree():
+    # 1 -> 2 -> 4 -> 5, 1 -> 3 -> 4, and a cycle 6 <-> 7 without outside parents
+    graph = ReferenceGraph.from_descriptors(
+        [
+            _descr(1, [2, 3]),
+            _descr(2, [4]),
+            _descr(3, [4]),
+            _descr(4, [5]),
+            _descr(5, []),
+            _descr(6, [7]),
+            _descr(7, [6]),
+        ]
+    )
+    tree = DominatorTree(graph, [10] * len(graph))
+
+    def dominator(_id):
+        idx = tree.dominator_of(graph.index_of(_id))
+        return None if idx is None else graph.ids[idx]
+
+    def retained(_id):
+        return tree.retained_size(graph.index_of(_id))
+
+    assert [dominator(_id) for _id in range(1, 8)] == [None, 1, 1, 1, 4, None, 6]
+    assert [retained(_id) for _id in range(1, 8)] == [50, 10, 10, 20, 10, 20, 10]
+    assert tree.total_size == 70
+    assert [graph.ids[idx] for idx in tree.top(2)] == [1, 4]
+
+
+def test_backend_retained():
+    backend = InMemoryBackend()
+    backend.store(
+        [
+            _descr(1, [2])._replace(size=100),
+            _descr(2, [3])._replace(size=20),
+            _descr(3, [])._replace(size=3),
+        ]
+    )
+
+    retained = backend.fetch_retained(2)
+    assert retained.size == 20
+    assert retained.retained_size == 23
+    assert retained.dominator_id == 1
+    assert backend.fetch_retained(99) is None
+    assert [r.id for r in backend.fetch_top_retainers(top=2)] == [1, 2]
+
+    # cached until the next snapshot
+    dominators = backend._dominators
+    backend.fetch_retained(1)
+    assert backend._dominators is dominators
+    backend.store([_descr(1, [])._replace(size=100)])
+    assert backend.fetch_retained(1).retained_size == 100
+
+
+def test_shortest_paths():
+    # 1 -> 2 -> 3 -> 5, 4 -> 5, 6 -> 7 -> 5
+    graph = ReferenceGraph.from_descriptors(
+        [
+            _descr(1, [2]),
+            _descr(2, [3]),
+            _descr(3, [5]),
+            _descr(4, [5]),
+            _descr(5, []),
+            _descr(6, [7]),
+            _descr(7, [5]),
+        ]
+    )
+    idx = graph.index_of
+
+    def paths(**kwargs):
+        found = shortest_paths(graph, idx(5), [idx(1), idx(4), idx(6)], **kwargs)
+        return [[graph.ids[node] for node in path] for path in found]
+
+    assert paths() == [[4, 5]]
+    assert paths(count=3) == [[4, 5], [6, 7, 5], [1, 2, 3, 5]]
+    assert paths(count=3, max_depth=2) == [[4, 5], [6, 7, 5]]
+    assert paths(count=3, skip=lambda node: node == idx(7)) == [[4, 5], [1, 2, 3, 5]]
+    assert shortest_paths(graph, idx(4), [idx(4)]) == [[idx(4)]]
+
+
+def test_backend_paths_to_root():
+    def typed(_id, child_ids, type_module, type_name):
+        return _descr(_id, child_ids)._replace(
+            type_module=type_module, type_name=type_name
+        )
+
+    target = Node()
+    # as reported by the collector on the running python
+    weak_types = [
+        type(weakref.ref(target)),
+        type(weakref.proxy(target)),
+        type(weakref.proxy(_descr)),
+    ]
+    backend = InMemoryBackend()
+    backend.store(
+        [
+            typed(1, [2], "builtins", "module"),
+            typed(2, [3], "builtins", "dict"),
+            typed(3, [4], "tests", "Foo"),
+            typed(4, [5], "builtins", "dict"),
+            typed(5, [], "builtins", "list"),
+        ]
+        + [
+            typed(6 + pos, [5], typ.__module__, typ.__name__)
+            for pos, typ in enumerate(weak_types)
+        ]
+    )
+
+    # `__dict__` of the module and instance are collapsed, weakrefs are skipped
+    paths = backend.fetch_paths_to_root(5, count=5)
+    assert [[descr.id for descr in path] for path in paths] == [[1, 3, 5]]
+    assert backend.fetch_paths_to_root(99) == []
@@ -0,0 +1,83 @@
+from pyloot.history import HistoryBuffer
+from pyloot.history import RollupBuffer
+from pyloot.history import TieredHistory
+
+
+def test_history_buffer_rotation():
+    history = HistoryBuffer(max_history=3)
+    history.append({("builtins", "dict"): 5})
+    history.append({("builtins", "dict"): 1, ("builtins", "list"): 4})
+    history.append({("builtins", "dict"): 3})
+
+    by_name = {h.type_name: h for h in history.top()}
+    assert by_name["dict"].counts == [5, 1, 3]
+    assert (by_name["dict"].min, by_name["dict"].max) == (1, 5)
+    # back-filled before it was first seen and 0 once missing
+    assert by_name["list"].counts == [0, 4, 0]
+
+    # evicting the max and then the min recomputes them
+    history.append({("builtins", "dict"): 2})
+    dict_history = history.top(1)[0]
+    assert dict_history.counts == [1, 3, 2]
+    assert (dict_history.min, dict_history.max) == (1, 3)
+
+    history.append({("builtins", "dict"): 4})
+    dict_history = history.top(1)[0]
+    assert dict_history.counts == [3, 2, 4]
+    assert (dict_history.min, dict_history.max) == (2, 4)
+
+
+def test_history_buffer_top():
+    history = HistoryBuffer()
+    history.append({("builtins", "dict"): 1, ("builtins", "list"): 3})
+    history.append({("builtins", "dict"): 5, ("builtins", "list"): 3, ("a", "b"): 4})
+
+    assert [h.type_name for h in history.top(2)] == ["dict", "b"]
+    assert [h.type_name for h in history.top()] == ["dict", "b", "list"]
+    assert len(history) == 3
+
+
+def test_rollup_buffer():
+    rollup = RollupBuffer(resolution=600, max_history=2)
+    key = ("builtins", "dict")
+    rollup.add({key: 4}, 0)
+    rollup.add({key: 2}, 300)
+    rollup.add({key: 9}, 650)
+
+    (history,) = rollup.query()
+    assert history.timestamps == [0, 600]
+    assert history.counts == [2, 9]
+    assert history.mins == [2, 9]
+    assert history.maxs == [4, 9]
+    assert history.means == [3, 9]
+    assert (history.min, history.max) == (2, 9)
+
+    # the oldest bucket is reused
+    rollup.add({("builtins", "list"): 1}, 1300)
+    by_name = {h.type_name: h for h in rollup.query()}
+    assert by_name["dict"].timestamps == [600, 1200]
+    assert by_name["dict"].counts == [9, 0]
+    assert by_name["list"].counts == [0, 1]
+
+
+def test_tiered_history():
+    history = TieredHistory(max_history=3, tiers=((600, 10), (3600, 10)))
+    key = ("builtins", "dict")
+    for minute in range(0, 120, 30):
+        history.append({key: minute}, minute * 60)
+
+    # raw samples only go back 3 samples
+    (raw,) = history.query()
+    assert raw.timestamps == [1800, 3600, 5400]
+    assert raw.counts == [30, 60, 90]
+
+    # the finest resolution covering start
+    (covered,) = history.query(start=0)
+    assert covered.timestamps == [0, 1800, 3600, 5400]
+    (hourly,) = history.query(resolution=3600)
+    assert hourly.timestamps == [0, 3600]
+    assert hourly.means == [15, 75]
+
+    (ranged,) = history.query(start=1000, end=4000, resolution=0)
+    assert ranged.counts == [30, 60]
+    assert (ranged.min, ranged.max) == (30, 60)
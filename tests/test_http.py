@@ -0,0 +1,195 @@
+import io
+import threading
+from wsgiref import simple_server
+
+import pytest
+
+from pyloot import collector
+from pyloot import HTTPRemoteBackend
+from pyloot import InMemoryBackend
+from pyloot import PyLootServer
+from pyloot import wire
+from pyloot.sender import BackgroundSender
+from pyloot.sender import FatalSendError
+from pyloot.server import _dechunk
+from pyloot.server import _iter_lines
+
+
+class _QuietHandler(simple_server.WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _without_binary(app, status):
+    # a server predating the binary format
+    def wrapper(environ, start_response):
+        if environ.get("CONTENT_TYPE") == wire.MEDIA_TYPE:
+            environ["wsgi.input"].read()
+            start_response(status, [])
+            return [b""]
+        return app(environ, start_response)
+
+    return wrapper
+
+
+@pytest.fixture(
+    params=[None, "415 Unsupported Media Type", "400 Bad Request"],
+    ids=["binary", "json-fallback", "json-fallback-400"],
+)
+def remote(request):
+    backend = InMemoryBackend()
+    app = PyLootServer(backend=backend)
+    if request.param:
+        app = _without_binary(app, request.param)
+    httpd = simple_server.make_server(
+        "127.0.0.1", 0, _dechunk(app), handler_class=_QuietHandler
+    )
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    client = HTTPRemoteBackend(host="127.0.0.1", port=httpd.server_port, batch_size=300)
+    yield client, backend
+    client.close()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_compress_stream():
+    lines = [b"%d\n" % i for i in range(20000)]
+    chunks = list(HTTPRemoteBackend.compress_stream(lines, chunk_size=1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 1024 for chunk in chunks[:-1])
+
+    stream = io.BytesIO(b"".join(chunks))
+    assert list(_iter_lines(stream, chunk_size=100)) == [
+        line.rstrip(b"\n") for line in lines
+    ]
+
+
+def test_streaming_store(remote):
+    client, backend = remote
+    objs = [dict(value=i) for i in range(1000)]
+    data = [collector.get_data(obj) for obj in objs]
+    client.store(data, type_counts={("builtins", "dict"): 5000})
+    assert client.flush(timeout=10)
+
+    # sent in 4 batches and stored once
+    assert len(backend.fetch_snapshots()) == 1
+    metrics = client.get_metrics()
+    assert metrics.sent == 1
+    assert metrics.bytes_sent > 0
+    assert metrics.queue_depth == 0
+    assert sorted(d.id for d in backend.fetch()) == sorted(map(id, objs))
+    assert backend.fetch_history()[0].counts == [5000]
+    assert client.fetch_by_id(id(objs[0])).attrs == data[0].attrs
+
+
+def test_delta_store(remote):
+    client, backend = remote
+    objs = [dict(value=i) for i in range(1000)]
+    client.store([collector.get_data(obj) for obj in objs])
+    assert client.flush(timeout=10)
+    full = client.get_metrics().bytes_sent
+
+    del objs[:10]
+    objs.append(dict(value="new"))
+    objs[0]["value"] = "changed"
+    client.store([collector.get_data(obj) for obj in objs])
+    assert client.flush(timeout=10)
+    # only the changes are sent
+    assert client.get_metrics().bytes_sent - full < full / 10
+    assert sorted(d.id for d in backend.fetch()) == sorted(map(id, objs))
+    assert "changed" in backend.fetch_by_id(id(objs[0])).repr
+
+    # the server asks for all objects when it misses the snapshot of a delta
+    client._acked = (100, client._acked[1])
+    objs.append(dict(value="resync"))
+    client.store([collector.get_data(obj) for obj in objs])
+    assert client.flush(timeout=10)
+    assert client.get_metrics().failed == 0
+    assert sorted(d.id for d in backend.fetch()) == sorted(map(id, objs))
+    assert len(backend.fetch_snapshots()) == 3
+
+    # another copy of the client, e.g. in a forked child, continues from its base
+    other = HTTPRemoteBackend(port=client._port, background=False, binary=client.binary)
+    other.set_delta_base(client.get_delta_base())
+    objs.append(dict(value="from the copy"))
+    other.send([collector.get_data(obj) for obj in objs])
+    assert other.get_delta_base()[0] == client.get_delta_base()[0] + 1
+    assert len(other.get_delta_base()[1]) == len(objs)
+    assert sorted(d.id for d in backend.fetch()) == sorted(map(id, objs))
+    other.close()
+
+
+def test_conditional_get(remote):
+    client, backend = remote
+    objs = [dict(value=i) for i in range(10)]
+    backend.store([collector.get_data(obj) for obj in objs])
+    decoded = []
+    decode = client._decode_objects
+
+    def counting(response):
+        decoded.append(response.status)
+        return decode(response)
+
+    client._decode_objects = counting
+    children = client.fetch_children_of(id(objs[0]))
+    # an unchanged response is neither downloaded nor decoded again
+    assert client.fetch_children_of(id(objs[0])) == children
+    assert client.fetch_history() == client.fetch_history()
+    assert decoded == [200]
+
+    backend.store_counts({("builtins", "dict"): 10})
+    assert client.fetch_children_of(id(objs[0])) == children
+    assert decoded == [200, 200]
+    # responses of the previous version are dropped
+    assert len(client._cache) == 1
+    client.fetch_history()
+    assert len(client._cache) == 2
+
+    client._cache_size = 1
+    client.fetch_parents_of(id(objs[0]))
+    assert len(client._cache) == 1
+
+
+def test_sender_retries():
+    sender = BackgroundSender(max_retries=2, backoff=0.01)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("down")
+        return 10
+
+    def fatal():
+        raise FatalSendError("bad request")
+
+    sender.put(flaky)
+    sender.put(fatal)
+    assert sender.flush(timeout=10)
+    metrics = sender.get_metrics()
+    assert len(calls) == 3
+    assert (metrics.sent, metrics.failed, metrics.retries) == (1, 1, 2)
+    assert metrics.bytes_sent == 10
+    sender.close()
+
+
+def test_sender_drops_oldest():
+    sender = BackgroundSender(max_queue=2)
+    started = threading.Event()
+    blocked = threading.Event()
+    sent = []
+
+    def block():
+        started.set()
+        blocked.wait(10)
+        return 0
+
+    sender.put(block)
+    assert started.wait(10)
+    for num in range(3):
+        sender.put(lambda num=num: sent.append(num) or 0)
+    assert sender.get_metrics().dropped == 1
+    blocked.set()
+    sender.close(timeout=10)
+    assert sent == [1, 2]
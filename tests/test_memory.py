@@ -1,5 +1,11 @@
+import os
+
+from webob import Request
+
 from pyloot import collector
 from pyloot import InMemoryBackend
+from pyloot import PyLootServer
+from pyloot.backends.base import BaseBackend
 
 
 def test_store_blank_slate():
@@ -42,3 +48,198 @@ def test_store_blank_slate():
     history = backend.fetch_history()
     assert len(history) == 1
     assert history[0].counts == [1, 1, 2]
+
+
+def test_store_delta():
+    objs = [dict(a=i) for i in range(5)]
+    backend = InMemoryBackend()
+    backend.store([collector.get_data(obj) for obj in objs])
+    seen = backend.fetch_by_id(id(objs[1])).seen
+    merged = InMemoryBackend()
+    merged.store([collector.get_data(obj) for obj in objs])
+
+    # 0 is removed, 1 changes and a list referencing 2 is new
+    objs[1]["b"] = 2
+    new = [objs[2]]
+    changes = [collector.get_data(objs[1]), collector.get_data(new)]
+    counts = backend.store_delta(changes, [id(objs[0])])
+    assert counts == BaseBackend.store_delta(merged, changes, [id(objs[0])])
+    assert counts == {("builtins", "dict"): 4, ("builtins", "list"): 1}
+
+    assert [d.id for d in backend.fetch()] == [d.id for d in merged.fetch()]
+    assert backend.fetch_by_id(id(objs[0])) is None
+    assert backend.fetch_by_id(id(objs[1])).seen == seen
+    assert "'b'" in backend.fetch_by_id(id(objs[1])).repr
+    assert backend.fetch_by_id(id(objs[2])).parent_ids == [id(new)]
+    assert [d.id for d in backend.fetch_by_group("builtins.list")] == [id(new)]
+    assert [h.counts for h in backend.fetch_history()] == [
+        h.counts for h in merged.fetch_history()
+    ]
+    assert backend.fetch_diff() == merged.fetch_diff()
+
+
+def test_store_counts():
+    backend = InMemoryBackend()
+    backend.store([collector.get_data(dict(a=1))])
+    backend.store_counts({("builtins", "dict"): 3, ("builtins", "list"): 2})
+
+    # counts do not touch object data
+    assert len(backend.fetch()) == 1
+
+    history = {h.type_name: h.counts for h in backend.fetch_history()}
+    assert history == {"dict": [1, 3], "list": [0, 2]}
+
+
+def test_fetch_by_group_index():
+    backend = InMemoryBackend()
+    objs = [dict(a=i) for i in range(4)]
+    descrs = [collector.get_data(obj) for obj in objs]
+    backend.store(descrs[:2])
+    backend.store(descrs[:2] + [collector.get_data([])] + descrs[2:])
+
+    group = descrs[0].group
+    assert [d.id for d in backend.fetch_by_group(group)] == [id(obj) for obj in objs]
+    page = backend.fetch_by_group(group, limit=2, offset=1)
+    assert [d.id for d in page] == [id(objs[1]), id(objs[2])]
+
+    # dropped objects leave the index, reused ids move to their new group
+    reused = descrs[1]._replace(type_name="list")
+    backend.store([descrs[0], reused, descrs[3]])
+    assert [d.id for d in backend.fetch_by_group(group)] == [id(objs[0]), id(objs[3])]
+    assert [d.id for d in backend.fetch_by_group(reused.group)] == [id(objs[1])]
+    assert backend.fetch_by_group("missing.group") == []
+
+
+def test_compact_storage():
+    objs = [dict(a=1) for _ in range(3)]
+    backend = InMemoryBackend()
+    backend.store([collector.get_data(obj) for obj in objs])
+
+    # type strings are shared and attrs and repr are packed
+    first, second = backend._data[id(objs[0])], backend._data[id(objs[1])]
+    assert first.type_module is second.type_module
+    assert isinstance(first.blob, bytes)
+
+    descr = backend.fetch_by_id(id(objs[0]))
+    assert descr == collector.get_data(objs[0])._replace(seen=descr.seen)
+
+
+def test_memory_limit():
+    class Foo:
+        def __init__(self, size):
+            # random values do not compress
+            for i in range(size):
+                setattr(self, "attr{}".format(i), os.urandom(10).hex())
+
+    objs = [Foo(size) for size in (20, 40, 30)]
+    descrs = [collector.get_data(obj) for obj in objs]
+
+    backend = InMemoryBackend()
+    backend.store(descrs)
+    blob_size = backend._blob_size
+    usage = backend.get_memory_usage()
+
+    backend = InMemoryBackend(max_memory=usage - blob_size // 4)
+    backend.fetch_by_id(id(objs[2]))  # unknown ids are not recent
+    backend.store(descrs)
+    backend.fetch_by_id(id(objs[2]))
+    backend.store(descrs)
+    assert backend.get_memory_usage() <= usage - blob_size // 4
+
+    # counts and references are exact, the largest non recent object is dropped
+    assert backend.fetch_history()[0].counts == [3, 3]
+    fetched = {descr.id: descr for descr in backend.fetch()}
+    assert fetched[id(objs[1])].lazy
+    assert fetched[id(objs[1])].attrs == {}
+    assert not fetched[id(objs[2])].lazy
+
+    # in lazy mode, fetching by id loads them again
+    collector._register_lazy(objs)
+    descr = backend.fetch_by_id(id(objs[1]))
+    assert not descr.lazy
+    assert descr.attrs["attr39"] == descrs[1].attrs["attr39"]
+
+
+def test_memory_usage_covers_history():
+    backend = InMemoryBackend(max_snapshots=2)
+    backend.store([collector.get_data(dict(a=1))])
+    usage = backend.get_memory_usage()
+    backend.store_counts({("tests", "Foo"): 1})
+    assert backend.get_memory_usage() > usage
+
+    # the ids of the last snapshot are those of the reference graph
+    snapshots = backend._snapshots
+    assert (
+        snapshots.get_memory_usage(shared=[backend._graph.ids])
+        < snapshots.get_memory_usage()
+    )
+
+
+def test_fetch_diff():
+    kept = [dict(a=1), [1]]
+    freed = dict(b=2)
+    backend = InMemoryBackend(max_snapshots=2)
+    backend.store([collector.get_data(obj) for obj in kept + [freed]])
+    added = [dict(c=3), dict(d=4)]
+    backend.store([collector.get_data(obj) for obj in kept + added])
+
+    assert [s.number for s in backend.fetch_snapshots()] == [1, 2]
+    (dicts, lists) = backend.fetch_diff()
+    assert (dicts.type_name, dicts.new, dicts.freed) == ("dict", 2, 1)
+    assert dicts.count_delta == 1
+    assert dicts.new_ids == sorted(id(obj) for obj in added)
+    assert dicts.freed_ids == [id(freed)]
+    assert (lists.new, lists.freed, lists.count_delta, lists.size_delta) == (0, 0, 0, 0)
+    assert backend.fetch_diff(1, 2, max_ids=1)[0].new_ids == [min(map(id, added))]
+
+    # only the last snapshots are kept
+    backend.store([])
+    assert backend.fetch_diff(1, 2) is None
+    assert backend.fetch_diff(2, 3)[-1].freed == 3
+
+    server = PyLootServer(backend=backend, disable_response_gzip=True)
+    response = Request.blank("/api/diff?from=2&to=-1").get_response(server)
+    assert response.json[-1]["freed"] == 3
+    response = Request.blank("/api/diff?from=1").get_response(server)
+    assert response.status_code == 404
+
+
+class _MinimalBackend(BaseBackend):
+    # implements the methods of the original backend interface only
+    def store(self, object_data, type_counts=None):
+        self.data = object_data
+
+    def fetch(self, limit=None):
+        return self.data[:limit]
+
+    def fetch_by_id(self, _id):
+        return None
+
+    def fetch_children_of(self, _id):
+        return []
+
+    def fetch_parents_of(self, _id):
+        return []
+
+    def fetch_by_group(self, group, limit=None, offset=0):
+        return []
+
+    def fetch_history(self, top=100, start=None, end=None, resolution=None):
+        return []
+
+    def get_ids(self):
+        yield id(self)
+
+
+def test_minimal_backend():
+    backend = _MinimalBackend()
+    backend.store_counts({("builtins", "dict"): 1})
+    server = PyLootServer(backend=backend)
+    for path, status in [
+        ("/api/retainers", 200),
+        ("/api/objects/1/retained", 404),
+        ("/api/objects/1/path-to-root", 200),
+        ("/api/snapshots", 200),
+        ("/api/diff", 404),
+    ]:
+        assert Request.blank(path).get_response(server).status_code == status
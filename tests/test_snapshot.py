@@ -0,0 +1,115 @@
+import sys
+from array import array
+from unittest import mock
+
+from webob import Request
+
+from pyloot import cli
+from pyloot import collector
+from pyloot import FileBackend
+from pyloot import PyLootServer
+from pyloot.snapshot import diff_snapshots
+from pyloot.snapshot import Snapshot
+from pyloot.snapshot import top_groups
+from pyloot.snapshot import write_snapshot
+
+
+def _descr(_id, child_ids, group="builtins.dict", size=10):
+    type_module, type_name = group.rsplit(".", 1)
+    return collector.get_data(dict(a=1))._replace(
+        id=_id,
+        child_ids=child_ids,
+        type_module=type_module,
+        type_name=type_name,
+        size=size,
+    )
+
+
+def test_snapshot_file(tmp_path):
+    path = str(tmp_path / "a.snap")
+    descrs = [_descr(2, [1, 99]), _descr(1, [2, 2]), _descr(3, [], "builtins.list")]
+    write_snapshot(path, descrs)
+
+    snapshot = Snapshot(path)
+    assert list(snapshot.graph.ids) == [1, 2, 3]
+    assert isinstance(snapshot.graph.ids, memoryview)
+    descr = snapshot.descriptor(1)
+    assert descr == descrs[0]._replace(parent_ids=[1], seen=0)
+    assert snapshot.get_type_counts() == {
+        ("builtins", "dict"): 2,
+        ("builtins", "list"): 1,
+    }
+    top = top_groups(snapshot, 1)
+    assert [(item.type_name, item.count, item.size_delta) for item in top] == [
+        ("dict", 2, 20)
+    ]
+
+    # 1 is freed, 3 is reused by another type, 4 is new
+    other_path = str(tmp_path / "b.snap")
+    write_snapshot(other_path, [_descr(2, []), _descr(3, []), _descr(4, [])])
+    other = Snapshot(other_path)
+    diff = {item.type_name: item for item in diff_snapshots(snapshot, other)}
+    assert (diff["dict"].new, diff["dict"].freed, diff["dict"].count_delta) == (2, 1, 1)
+    assert (diff["list"].new, diff["list"].freed, diff["list"].count_delta) == (
+        0,
+        1,
+        -1,
+    )
+    other.close()
+    snapshot.close()
+
+
+def test_file_backend(tmp_path):
+    path = str(tmp_path / "pyloot.snap")
+    backend = FileBackend(path)
+    backend.store(
+        [
+            _descr(1, [2], "builtins.module", size=100),
+            _descr(2, [3], "builtins.dict", size=20),
+            _descr(3, [4], "tests.Foo", size=3),
+            _descr(4, [], "builtins.list", size=1),
+        ]
+    )
+    seen = backend.fetch_by_id(4).seen
+    assert [d.id for d in backend.fetch_children_of(3)] == [4]
+    assert [d.id for d in backend.fetch_by_group("builtins.dict")] == [2]
+    assert backend.fetch_retained(2).retained_size == 24
+    paths = backend.fetch_paths_to_root(4)
+    assert [[descr.id for descr in path] for path in paths] == [[1, 3, 4]]
+
+    # the index of the mapped file is copied once the file is replaced
+    first = backend._index
+    assert isinstance(first.sizes, memoryview)
+    backend.store([_descr(4, [], "builtins.list", size=1)])
+    assert isinstance(first.sizes, array)
+    assert list(first.sizes) == [100, 20, 3, 1]
+    assert backend.fetch_by_id(4).seen == seen
+    assert backend.fetch_by_id(1) is None
+    assert backend.fetch_history()[0].counts == [1, 1]
+    diff = {item.type_name: item for item in backend.fetch_diff()}
+    assert (diff["dict"].count_delta, diff["dict"].size_delta) == (-1, -20)
+    backend.close()
+
+    # served read-only
+    backend = FileBackend(path, read_only=True)
+    server = PyLootServer(backend=backend, disable_response_gzip=True)
+    response = Request.blank("/api/objects/4").get_response(server)
+    assert response.json["type_name"] == "list"
+    response = Request.blank("/api/history", method="POST").get_response(server)
+    assert response.status_code == 405
+    backend.close()
+
+
+def test_cli_analyze(tmp_path, capsys):
+    path = str(tmp_path / "a.snap")
+    write_snapshot(path, [_descr(1, [2]), _descr(2, [], "builtins.list")])
+    with mock.patch.object(sys, "argv", ["pyloot", "analyze", path, "top"]):
+        cli.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1].split() == ["1", "10", "builtins.dict"]
+
+    with mock.patch.object(sys, "argv", ["pyloot", "analyze", path, "path", "2"]):
+        cli.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "path 1:"
+    assert [line.split()[0] for line in lines[1:]] == ["1", "2"]
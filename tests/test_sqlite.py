@@ -0,0 +1,141 @@
+from unittest import mock
+
+from pyloot import collector
+from pyloot import SQLiteBackend
+
+
+def _descr(_id, child_ids, group="builtins.dict", size=10):
+    type_module, type_name = group.rsplit(".", 1)
+    return collector.get_data(dict(a=1))._replace(
+        id=_id,
+        child_ids=child_ids,
+        type_module=type_module,
+        type_name=type_name,
+        size=size,
+    )
+
+
+def test_store_and_fetch(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "pyloot.db"))
+    backend.store([_descr(1, [2, 2, 99]), _descr(2, [1])])
+
+    descr = backend.fetch_by_id(1)
+    assert descr.child_ids == [2, 2, 99]
+    assert descr.parent_ids == [2]
+    assert descr.attrs == _descr(1, []).attrs
+    assert [d.id for d in backend.fetch_children_of(1)] == [2, 2]
+    assert [d.id for d in backend.fetch_parents_of(2)] == [1]
+    assert backend.fetch_by_id(99) is None
+    assert [d.id for d in backend.fetch_by_group("builtins.dict", limit=1)] == [1]
+    old_seen = descr.seen
+
+    # seen is kept for the same object, objects missing from a snapshot are dropped
+    backend.store([_descr(1, []), _descr(3, [1], group="builtins.list")])
+    assert backend.fetch_by_id(1).seen == old_seen
+    assert backend.fetch_by_id(2) is None
+    assert [d.id for d in backend.fetch()] == [1, 3]
+    backend.close()
+
+    # snapshots and history survive restarts
+    backend = SQLiteBackend(str(tmp_path / "pyloot.db"))
+    assert backend.fetch_by_id(1).parent_ids == [3]
+    history = {h.type_name: h.counts for h in backend.fetch_history()}
+    assert history == {"dict": [2, 1], "list": [0, 1]}
+    assert [h.type_name for h in backend.fetch_history(top=1)] == ["dict"]
+    backend.close()
+
+
+def test_history(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "pyloot.db"))
+    conn = backend._connect()
+    for timestamp, count in ((0, 1), (10, 3), (20, 2), (30, 5)):
+        backend._insert_counts(conn, {("builtins", "dict"): count}, timestamp)
+    conn.commit()
+
+    (history,) = backend.fetch_history(start=10, end=30)
+    assert history.counts == [3, 2, 5]
+    assert history.timestamps == [10, 20, 30]
+
+    (rollup,) = backend.fetch_history(resolution=20)
+    assert rollup.timestamps == [0, 20]
+    assert rollup.counts == [3, 5]
+    assert rollup.mins == [1, 2]
+    assert rollup.means == [2, 3.5]
+    backend.close()
+
+
+def test_history_pruning(tmp_path):
+    backend = SQLiteBackend(
+        str(tmp_path / "pyloot.db"), max_history=2, history_tiers=[(20, 2)]
+    )
+    conn = backend._connect()
+    for timestamp in range(0, 100, 5):
+        backend._insert_counts(conn, {("builtins", "dict"): timestamp}, timestamp)
+    conn.commit()
+
+    # 2 raw samples, then the last older sample of each 20s bucket of the last 40s
+    (history,) = backend.fetch_history()
+    assert history.timestamps == [55, 75, 85, 90, 95]
+    assert history.counts == [55, 75, 85, 90, 95]
+    assert conn.execute("SELECT COUNT(*) FROM history").fetchone() == (5,)
+    backend.close()
+
+
+def test_diff_after_pruning(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "pyloot.db"))
+    with mock.patch("pyloot.backends.sqlite.time.time", return_value=0):
+        backend.store([_descr(1, []), _descr(2, []), _descr(3, [])])
+    # the history sample of the first snapshot is thinned away
+    for timestamp in range(1, 401):
+        with mock.patch("pyloot.backends.sqlite.time.time", return_value=timestamp):
+            backend.store_counts({("builtins", "dict"): 3})
+    with mock.patch("pyloot.backends.sqlite.time.time", return_value=401):
+        backend.store([_descr(1, []), _descr(2, [])])
+
+    (diff,) = backend.fetch_diff()
+    assert (diff.count, diff.count_delta, diff.freed) == (2, -1, 1)
+    backend.close()
+
+
+def test_graph_queries(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "pyloot.db"))
+    backend.store(
+        [
+            _descr(1, [2], group="builtins.module", size=100),
+            _descr(2, [3], group="builtins.dict", size=20),
+            _descr(3, [4], group="tests.Foo", size=3),
+            _descr(4, [], group="builtins.list", size=1),
+        ]
+    )
+
+    retained = backend.fetch_retained(2)
+    assert retained.retained_size == 24
+    assert retained.dominator_id == 1
+    assert [r.id for r in backend.fetch_top_retainers(top=2)] == [1, 2]
+
+    paths = backend.fetch_paths_to_root(4)
+    assert [[descr.id for descr in path] for path in paths] == [[1, 3, 4]]
+
+    # the graph is reloaded after the next snapshot
+    backend.store([_descr(1, [], size=100)])
+    assert backend.fetch_retained(1).retained_size == 100
+    assert backend.fetch_retained(2) is None
+    backend.close()
+
+
+def test_fetch_diff(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "pyloot.db"), max_snapshots=2)
+    backend.store([_descr(1, []), _descr(2, []), _descr(3, [], "builtins.list")])
+    # 2 is freed, 3 is reused by a dict and 4 is new
+    backend.store([_descr(1, []), _descr(3, []), _descr(4, [])])
+
+    assert [s.described for s in backend.fetch_snapshots()] == [3, 3]
+    diff = {item.type_name: item for item in backend.fetch_diff()}
+    assert (diff["dict"].new, diff["dict"].freed, diff["dict"].count_delta) == (2, 1, 1)
+    assert diff["dict"].new_ids == [3, 4]
+    assert (diff["list"].freed, diff["list"].size_delta) == (1, -10)
+
+    backend.store([])
+    assert backend.fetch_diff(1, 2) is None
+    assert backend.fetch_diff(-2, -1)[-1].freed == 3
+    backend.close()
@@ -0,0 +1,79 @@
+import gzip
+
+import pytest
+from webob import Request
+
+from pyloot import collector
+from pyloot import InMemoryBackend
+from pyloot import PyLootServer
+from pyloot import wire
+
+
+class Foo:
+    def __init__(self):
+        self.name = "café \U0001f600"
+        self.items = [1, 2, 3]
+
+
+def _descriptors():
+    objs = [Foo(), dict(a=1), [1, 2]]
+    data = [collector.get_data(obj) for obj in objs]
+    data[0] = data[0]._replace(seen=1.5, stale=True, child_ids=[1, 2 << 40, 3])
+    data[1] = data[1]._replace(parent_ids=[id(objs[0]), id(objs[2])], lazy=True)
+    return objs, data
+
+
+def test_round_trip():
+    _, data = _descriptors()
+    type_counts = {("builtins", "dict"): 10, ("tests.test_wire", "Foo"): 1}
+    payload = wire.encode(data, type_counts)
+
+    assert wire.decode(payload) == (data, type_counts)
+    # strings are only sent once per payload
+    assert payload.count(b"builtins") == 1
+
+    records = list(wire.decode_stream([wire.encode(data[:1], None, [7, 3 << 40])]))
+    assert records == [[7, 3 << 40], data[0]]
+
+
+def test_decode_chunks():
+    _, data = _descriptors()
+    payload = wire.encode(data)
+    # a record split anywhere is decoded once complete
+    records = list(wire.decode_stream(payload[i : i + 1] for i in range(len(payload))))
+    assert records == data
+
+    with pytest.raises(wire.WireError):
+        list(wire.decode_stream([payload[:-1]]))
+    with pytest.raises(wire.WireError):
+        list(wire.decode_stream([b"{}" + payload]))
+
+
+def test_server_negotiation():
+    objs, data = _descriptors()
+    backend = InMemoryBackend()
+    server = PyLootServer(backend=backend)
+    response = Request.blank(
+        "/api/objects",
+        method="POST",
+        body=gzip.compress(wire.encode(data, {("builtins", "dict"): 10})),
+        content_type=wire.MEDIA_TYPE,
+    ).get_response(server)
+    assert response.status_code == 200
+    assert backend.fetch_history()[-1].counts == [10]
+
+    response = Request.blank(
+        "/api/objects", accept="{}, application/json;q=0.5".format(wire.MEDIA_TYPE)
+    ).get_response(server)
+    assert response.content_type == wire.MEDIA_TYPE
+    items, _ = wire.decode(gzip.decompress(response.body))
+    assert sorted(item.id for item in items) == sorted(map(id, objs))
+
+    # JSON unless the binary format is preferred
+    response = Request.blank("/api/objects", accept="*/*").get_response(server)
+    assert response.content_type == "application/json"
+
+    response = Request.blank(
+        "/api/objects", method="POST", body=b"x", content_type="text/plain"
+    ).get_response(server)
+    assert response.status_code == 415